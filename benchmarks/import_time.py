@@ -0,0 +1,67 @@
+"""
+Import time benchmark: measures the cold import time of the entry points (in fresh interpreters, with -X importtime)
+and fails if an entry point exceeds its budget or if a lazily imported provider package is imported eagerly.
+
+Run from the repository root:
+    python benchmarks/import_time.py [--runs 5] [--budget_factor 1.0]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# The import time budget of each entry point (in seconds)
+IMPORT_BUDGETS = {'simulator.utils.llm_utils': 1.5,
+                  'simulator.simulator_executor': 4,
+                  'run': 4}
+
+# Packages that should be imported only when they are used (get_llm, set_callback and the prompts hub)
+LAZY_PACKAGES = ['langchain_openai', 'langchain_anthropic', 'langchain_community.llms',
+                 'langchain_community.callbacks', 'langchain.hub']
+
+
+def measure_import(module: str) -> tuple[float, set[str]]:
+    """
+    Import a module in a fresh interpreter
+    :return: The cumulative import time (in seconds) and the imported modules
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(
+                                os.path.abspath(__file__))))
+    if result.returncode != 0:
+        raise RuntimeError(f'Failed to import {module}:\n{result.stderr[-2000:]}')
+    cumulative = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        modules.add(name)
+        if name == module:
+            cumulative = int(cumulative_us) / 1e6
+    return cumulative, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time benchmark.')
+    parser.add_argument('--runs', type=int, default=5, help='The number of measurements (the minimum is reported).')
+    parser.add_argument('--budget_factor', type=float, default=1.0, help='Scale all the budgets.')
+    args = parser.parse_args()
+
+    failures = []
+    for module, budget in IMPORT_BUDGETS.items():
+        measurements = [measure_import(module) for _ in range(args.runs)]
+        import_time = min(t for t, _ in measurements)
+        eager = [package for package in LAZY_PACKAGES if package in measurements[0][1]]
+        budget *= args.budget_factor
+        status = 'OK' if import_time <= budget and not eager else 'FAIL'
+        print(f'{status:4} {module:35} {import_time:.3f}s (budget {budget:.2f}s)'
+              + (f', eagerly imports: {", ".join(eager)}' if eager else ''))
+        if status == 'FAIL':
+            failures.append(module)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
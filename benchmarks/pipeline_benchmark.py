@@ -0,0 +1,135 @@
+"""
+End to end throughput benchmark: runs the examples (policies graph, dataset and simulation) with the local mock
+model instead of the providers, and reports the throughput, the per-stage latency and the peak memory.
+
+The hub prompts are read from the local prompt registry, prefetch them once with:
+    python -m simulator.utils.prompt_registry --config_path ./config/config_airline.yml
+Run from the repository root:
+    python benchmarks/pipeline_benchmark.py [--examples airline retail] [--num_samples 10] [--latency 0]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+from simulator.utils.file_reading import override_config
+from simulator.utils.mock_llm import register_mock_responder, messages_to_text
+
+warnings.filterwarnings("ignore", category=UserWarning, module="langsmith")
+
+EXAMPLES_CONFIGS = {'airline': 'config/config_airline.yml',
+                    'retail': 'config/config_retail.yml'}
+
+
+def set_mock_llms(config, mock_config: dict):
+    """
+    Replace all the llm configs (dicts with a 'type' and a 'name') with the mock model
+    """
+    if isinstance(config, dict):
+        for key, value in config.items():
+            if isinstance(value, dict) and 'type' in value and 'name' in value:
+                config[key] = {**mock_config, 'name': f"mock-{value['name']}"}
+            else:
+                set_mock_llms(value, mock_config)
+    elif isinstance(config, list):
+        for value in config:
+            set_mock_llms(value, mock_config)
+
+
+def register_example_responders(data_examples: dict):
+    """
+    The events generator outputs must reference the example tables: the symbolic rows are the tables examples, and
+    the executors insert the example row of their table
+    """
+    rows = dict(data_examples)  # The tables first rows (JSON strings)
+    register_mock_responder('info_symbolic', lambda messages, rng: {
+        'variables_list': [], 'enriched_scenario': 'The scenario', 'symbolic_relations': [],
+        'tables_rows': [{'table_name': table_name, 'row': row} for table_name, row in rows.items()]})
+
+    def add_row(messages, rng):
+        text = messages_to_text(messages)
+        return {'json_row': next((row for row in rows.values() if row in text), next(iter(rows.values())))}
+
+    register_mock_responder('add_row_to_table', add_row)
+
+
+def get_peak_memory_mb() -> float:
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run_example(example: str, num_samples: int, mock_config: dict) -> dict:
+    """
+    Run an example end to end
+    :return: The benchmark report of the example
+    """
+    from simulator.simulator_executor import SimulatorExecutor
+
+    config = override_config(EXAMPLES_CONFIGS[example])
+    set_mock_llms(config, mock_config)
+    config['dataset']['num_samples'] = num_samples
+    config.setdefault('llm_cache', {})['enabled'] = False  # Measure the pipeline, not the cache
+    output_path = tempfile.mkdtemp(prefix=f'benchmark_{example}_')
+    report = {'example': example}
+
+    start = time.perf_counter()
+    executor = SimulatorExecutor(config, output_path)
+    report['graph_seconds'] = time.perf_counter() - start
+    report['graph_peak_mb'] = get_peak_memory_mb()
+    register_example_responders(executor.environment.data_examples)
+
+    start = time.perf_counter()
+    executor.load_dataset('latest')
+    report['dataset_seconds'] = time.perf_counter() - start
+    report['n_events'] = len(executor.dataset_handler)
+    report['events_per_second'] = report['n_events'] / report['dataset_seconds']
+    report['dataset_peak_mb'] = get_peak_memory_mb()
+
+    start = time.perf_counter()
+    executor.run_simulation('benchmark')
+    report['simulation_seconds'] = time.perf_counter() - start
+    results_path = os.path.join(output_path, 'experiments',
+                                f'{executor.dataset_handler.dataset_name}__benchmark', 'results.csv')
+    report['n_dialogs'] = len(pd.read_csv(results_path)) if os.path.isfile(results_path) else 0
+    report['dialogs_per_second'] = report['n_dialogs'] / report['simulation_seconds']
+    report['simulation_peak_mb'] = get_peak_memory_mb()
+    report['output_path'] = output_path
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End to end pipeline benchmark with the mock model.')
+    parser.add_argument('--examples', nargs='+', default=list(EXAMPLES_CONFIGS), choices=list(EXAMPLES_CONFIGS))
+    parser.add_argument('--num_samples', type=int, default=10, help='The number of events of each example.')
+    parser.add_argument('--latency', type=float, default=0, help='The mean mock latency of a call (in seconds).')
+    parser.add_argument('--error_rate', type=float, default=0, help='The mock calls error rate.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='', help='Save the reports to a JSON file.')
+    args = parser.parse_args()
+
+    mock_config = {'type': 'mock', 'seed': args.seed,
+                   'latency': {'distribution': 'lognormal' if args.latency else 'constant', 'mean': args.latency,
+                               'std': 0.3},
+                   'errors': {'rate': args.error_rate, 'types': {'RateLimitError': 0.5, 'TimeoutError': 0.5}}}
+    reports = [run_example(example, args.num_samples, mock_config) for example in args.examples]
+    for report in reports:
+        print(f"\n{report['example']}:")
+        print(f"  policies graph: {report['graph_seconds']:.2f}s (peak {report['graph_peak_mb']:.0f}MB)")
+        print(f"  dataset:        {report['dataset_seconds']:.2f}s, {report['n_events']} events "
+              f"({report['events_per_second']:.2f} events/s, peak {report['dataset_peak_mb']:.0f}MB)")
+        print(f"  simulation:     {report['simulation_seconds']:.2f}s, {report['n_dialogs']} dialogs "
+              f"({report['dialogs_per_second']:.2f} dialogs/s, peak {report['simulation_peak_mb']:.0f}MB)")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
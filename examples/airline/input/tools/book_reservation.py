@@ -4,8 +4,7 @@ import json
 from copy import deepcopy
 from typing import Any, Dict, List
 from langchain.tools import StructuredTool
-from util import get_dict_json
-import pandas as pd
+from util import get_tool_data_context
 class BookReservation():
     @staticmethod
     def invoke(
@@ -22,15 +21,16 @@ class BookReservation():
         nonfree_baggages: int,
         insurance: str,
     ) -> str:
+        context = get_tool_data_context(data)
         if 'reservations' in data:
-            reservations = get_dict_json(data['reservations'], 'reservation_id')
+            reservations = context.table('reservations', 'reservation_id')
         else:
             reservations = {}
-        users = get_dict_json(data['users'], 'user_id')
-        data_flights = get_dict_json(data['flights'], 'flight_number')
+        users = context.table('users', 'user_id')
+        data_flights = context.table('flights', 'flight_number')
         if user_id not in users:
             return "Error: user not found"
-        user = users[user_id]
+        user = users.get(user_id)
 
         # assume each task makes at most 3 reservations
         reservation_id = "HATHAT"
@@ -61,7 +61,7 @@ class BookReservation():
             flight_number = flight["flight_number"]
             if flight_number not in data_flights:
                 return f"Error: flight {flight_number} not found"
-            flight_data = data_flights[flight_number]
+            flight_data = data_flights.rows[flight_number]
             if flight["date"] not in flight_data["dates"]:
                 return (
                     f"Error: flight {flight_number} not found on date {flight['date']}"
@@ -105,13 +105,9 @@ class BookReservation():
                 del user["payment_methods"][payment_id]
 
 
-        if not 'reservations' in data:
-            data['reservations'] = pd.DataFrame([reservation])
-        else:
-            data['reservations'].loc[len(reservations)] = reservation
-        reservations[reservation_id] = reservation
+        context.insert('reservations', 'reservation_id', reservation)
         user["reservations"].append(reservation_id)
-        data['users'].loc[data['users']['user_id'] == user['user_id'], 'reservations'] = str(user["reservations"])
+        users.update(user, columns=['reservations'])
         return json.dumps(reservation)
 
     @staticmethod
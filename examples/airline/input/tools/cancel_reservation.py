@@ -3,7 +3,7 @@
 import json
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 class CancelReservation():
     @staticmethod
     def invoke(
@@ -12,10 +12,10 @@ class CancelReservation():
     ) -> str:
         if 'reservations' not in data:
             return "Error: reservation not found, if you just created the reservation it might take a few minutes to be available."
-        reservations = get_dict_json(data['reservations'], 'reservation_id')
+        reservations = get_tool_data_context(data).table('reservations', 'reservation_id')
         if reservation_id not in reservations:
             return "Error: reservation not found"
-        reservation = reservations[reservation_id]
+        reservation = reservations.get(reservation_id)
 
         # reverse the payment
         refunds = []
@@ -28,7 +28,7 @@ class CancelReservation():
             )
         reservation["payment_history"].extend(refunds)
         reservation["status"] = "cancelled"
-        update_df(data['reservations'], reservation, 'reservation_id')
+        reservations.update(reservation)
         return json.dumps(reservation)
 
     @staticmethod
@@ -2,7 +2,7 @@
 from langchain.tools import StructuredTool
 import json
 from typing import Any, Dict
-from util import get_dict_json
+from util import get_tool_data_context
 
 
 class GetReservationDetails():
@@ -11,9 +11,9 @@ class GetReservationDetails():
         if 'reservations' not in data:
             return "Error: reservation not found, if you just created the resevation" \
                    " it might take a few minutes to be available."
-        reservations = get_dict_json(data['reservations'], 'reservation_id')
+        reservations = get_tool_data_context(data).table('reservations', 'reservation_id')
         if reservation_id in reservations:
-            return json.dumps(reservations[reservation_id])
+            return json.dumps(reservations.rows[reservation_id])
         return "Error: reservation not found, if you just created the reservation" \
                " it might take a few minutes to be available."
 
@@ -2,14 +2,14 @@
 from langchain.tools import StructuredTool
 import json
 from typing import Any, Dict
-from util import get_dict_json
+from util import get_tool_data_context
 
 class GetUserDetails():
     @staticmethod
     def invoke(data: Dict[str, Any], user_id: str) -> str:
-        users = get_dict_json(data['users'], 'user_id')
+        users = get_tool_data_context(data).table('users', 'user_id')
         if user_id in users:
-            return json.dumps(users[user_id])
+            return json.dumps(users.rows[user_id])
         return "Error: user not found"
 
     @staticmethod
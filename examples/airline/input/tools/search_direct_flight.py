@@ -1,29 +1,31 @@
 # Copyright Sierra
 
 import json
+from copy import deepcopy
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 class SearchDirectFlight():
     @staticmethod
     def invoke(data: Dict[str, Any], origin: str, destination: str, date: str) -> str:
-        flights = get_dict_json(data['flights'], 'flight_number')
+        flights = get_tool_data_context(data).table('flights', 'flight_number')
+        flights.add_index('route', lambda f: (f["origin"], f["destination"]))
         results = []
         results_backup = []
         backup_flights = []
-        for flight in flights.values():
-            if flight["origin"] == origin and flight["destination"] == destination:
-                if date not in flight['dates']:
-                    flight['dates'][date] = {'status': 'available', 'available_seats': {'basic_economy': 20, 'economy': 15, 'business': 10}, 'prices': {'basic_economy': 99, 'economy': 150, 'business': 500}}
-                    results_backup.append({k: v for k, v in flight.items() if k != "dates"})
-                    results_backup[-1].update(flight['dates'][date])
-                    backup_flights.append(flight)
-                elif flight['dates'][date]['status'] == 'available':
-                    results.append({k: v for k, v in flight.items() if k != "dates"})
-                    results[-1].update(flight['dates'][date])
+        for flight in flights.lookup('route', (origin, destination)):
+            if date not in flight['dates']:
+                flight = deepcopy(flight)
+                flight['dates'][date] = {'status': 'available', 'available_seats': {'basic_economy': 20, 'economy': 15, 'business': 10}, 'prices': {'basic_economy': 99, 'economy': 150, 'business': 500}}
+                results_backup.append({k: v for k, v in flight.items() if k != "dates"})
+                results_backup[-1].update(flight['dates'][date])
+                backup_flights.append(flight)
+            elif flight['dates'][date]['status'] == 'available':
+                results.append({k: v for k, v in flight.items() if k != "dates"})
+                results[-1].update(flight['dates'][date])
         if not results:
             for flight in backup_flights:
-                update_df(data['flights'], flight, 'flight_number')
+                flights.update(flight)
             return json.dumps(results_backup)
         return json.dumps(results)
 
@@ -3,45 +3,42 @@
 import json
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json
+from util import get_tool_data_context
 class SearchOnestopFlight():
     @staticmethod
     def invoke(data: Dict[str, Any], origin: str, destination: str, date: str) -> str:
-        flights = get_dict_json(data['flights'], 'flight_number')
+        flights = get_tool_data_context(data).table('flights', 'flight_number')
+        flights.add_index('origin', lambda f: f["origin"])
+        flights.add_index('route', lambda f: (f["origin"], f["destination"]))
         results = []
-        for flight1 in flights.values():
-            if flight1["origin"] == origin:
-                for flight2 in flights.values():
+        for flight1 in flights.lookup('origin', origin):
+            for flight2 in flights.lookup('route', (flight1["destination"], destination)):
+                date2 = (
+                    f"2024-05-{int(date[-2:])+1}"
+                    if "+1" in flight1["scheduled_arrival_time_est"]
+                    else date
+                )
+                if (
+                    flight1["scheduled_arrival_time_est"]
+                    > flight2["scheduled_departure_time_est"]
+                ):
+                    continue
+                if date in flight1["dates"] and date2 in flight2["dates"]:
                     if (
-                        flight2["destination"] == destination
-                        and flight1["destination"] == flight2["origin"]
+                        flight1["dates"][date]["status"] == "available"
+                        and flight2["dates"][date2]["status"] == "available"
                     ):
-                        date2 = (
-                            f"2024-05-{int(date[-2:])+1}"
-                            if "+1" in flight1["scheduled_arrival_time_est"]
-                            else date
-                        )
-                        if (
-                            flight1["scheduled_arrival_time_est"]
-                            > flight2["scheduled_departure_time_est"]
-                        ):
-                            continue
-                        if date in flight1["dates"] and date2 in flight2["dates"]:
-                            if (
-                                flight1["dates"][date]["status"] == "available"
-                                and flight2["dates"][date2]["status"] == "available"
-                            ):
-                                result1 = {
-                                    k: v for k, v in flight1.items() if k != "dates"
-                                }
-                                result1.update(flight1["dates"][date])
-                                result1["date"] = date
-                                result2 = {
-                                    k: v for k, v in flight2.items() if k != "dates"
-                                }
-                                result2.update(flight2["dates"][date])
-                                result2["date"] = date2
-                                results.append([result1, result2])
+                        result1 = {
+                            k: v for k, v in flight1.items() if k != "dates"
+                        }
+                        result1.update(flight1["dates"][date])
+                        result1["date"] = date
+                        result2 = {
+                            k: v for k, v in flight2.items() if k != "dates"
+                        }
+                        result2.update(flight2["dates"][date])
+                        result2["date"] = date2
+                        results.append([result1, result2])
         return json.dumps(results)
 
     @staticmethod
@@ -1,8 +1,7 @@
 # Copyright Sierra
-import json
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json
+from util import get_tool_data_context
 class SendCertificate():
     @staticmethod
     def invoke(
@@ -10,10 +9,10 @@ class SendCertificate():
         user_id: str,
         amount: int,
     ) -> str:
-        users = get_dict_json(data['users'], 'user_id')
+        users = get_tool_data_context(data).table('users', 'user_id')
         if user_id not in users:
             return "Error: user not found"
-        user = users[user_id]
+        user = users.get(user_id)
 
         # add a certificate, assume at most 3 cases per task
         for id in [3221322, 3221323, 3221324]:
@@ -24,8 +23,7 @@ class SendCertificate():
                     "amount": amount,
                     "id": payment_id,
                 }
-                payment_str = json.dumps(user["payment_methods"])
-                data['users'].loc[data['users']['user_id'] == user['user_id'], 'payment_methods'] = payment_str
+                users.update(user, columns=['payment_methods'])
                 return f"Certificate {payment_id} added to user {user_id} with amount {amount}."
 
     @staticmethod
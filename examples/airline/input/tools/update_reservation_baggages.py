@@ -3,7 +3,7 @@
 import json
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 class UpdateReservationBaggages():
     @staticmethod
     def invoke(
@@ -16,16 +16,18 @@ class UpdateReservationBaggages():
         if 'reservations' not in data:
             return "Error: reservation not found, if you just created the reservation" \
                    " it might take a few minutes to be available."
-        reservations = get_dict_json(data['reservations'], 'reservation_id')
-        users = get_dict_json(data['users'], 'user_id')
+        context = get_tool_data_context(data)
+        reservations = context.table('reservations', 'reservation_id')
+        users = context.table('users', 'user_id')
         if reservation_id not in reservations:
             return "Error: reservation not found"
-        reservation = reservations[reservation_id]
+        reservation = reservations.get(reservation_id)
 
         total_price = 50 * max(0, nonfree_baggages - reservation["nonfree_baggages"])
-        if payment_id not in users[reservation["user_id"]]["payment_methods"]:
+        user = users.get(reservation["user_id"])
+        if payment_id not in user["payment_methods"]:
             return "Error: payment method not found"
-        payment_method = users[reservation["user_id"]]["payment_methods"][payment_id]
+        payment_method = user["payment_methods"][payment_id]
         if payment_method["source"] == "certificate":
             return "Error: certificate cannot be used to update reservation"
         elif (
@@ -46,7 +48,7 @@ class UpdateReservationBaggages():
                     "amount": total_price,
                 }
             )
-        update_df(data['reservations'], reservation, 'reservation_id')
+        reservations.update(reservation)
         return json.dumps(reservation)
 
     @staticmethod
@@ -4,7 +4,7 @@ import json
 from copy import deepcopy
 from typing import Any, Dict, List
 from langchain.tools import StructuredTool
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 class UpdateReservationFlights():
     @staticmethod
     def invoke(
@@ -16,12 +16,13 @@ class UpdateReservationFlights():
     ) -> str:
         if 'reservations' not in data:
             return "Error: reservation not found, if you just created the reservation it might take a few minutes to be available."
-        reservations = get_dict_json(data['reservations'], 'reservation_id')
-        users = get_dict_json(data['users'], 'user_id')
-        data_flights = get_dict_json(data['flights'], 'flight_number')
+        context = get_tool_data_context(data)
+        reservations = context.table('reservations', 'reservation_id')
+        users = context.table('users', 'user_id')
+        data_flights = context.table('flights', 'flight_number')
         if reservation_id not in reservations:
             return "Error: reservation not found"
-        reservation = reservations[reservation_id]
+        reservation = reservations.get(reservation_id)
 
         # update flights and calculate price
         total_price = 0
@@ -43,7 +44,7 @@ class UpdateReservationFlights():
             flight_number = flight["flight_number"]
             if flight_number not in data_flights:
                 return f"Error: flight {flight_number} not found"
-            flight_data = data_flights[flight_number]
+            flight_data = data_flights.rows[flight_number]
             if flight["date"] not in flight_data["dates"]:
                 return (
                     f"Error: flight {flight_number} not found on date {flight['date']}"
@@ -65,9 +66,10 @@ class UpdateReservationFlights():
         )
 
         # check payment
-        if payment_id not in users[reservation["user_id"]]["payment_methods"]:
+        user = users.get(reservation["user_id"])
+        if payment_id not in user["payment_methods"]:
             return "Error: payment method not found"
-        payment_method = users[reservation["user_id"]]["payment_methods"][payment_id]
+        payment_method = user["payment_methods"][payment_id]
         if payment_method["source"] == "certificate":
             return "Error: certificate cannot be used to update reservation"
         elif (
@@ -87,7 +89,7 @@ class UpdateReservationFlights():
                     "amount": total_price,
                 }
             )
-        update_df(data['reservations'], reservation, 'reservation_id')
+        reservations.update(reservation)
         # do not make flight database update here, assume it takes time to be updated
         return json.dumps(reservation)
 
@@ -3,7 +3,7 @@
 import json
 from typing import Any, Dict, List
 from langchain.tools import StructuredTool
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 class UpdateReservationPassengers():
     @staticmethod
     def invoke(
@@ -14,14 +14,14 @@ class UpdateReservationPassengers():
         if 'reservations' not in data:
             return "Error: reservation not found, if you just created the resevation" \
                    " it might take a few minutes to be available."
-        reservations = get_dict_json(data['reservations'], 'reservation_id')
+        reservations = get_tool_data_context(data).table('reservations', 'reservation_id')
         if reservation_id not in reservations:
             return "Error: reservation not found"
-        reservation = reservations[reservation_id]
+        reservation = reservations.get(reservation_id)
         if len(passengers) != len(reservation["passengers"]):
             return "Error: number of passengers does not match"
         reservation['passengers'] = passengers
-        update_df(data['reservations'], reservation, 'reservation_id')
+        reservations.update(reservation)
         return json.dumps(reservation)
 
     @staticmethod
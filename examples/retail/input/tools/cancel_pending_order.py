@@ -3,18 +3,19 @@
 from typing import Any, Dict
 from langchain.tools import StructuredTool
 import json
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 
 
 class CancelPendingOrder():
     @staticmethod
     def invoke(data: Dict[str, Any], order_id: str, reason: str) -> str:
         # check order exists and is pending
-        orders = get_dict_json(data['orders'], 'order_id')
-        users = get_dict_json(data['users'], 'user_id')
+        context = get_tool_data_context(data)
+        orders = context.table('orders', 'order_id')
+        users = context.table('users', 'user_id')
         if order_id not in orders:
             return "Error: order not found"
-        order = orders[order_id]
+        order = orders.get(order_id)
         if order["status"].lower() != "pending":
             return "Error: non-pending order cannot be cancelled"
 
@@ -23,6 +24,7 @@ class CancelPendingOrder():
             return "Error: invalid reason"
 
         # handle refund
+        user = users.get(order["user_id"])
         refunds = []
         for payment in order["payment_history"]:
             payment_id = payment["payment_method_id"]
@@ -33,15 +35,13 @@ class CancelPendingOrder():
             }
             refunds.append(refund)
             if "gift_card" in payment_id:  # refund to gift card immediately
-                if payment_id not in users[order["user_id"]]["payment_methods"].keys():
-                    users[order["user_id"]]["payment_methods"][payment_id] = {'source': 'gift_card',
-                                                                              'brand': 'gift',
-                                                                              'last_four': 4829,
-                                                                              'id': payment_id,
-                                                                              'balance': 30}
-                payment_method = users[order["user_id"]]["payment_methods"][
-                    payment_id
-                ]
+                if payment_id not in user["payment_methods"].keys():
+                    user["payment_methods"][payment_id] = {'source': 'gift_card',
+                                                           'brand': 'gift',
+                                                           'last_four': 4829,
+                                                           'id': payment_id,
+                                                           'balance': 30}
+                payment_method = user["payment_methods"][payment_id]
                 if 'balance' not in payment_method.keys():
                     payment_method['balance'] = 30
                 payment_method["balance"] += payment["amount"]
@@ -51,8 +51,8 @@ class CancelPendingOrder():
         order["status"] = "cancelled"
         order["cancel_reason"] = reason
         order["payment_history"].extend(refunds)
-        update_df(data['orders'], order, 'order_id')
-        update_df(data['users'], users[order["user_id"]], 'user_id')
+        orders.update(order)
+        users.update(user)
 
         return json.dumps(order)
 
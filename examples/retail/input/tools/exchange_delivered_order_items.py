@@ -2,7 +2,7 @@
 import json
 from typing import Any, Dict, List
 from langchain.tools import StructuredTool
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 
 class ExchangeDeliveredOrderItems():
     @staticmethod
@@ -13,14 +13,15 @@ class ExchangeDeliveredOrderItems():
         new_item_ids: List[str],
         payment_method_id: str,
     ) -> str:
-        orders = get_dict_json(data['orders'], 'order_id')
-        users = get_dict_json(data['users'], 'user_id')
-        products = get_dict_json(data['products'], 'product_id')
+        context = get_tool_data_context(data)
+        orders = context.table('orders', 'order_id')
+        users = context.table('users', 'user_id')
+        products = context.table('products', 'product_id')
 
         # check order exists and is delivered
         if order_id not in orders:
             return "Error: order not found"
-        order = orders[order_id]
+        order = orders.get(order_id)
         if order["status"].lower() != "delivered":
             return "Error: non-delivered order cannot be exchanged"
 
@@ -39,22 +40,23 @@ class ExchangeDeliveredOrderItems():
             item = [item for item in order["items"] if item["item_id"] == item_id][0]
             product_id = item["product_id"]
             if not (
-                new_item_id in products[product_id]["variants"]
-                and products[product_id]["variants"][new_item_id]["available"]
+                new_item_id in products.rows[product_id]["variants"]
+                and products.rows[product_id]["variants"][new_item_id]["available"]
             ):
                 return f"Error: new item {new_item_id} not found or available"
 
             old_price = item["price"]
-            new_price = products[product_id]["variants"][new_item_id]["price"]
+            new_price = products.rows[product_id]["variants"][new_item_id]["price"]
             diff_price += new_price - old_price
 
         diff_price = round(diff_price, 2)
 
         # check payment method exists and can cover the price difference if gift card
-        if payment_method_id not in users[order["user_id"]]["payment_methods"]:
+        user = users.get(order["user_id"])
+        if payment_method_id not in user["payment_methods"]:
             return "Error: payment method not found"
 
-        payment_method = users[order["user_id"]]["payment_methods"][payment_method_id]
+        payment_method = user["payment_methods"][payment_method_id]
         if payment_method["source"] == "gift_card":
             if 'balance' not in payment_method.keys():
                 payment_method['balance'] = 50 # should be moved to the validator
@@ -72,7 +74,7 @@ class ExchangeDeliveredOrderItems():
         order["exchange_new_items"] = sorted(new_item_ids)
         order["exchange_payment_method_id"] = payment_method_id
         order["exchange_price_difference"] = diff_price
-        update_df(data['orders'], order, 'order_id')
+        orders.update(order)
         return json.dumps(order)
 
     @staticmethod
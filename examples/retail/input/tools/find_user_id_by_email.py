@@ -2,16 +2,23 @@
 
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json
+from util import get_tool_data_context
+
+
+def get_email_key(profile):
+    try:
+        return profile["email"].lower()
+    except (KeyError, TypeError, AttributeError):
+        return None
 
 
 class FindUserIdByEmail():
     @staticmethod
     def invoke(data: Dict[str, Any], email: str) -> str:
-        users = get_dict_json(data['users'], 'user_id')
-        for user_id, profile in users.items():
-            if profile["email"].lower() == email.lower():
-                return user_id
+        users = get_tool_data_context(data).table('users', 'user_id')
+        users.add_index('email', get_email_key)
+        for profile in users.lookup('email', email.lower()):
+            return profile["user_id"]
         return "Error: user not found"
 
     @staticmethod
@@ -2,19 +2,23 @@
 
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json
+from util import get_tool_data_context
+
+def get_name_zip_key(profile):
+    try:
+        return (profile["name"]["first_name"].lower(), profile["name"]["last_name"].lower(),
+                str(profile["address"]["zip"]))
+    except (KeyError, TypeError, AttributeError):
+        return None
+
 
 class FindUserIdByNameZip():
     @staticmethod
     def invoke(data: Dict[str, Any], first_name: str, last_name: str, zip: str) -> str:
-        users = get_dict_json(data['users'], 'user_id')
-        for user_id, profile in users.items():
-            if (
-                profile["name"]["first_name"].lower() == first_name.lower()
-                and profile["name"]["last_name"].lower() == last_name.lower()
-                and str(profile["address"]["zip"]) == str(zip)
-            ):
-                return user_id
+        users = get_tool_data_context(data).table('users', 'user_id')
+        users.add_index('name_zip', get_name_zip_key)
+        for profile in users.lookup('name_zip', (first_name.lower(), last_name.lower(), str(zip))):
+            return profile["user_id"]
         return "Error: user not found"
 
     @staticmethod
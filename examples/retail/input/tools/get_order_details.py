@@ -2,15 +2,15 @@
 import json
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json
+from util import get_tool_data_context
 
 
 class GetOrderDetails():
     @staticmethod
     def invoke(data: Dict[str, Any], order_id: str) -> str:
-        orders = get_dict_json(data['orders'], 'order_id')
+        orders = get_tool_data_context(data).table('orders', 'order_id')
         if order_id in orders:
-            return json.dumps(orders[order_id])
+            return json.dumps(orders.rows[order_id])
         return "Error: order not found"
 
     @staticmethod
@@ -2,14 +2,14 @@
 import json
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json
+from util import get_tool_data_context
 
 class GetProductDetails():
     @staticmethod
     def invoke(data: Dict[str, Any], product_id: str) -> str:
-        products = get_dict_json(data['products'], 'product_id')
+        products = get_tool_data_context(data).table('products', 'product_id')
         if product_id in products:
-            return json.dumps(products[product_id])
+            return json.dumps(products.rows[product_id])
         return "Error: product not found"
 
     @staticmethod
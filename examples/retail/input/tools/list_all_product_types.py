@@ -2,11 +2,11 @@
 import json
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json
+from util import get_tool_data_context
 class ListAllProductTypes():
     @staticmethod
     def invoke(data: Dict[str, Any]) -> str:
-        products = get_dict_json(data['products'], 'product_id')
+        products = get_tool_data_context(data).table('products', 'product_id')
         product_dict = {
             product["name"]: product["product_id"] for product in products.values()
         }
@@ -2,7 +2,7 @@
 import json
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 
 class ModifyPendingOrderAddress():
     @staticmethod
@@ -17,10 +17,10 @@ class ModifyPendingOrderAddress():
         zip: str,
     ) -> str:
         # Check if the order exists and is pending
-        orders = get_dict_json(data['orders'], 'order_id')
+        orders = get_tool_data_context(data).table('orders', 'order_id')
         if order_id not in orders:
             return "Error: order not found"
-        order = orders[order_id]
+        order = orders.get(order_id)
         if order["status"].lower() != "pending":
             return "Error: non-pending order cannot be modified"
 
@@ -33,7 +33,7 @@ class ModifyPendingOrderAddress():
             "country": country,
             "zip": zip,
         }
-        update_df(data['orders'], order, 'order_id')
+        orders.update(order)
         return json.dumps(order)
 
     @staticmethod
@@ -2,7 +2,7 @@
 import json
 from typing import Any, Dict, List
 from langchain.tools import StructuredTool
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 
 class ModifyPendingOrderItems():
     @staticmethod
@@ -13,14 +13,15 @@ class ModifyPendingOrderItems():
         new_item_ids: List[str],
         payment_method_id: str,
     ) -> str:
-        orders = get_dict_json(data['orders'], 'order_id')
-        users = get_dict_json(data['users'], 'user_id')
-        products = get_dict_json(data['products'], 'product_id')
+        context = get_tool_data_context(data)
+        orders = context.table('orders', 'order_id')
+        users = context.table('users', 'user_id')
+        products = context.table('products', 'product_id')
 
         # Check if the order exists and is pending
         if order_id not in orders:
             return "Error: order not found"
-        order = orders[order_id]
+        order = orders.get(order_id)
         if order["status"].lower() != "pending":
             return "Error: non-pending order cannot be modified"
 
@@ -41,22 +42,23 @@ class ModifyPendingOrderItems():
             item = [item for item in order["items"] if item["item_id"] == item_id][0]
             product_id = item["product_id"]
             if not (
-                new_item_id in products[product_id]["variants"]
-                and products[product_id]["variants"][new_item_id]["available"]
+                new_item_id in products.rows[product_id]["variants"]
+                and products.rows[product_id]["variants"][new_item_id]["available"]
             ):
                 return f"Error: new item {new_item_id} not found or available"
             if 'price' not in item.keys():
                 item['price'] = 50
             old_price = item["price"]
-            new_price = products[product_id]["variants"][new_item_id]["price"]
+            new_price = products.rows[product_id]["variants"][new_item_id]["price"]
             diff_price += new_price - old_price
 
         # Check if the payment method exists
-        if payment_method_id not in users[order["user_id"]]["payment_methods"]:
+        user = users.get(order["user_id"])
+        if payment_method_id not in user["payment_methods"]:
             return "Error: payment method not found"
 
         # If the new item is more expensive, check if the gift card has enough balance
-        payment_method = users[order["user_id"]]["payment_methods"][payment_method_id]
+        payment_method = user["payment_methods"][payment_method_id]
         if payment_method["source"] == "gift_card" and 'balance' not in payment_method.keys():
             payment_method['balance'] = 30
         if (
@@ -81,14 +83,14 @@ class ModifyPendingOrderItems():
         for item_id, new_item_id in zip(item_ids, new_item_ids):
             item = [item for item in order["items"] if item["item_id"] == item_id][0]
             item["item_id"] = new_item_id
-            item["price"] = products[item["product_id"]]["variants"][new_item_id][
+            item["price"] = products.rows[item["product_id"]]["variants"][new_item_id][
                 "price"
             ]
-            item["options"] = products[item["product_id"]]["variants"][new_item_id][
+            item["options"] = products.rows[item["product_id"]]["variants"][new_item_id][
                 "options"
             ]
         order["status"] = "pending (item modified)"
-        update_df(data['orders'], order, 'order_id')
+        orders.update(order)
 
         return json.dumps(order)
 
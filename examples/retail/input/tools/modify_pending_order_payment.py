@@ -2,7 +2,7 @@
 import json
 from typing import Any, Dict
 from langchain.tools import StructuredTool
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 
 
 class ModifyPendingOrderPayment():
@@ -12,13 +12,14 @@ class ModifyPendingOrderPayment():
         order_id: str,
         payment_method_id: str,
     ) -> str:
-        orders = get_dict_json(data['orders'], 'order_id')
-        users = get_dict_json(data['users'], 'user_id')
+        context = get_tool_data_context(data)
+        orders = context.table('orders', 'order_id')
+        users = context.table('users', 'user_id')
         # Check if the order exists and is pending
         if order_id not in orders:
             return "Error: order not found"
-        order = orders[order_id]
-        user = users[order["user_id"]]
+        order = orders.get(order_id)
+        user = users.get(order["user_id"])
         if order["status"].lower() != "pending":
             return "Error: non-pending order cannot be modified"
 
@@ -91,7 +92,7 @@ class ModifyPendingOrderPayment():
                 old_payment_method["balance"] = round(old_payment_method["balance"], 2)
             except:
                 pass
-        update_df(data['orders'], order, 'order_id')
+        orders.update(order)
         return json.dumps(order)
 
     @staticmethod
@@ -3,7 +3,7 @@
 from typing import Any, Dict
 from langchain.tools import StructuredTool
 import json
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 
 class ModifyUserAddress():
     @staticmethod
@@ -18,10 +18,10 @@ class ModifyUserAddress():
         zip: str,
     ) -> str:
 
-        users = get_dict_json(data['users'], 'user_id')
+        users = get_tool_data_context(data).table('users', 'user_id')
         if user_id not in users:
             return "Error: user not found"
-        user = users[user_id]
+        user = users.get(user_id)
         user["address"] = {
             "address1": address1,
             "address2": address2,
@@ -30,7 +30,7 @@ class ModifyUserAddress():
             "country": country,
             "zip": zip,
         }
-        update_df(data['users'], user, 'user_id')
+        users.update(user)
         return json.dumps(user)
 
     @staticmethod
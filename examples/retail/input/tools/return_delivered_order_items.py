@@ -2,24 +2,25 @@
 import json
 from typing import Any, Dict, List
 from langchain.tools import StructuredTool
-from util import get_dict_json, update_df
+from util import get_tool_data_context
 
 class ReturnDeliveredOrderItems():
     @staticmethod
     def invoke(
         data: Dict[str, Any], order_id: str, item_ids: List[str], payment_method_id: str
     ) -> str:
-        orders = get_dict_json(data['orders'], 'order_id')
-        users = get_dict_json(data['users'], 'user_id')
+        context = get_tool_data_context(data)
+        orders = context.table('orders', 'order_id')
+        users = context.table('users', 'user_id')
         # Check if the order exists and is delivered
         if order_id not in orders:
             return "Error: order not found"
-        order = orders[order_id]
+        order = orders.get(order_id)
         if order["status"].lower() != "delivered":
             return "Error: non-delivered order cannot be returned"
 
         # Check if the payment method exists and is either the original payment method or a gift card
-        if payment_method_id not in users[order["user_id"]]["payment_methods"]:
+        if payment_method_id not in users.rows[order["user_id"]]["payment_methods"]:
             return "Error: payment method not found"
         if (
             "gift_card" not in payment_method_id
@@ -37,7 +38,7 @@ class ReturnDeliveredOrderItems():
         order["status"] = "return requested"
         order["return_items"] = sorted(item_ids)
         order["return_payment_method_id"] = payment_method_id
-        update_df(data['orders'], order, 'order_id')
+        orders.update(order)
         return json.dumps(order)
 
     @staticmethod
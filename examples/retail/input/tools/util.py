@@ -2,6 +2,9 @@ import ast
 import random
 import string
 import json
+import threading
+from copy import deepcopy
+import pandas as pd
 
 
 def convert_json_strings(input_dict):
@@ -90,3 +93,141 @@ def update_df(df, row, index_key):
             if isinstance(value, dict) or isinstance(value, list):
                 value = json.dumps(value)  # Convert dictionaries or lists to JSON strings
             df.loc[df[index_key] == row[index_key], key] = value
+
+
+class TableIndex:
+    """
+    A table that is parsed once (see get_dict_json) and indexed by its primary key, with optional secondary
+    indexes. The mutations should go through the index, so both the index and the backing DataFrame are updated.
+    """
+
+    def __init__(self, df, index_column):
+        self.df = df
+        self.index_column = index_column
+        self.n_rows = len(df)
+        self.rows = get_dict_json(df, index_column)
+        self.secondary = {}  # name -> (key function, {key: [primary keys]})
+
+    def is_valid(self, df):
+        # The DataFrame was not replaced, and no rows were added outside the index
+        return df is self.df and len(df) == self.n_rows
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def get(self, key, default=None):
+        """
+        Get a copy of a row (the tools may modify the row before all the checks pass)
+        """
+        if key not in self.rows:
+            return default
+        return deepcopy(self.rows[key])
+
+    def values(self):
+        """
+        The parsed rows, they should not be modified
+        """
+        return self.rows.values()
+
+    def add_index(self, name, key_function):
+        """
+        Add a secondary index
+        :param name: The index name
+        :param key_function: A function from a row to its key in the index
+        """
+        if name in self.secondary:
+            return
+        index = {}
+        for primary_key, row in self.rows.items():
+            index.setdefault(key_function(row), []).append(primary_key)
+        self.secondary[name] = (key_function, index)
+
+    def lookup(self, name, key):
+        """
+        Get the rows with the key in the secondary index (the parsed rows, they should not be modified)
+        """
+        return [self.rows[primary_key] for primary_key in self.secondary[name][1].get(key, [])]
+
+    def reindex(self, primary_key, old_row, new_row):
+        for key_function, index in self.secondary.values():
+            if old_row is not None:
+                old_keys = index.get(key_function(old_row), [])
+                if primary_key in old_keys:
+                    old_keys.remove(primary_key)
+            index.setdefault(key_function(new_row), []).append(primary_key)
+
+    def update(self, row, columns=None):
+        """
+        Update a row in the index and in the DataFrame
+        :param row: The updated row
+        :param columns: The columns to update (default: all the row columns)
+        """
+        primary_key = row[self.index_column]
+        if columns is not None:
+            row = {self.index_column: primary_key, **{c: row[c] for c in columns}}
+        update_df(self.df, row, self.index_column)
+        old_row = self.rows.get(primary_key)
+        new_row = {**old_row, **deepcopy(row)} if old_row is not None else deepcopy(row)
+        self.rows[primary_key] = new_row
+        self.reindex(primary_key, old_row, new_row)
+
+    def insert(self, row):
+        """
+        Add a row to the index and to the DataFrame
+        """
+        self.df.loc[len(self.df)] = row
+        self.n_rows = len(self.df)
+        self.rows[row[self.index_column]] = deepcopy(row)
+        self.reindex(row[self.index_column], None, self.rows[row[self.index_column]])
+
+
+class ToolDataContext:
+    """
+    The parsed and indexed tables of an event database, shared by all the tool calls of a dialog
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.tables = {}
+
+    def table(self, table_name, index_column):
+        """
+        Get the table index (it is rebuilt only if the DataFrame was replaced or modified outside the index)
+        """
+        index = self.tables.get(table_name)
+        if index is None or not index.is_valid(self.data[table_name]):
+            index = TableIndex(self.data[table_name], index_column)
+            self.tables[table_name] = index
+        return index
+
+    def insert(self, table_name, index_column, row):
+        """
+        Add a row to a table, the table is created if it does not exist
+        """
+        if table_name not in self.data:
+            self.data[table_name] = pd.DataFrame([row])
+            return
+        self.table(table_name, index_column).insert(row)
+
+
+# Guards the creation of the tool data context of a dialog
+contexts_lock = threading.Lock()
+
+
+def get_tool_data_context(data) -> ToolDataContext:
+    """
+    Get the tool data context of the dialog data (the event database). The context is attached to the data, so it
+    is released with the dialog; data that does not accept attributes (a plain dict) gets a new context
+    """
+    context = getattr(data, 'tool_context', None)
+    if context is not None:
+        return context
+    with contexts_lock:
+        context = getattr(data, 'tool_context', None)
+        if context is None:
+            context = ToolDataContext(data)
+            try:
+                data.tool_context = context
+            except AttributeError:
+                pass
+        return context
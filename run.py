@@ -23,10 +23,14 @@ def main():
     config = override_config(args.config_path)
     # loading the simulator executor with the environment
     executor = SimulatorExecutor(config, args.output_path)
-    # Loading the dataset default is latest, if you want to load a specific dataset, pass the path
-    executor.load_dataset(args.dataset)
-    # Run the simulation on the dataset
-    executor.run_simulation(args.experiment)
+    if config['dialog_manager'].get('overlapped', False):
+        # Generating the dataset and running the simulation on the events as soon as they are generated
+        executor.run_overlapped(args.dataset, args.experiment)
+    else:
+        # Loading the dataset default is latest, if you want to load a specific dataset, pass the path
+        executor.load_dataset(args.dataset)
+        # Run the simulation on the dataset
+        executor.run_simulation(args.experiment)
     print("Processing complete.")
 
 
@@ -5,11 +5,10 @@ from typing import Annotated
 from langgraph.graph import StateGraph, START
 from typing_extensions import TypedDict
 from typing import Optional
-import time
 from langgraph.graph.message import add_messages
 from langchain_core.messages.base import BaseMessage
 from langchain_core.messages import HumanMessage, AIMessage
-from simulator.utils.llm_utils import convert_messages_to_str
+from simulator.utils.llm_utils import convert_messages_to_str, get_message_text
 import json
 
 
@@ -113,9 +112,11 @@ class Dialog:
                         all_tool_calls[message.tool_call_id]['output'] = message.content
                 for v in all_tool_calls.values():
                     self.memory.insert_tool(state['thread_id'], v['name'], json.dumps(v['args']), v['output'])
-                    time.sleep(0.001)
-                # inserting the chatbot messages into memory
-                self.memory.insert_dialog(state['thread_id'], 'AI', response['messages'][-1].content)
+                # inserting the chatbot messages into memory (the text of all the chatbot messages of the turn, as in
+                # convert_messages_to_str)
+                for message in response['messages'][last_human_message + 1:]:
+                    if message.type == 'ai' and get_message_text(message):
+                        self.memory.insert_dialog(state['thread_id'], 'AI', get_message_text(message))
             return {"chatbot_messages": response['messages'][last_human_message+1:],
                     'user_messages': [HumanMessage(content=response['messages'][-1].content)]}
 
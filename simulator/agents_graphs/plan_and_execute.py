@@ -5,7 +5,6 @@ import operator
 from langchain_core.runnables.base import Runnable
 
 from langgraph.graph import END
-from langchain import hub
 from langgraph.graph import StateGraph, START
 
 
@@ -0,0 +1,89 @@
+import re
+import zlib
+import numpy as np
+
+# The default configuration of the edges candidates pruning (edge_config.candidate_pruning)
+CANDIDATE_PRUNING_CONFIG = {'enabled': True,
+                            'top_k': 10,  # The number of candidate neighbors per policy that are ranked by the LLM
+                            'default_weight': 1,  # The weight of the pruned edges (the LLM score is between 0-10)
+                            'text_weight': 1,  # The weight of the policies text similarity
+                            'flow_weight': 0.3,  # The similarity bonus of policies from the same flow
+                            'category_weight': 0.3,  # The similarity bonus of policies from the same category
+                            'n_features': 4096}  # The dimension of the hashed n-grams vectors
+
+STOP_WORDS = frozenset(
+    'a about above after again all also am an and any are as at be because been before being below between both '
+    'but by can could did do does doing down during each few for from further had has have having he her here '
+    'hers him his how i if in into is it its itself just may me might more most must my no nor not now of off on '
+    'once only or other our ours out over own same shall she should so some such than that the their theirs them '
+    'then there these they this those through to too under until up upon very was we were what when where which '
+    'while who whom why will with would you your yours'.split())
+
+
+def get_ngrams(text: str, stop_words: frozenset = frozenset()) -> list[str]:
+    """
+    The words unigrams and bigrams of a text
+    :param text: The text
+    :param stop_words: Words that are dropped before the n-grams are built
+    """
+    words = [word for word in re.findall(r'\w+', text.lower()) if word not in stop_words]
+    return words + [f'{w1} {w2}' for w1, w2 in zip(words[:-1], words[1:])]
+
+
+def tfidf_vectors(texts: list[str], n_features: int = 4096, stop_words: frozenset = frozenset(),
+                  smooth_idf: bool = True) -> np.ndarray:
+    """
+    The L2 normalized TF-IDF vectors of the texts, over hashed words n-grams
+    :param texts: The texts
+    :param n_features: The vectors dimension
+    :param stop_words: Words that are ignored
+    :param smooth_idf: If False, the idf is log(n / df), so the n-grams that appear in all the texts have no weight
+    :return: A matrix of shape (len(texts), n_features)
+    """
+    tf = np.zeros((len(texts), n_features))
+    for i, text in enumerate(texts):
+        for ngram in get_ngrams(text, stop_words):
+            tf[i, zlib.crc32(ngram.encode('utf-8')) % n_features] += 1
+    df = (tf > 0).sum(axis=0)
+    if smooth_idf:
+        idf = np.log((1 + len(texts)) / (1 + df)) + 1
+    else:
+        idf = np.log(len(texts) / np.maximum(df, 1))
+    vectors = np.log1p(tf) * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def similarity_matrix(policies: list[dict], config: dict) -> np.ndarray:
+    """
+    The local similarity score of all the policies pairs: the text cosine similarity with a bonus for a shared flow
+    and a shared category
+    :param policies: The policies, each with a 'policy', 'flow' and (optional) 'category' keys
+    :param config: The candidate pruning configuration
+    """
+    vectors = tfidf_vectors([policy['policy'] for policy in policies], config.get('n_features', 4096))
+    scores = config.get('text_weight', 1) * vectors @ vectors.T
+    flows = np.array([policy['flow'] for policy in policies], dtype=object)
+    scores += config.get('flow_weight', 0.3) * (flows[:, None] == flows[None, :])
+    categories = np.array([policy.get('category') or '' for policy in policies], dtype=object)
+    same_category = (categories[:, None] == categories[None, :]) & (categories[:, None] != '')
+    scores += config.get('category_weight', 0.3) * same_category
+    np.fill_diagonal(scores, -np.inf)
+    return scores
+
+
+def get_candidate_pairs(policies: list[dict], config: dict) -> set[tuple[int, int]]:
+    """
+    Get the policies pairs that should be ranked by the LLM: the union of the top_k most similar policies of
+    each policy. All the pairs are returned if pruning is disabled or top_k covers all the policies.
+    :param policies: The policies, each with a 'policy', 'flow' and (optional) 'category' keys
+    :param config: The candidate pruning configuration
+    :return: The candidate pairs (i, j) with i < j
+    """
+    n = len(policies)
+    top_k = config.get('top_k', 10)
+    if not config.get('enabled', True) or top_k >= n - 1:
+        return {(i, j) for i in range(n) for j in range(i + 1, n)}
+    scores = similarity_matrix(policies, config)
+    neighbors = np.argpartition(-scores, top_k, axis=1)[:, :top_k]
+    return {(min(i, int(j)), max(i, int(j))) for i in range(n) for j in neighbors[i]}
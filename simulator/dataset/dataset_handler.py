@@ -1,12 +1,26 @@
 import os.path
 from simulator.utils.logger_config import get_logger, ConsoleColor
 import numpy as np
-from simulator.dataset.descriptor_generator import DescriptionGenerator
+from simulator.dataset.descriptor_generator import DescriptionGenerator, Description
 from simulator.dataset.events_generator import EventsGenerator, Event
-import pickle
-from typing import List, Tuple
+from simulator.dataset.event_store import EventStore, SEGMENT_EXTENSION, migrate_pickle_dataset
+from typing import List, Tuple, Callable
 from statistics import mean, stdev
+from simulator.utils.parallelism import PipelineStage, pipeline_ainvoke
 from simulator.healthcare_analytics import GenerateDatasetEvent, track_event
+import asyncio
+import threading
+
+
+def description_to_event(description: Description) -> Event:
+    """
+    Convert a description to an event without a database
+    """
+    return Event(description=description, database={}, scenario=description.event_description)
+
+
+async def adescription_to_event(description: Description) -> Event:
+    return description_to_event(description)
 
 
 class Dataset:
@@ -23,6 +37,7 @@ class Dataset:
         """
         self.config = config
         self.records = []
+        self.store = None
         self.event_generator = event_generator
         self.descriptions_generator = descriptions_generator
         self.dataset_name = None
@@ -34,21 +49,46 @@ class Dataset:
         """
         return len(self.records)
 
-    def generate_mini_batch(self, batch_size: int) -> Tuple[List[Event], float]:
-        logger = get_logger()
-        # Equalizing the distribution of difficulty levels according to the gap between the target frequency and the actual frequency
-        difficulty_distribution, _ = np.histogram([r.description.challenge_level for r in self.records],
+    def get_difficulty_counts(self) -> np.ndarray:
+        """
+        The number of records of each difficulty level (from min_difficult_level to max_difficult_level)
+        """
+        difficulty_distribution, _ = np.histogram(self.get_challenge_levels(),
                                                   bins=np.arange(self.config['min_difficult_level'] - 0.5,
                                                                  self.config['max_difficult_level'] + 1.5, 1))
+        return difficulty_distribution
+
+    def sample_challenge_complexity(self, batch_size: int, difficulty_distribution: np.ndarray = None) -> np.ndarray:
+        """
+        Sample the challenge complexity of the next samples.
+        Equalizing the distribution of difficulty levels according to the gap between the target frequency and the
+        actual frequency
+        :param batch_size: The number of samples
+        :param difficulty_distribution: The number of samples of each difficulty level (default: the records)
+        """
+        if difficulty_distribution is None:
+            difficulty_distribution = self.get_difficulty_counts()
         bins = list(range(self.config['min_difficult_level'], self.config['max_difficult_level'] + 1))
 
-        target_frequency = (len(self.records) + batch_size) / len(difficulty_distribution)
+        target_frequency = (difficulty_distribution.sum() + batch_size) / len(difficulty_distribution)
         deficits = np.maximum(target_frequency - difficulty_distribution,
                               0)  # Only consider bins that are underrepresented
         total_deficit = deficits.sum()
         weights = deficits / total_deficit if total_deficit > 0 else np.zeros_like(deficits)
 
-        challenge_complexity = np.random.choice(bins, size=batch_size, p=weights)
+        return np.random.choice(bins, size=batch_size, p=weights)
+
+    def get_challenge_levels(self) -> List[int]:
+        """
+        The challenge level of each record (from the store metadata, without loading the events)
+        """
+        if self.store is not None:
+            return [m['challenge_level'] for m in self.store.metadata]
+        return [r.description.challenge_level for r in self.records]
+
+    def generate_mini_batch(self, batch_size: int) -> Tuple[List[Event], float]:
+        logger = get_logger()
+        challenge_complexity = self.sample_challenge_complexity(batch_size)
         logger.info(f'{ConsoleColor.CYAN}- Sample mini batch descriptions{ConsoleColor.RESET}')
         # Step 1: Generate descriptions
         descriptions, description_cost = self.descriptions_generator.sample_description(challenge_complexity,
@@ -64,26 +104,145 @@ class Dataset:
             logger.info(f'{ConsoleColor.CYAN}- Generate the event (This would take a while...){ConsoleColor.RESET}')
             events, events_cost = self.event_generator.symbolics_to_events(event_symbols)
         else:  # No database!
-            events = [Event(description=description,
-                            database={}, scenario=description.event_description) for description in descriptions]
+            events = [description_to_event(description) for description in descriptions]
             events_cost, symbols_cost, events_constraints_cost = 0, 0, 0
 
         minibatch_cost = description_cost + symbols_cost + events_constraints_cost + events_cost
         return events, minibatch_cost
 
-    def load_dataset(self, path: str):
+    def get_pipeline_stages(self) -> List[PipelineStage]:
+        """
+        The stages of the streaming generation pipeline: description, symbolic enrichment, symbolic constraints and
+        the event graph (or only the description if there is no database)
+        """
+        stages = [self.descriptions_generator.get_pipeline_stage()]
+        if self.event_generator.env.data_schema:
+            stages += self.event_generator.get_pipeline_stages()
+        else:  # No database!
+            stages.append(PipelineStage(name='event', function=adescription_to_event))
+        return stages
+
+    def generate_streaming(self, n_samples: int, path: str, iteration_num: int, dataset_cost: float,
+                           on_event: Callable[[Event], None] = None,
+                           stop_event: threading.Event = None) -> Tuple[int, float]:
+        """
+        Generate the samples with a streaming pipeline: each description moves to the next stage as soon as it is
+        ready, without waiting for the rest of the mini batch. The dataset is saved every mini_batch_size events.
+        The challenge complexity of each input is sampled when it is fed into the pipeline (counting the samples in
+        flight), so the difficulty of a failed or dropped sample is sampled again by the next inputs.
+        :param n_samples: The number of samples to generate
+        :param path: The dataset dump path
+        :param iteration_num: The current iteration number
+        :param dataset_cost: The dataset cost so far
+        :param on_event: A (blocking) callback that is called with each new event, it runs in a worker thread
+        :param stop_event: If set (e.g. by another thread), no new samples are fed into the pipeline (the samples in
+        flight are completed). It is also set when the cost limit is reached
+        :return: The number of generated events and the generation cost
+        """
+        logger = get_logger()
+        logger.info(f'{ConsoleColor.CYAN}- Generate {n_samples} events with the streaming pipeline '
+                    f'(This would take a while...){ConsoleColor.RESET}')
+        min_level, max_level = self.config['min_difficult_level'], self.config['max_difficult_level']
+        difficulty_distribution = self.get_difficulty_counts()  # The records and the samples in flight
+        in_flight = {}  # The sampled challenge complexity by the input index
+        stop_event = stop_event if stop_event is not None else threading.Event()
+        generation_cost = 0
+        n_generated = 0
+
+        def count_level(level: int, count: int):
+            level = int(level)
+            if min_level <= level <= max_level:
+                difficulty_distribution[level - min_level] += count
+
+        def sample_inputs():
+            for i in range(n_samples):
+                level = int(self.sample_challenge_complexity(1, difficulty_distribution)[0])
+                in_flight[i] = level
+                count_level(level, 1)
+                yield level
+
+        async def run_pipeline():
+            async def on_result(result: dict):
+                nonlocal generation_cost, n_generated
+                generation_cost += result['usage']
+                count_level(in_flight.pop(result['index']), -1)
+                if result['error'] is None:
+                    self.add_events([result['result']])
+                    count_level(result['result'].description.challenge_level, 1)
+                    n_generated += 1
+                    if n_generated % self.config['mini_batch_size'] == 0:
+                        self.dump(path, iteration_num, dataset_cost + generation_cost)
+                    if on_event is not None:
+                        await asyncio.to_thread(on_event, result['result'])
+                if dataset_cost + generation_cost > self.config['cost_limit'] and not stop_event.is_set():
+                    logger.warning(f"{ConsoleColor.RED}Cost is over the limit, stopping the generation. "
+                                   f"Increase the limit in the config file to generate more samples."
+                                   f"{ConsoleColor.RESET}")
+                    stop_event.set()
+
+            await pipeline_ainvoke(self.get_pipeline_stages(), sample_inputs(), n_inputs=n_samples,
+                                   on_result=on_result, stop_event=stop_event)
+
+        asyncio.run(run_pipeline())
+        return n_generated, generation_cost
+
+    def add_events(self, events: List[Event]):
+        """
+        Add events to the dataset records (the events are appended to the store as soon as they are added)
+        """
+        if self.store is not None:
+            self.store.append(events)
+            return
+        for i, e in enumerate(events):
+            e.id = len(self.records) + i + 1
+        self.records.extend(events)
+
+    def dump(self, path: str, iteration_num: int, dataset_cost: float):
+        """
+        Save the dataset progress (the events are already in the store, only the manifest is updated)
+        """
+        if self.store is None or self.store.path != path:
+            self.open_store(path)
+        self.store.commit(iteration_num, dataset_cost)
+
+    def open_store(self, path: str):
+        """
+        Open the dataset event store. A pickle dataset dump is migrated to an event store with the same name
+        :param path: The dataset path
+        :return: The store path
+        """
+        if os.path.splitext(path)[1] == '.pickle':
+            events_path = os.path.splitext(path)[0] + '.' + SEGMENT_EXTENSION
+            if os.path.isfile(path) and not os.path.isfile(events_path):
+                get_logger().info(f'{ConsoleColor.CYAN}Migrating the pickle dataset to an event store{ConsoleColor.RESET}')
+                migrate_pickle_dataset(path, events_path)
+            path = events_path
+        if self.store is not None:
+            self.store.close()
+        self.store = EventStore(path)
+        self.records = self.store.records
+        return path
+
+    def load_dataset(self, path: str, on_event: Callable[[Event], None] = None, stop_event: threading.Event = None):
         """
         Loading dataset
         :param path: path for the records
+        :param on_event: A (blocking) callback that is called with each event of the dataset, both the loaded events
+        and the new events as soon as they are generated
+        :param stop_event: If set (e.g. by another thread), the generation stops (the samples in flight are completed)
         """
         logger = get_logger()
-        if os.path.isfile(path):
-            self.records, iteration_num, dataset_cost = pickle.load(open(path, 'rb'))
+        path = self.open_store(path)
+        if len(self.store) > 0:
+            iteration_num, dataset_cost = self.store.iteration_num, self.store.cost
         else:
             logger.warning(f"{ConsoleColor.RED}Dataset dump not found, initializing from zero{ConsoleColor.RESET}")
             iteration_num = 0
             dataset_cost = self.descriptions_generator.total_cost
         self.dataset_name = os.path.splitext(os.path.basename(path))[0]
+        if on_event is not None:
+            for event in self.records:
+                on_event(event)
         initial_n_samples = len(self.records)
         n_samples = self.config['num_samples'] - len(self.records)  # Number of samples to generate
         if n_samples <= 0:
@@ -96,21 +255,30 @@ class Dataset:
                 logger.warning(f"{ConsoleColor.RED}Cost is over the limit, stopping the generation. "
                                f"Increase the limit in the config file to generate more samples.{ConsoleColor.RESET}")
                 return
+            if stop_event is not None and stop_event.is_set():
+                logger.warning(f"{ConsoleColor.RED}The dataset generation was stopped{ConsoleColor.RESET}")
+                return
             logger.info(f'{ConsoleColor.WHITE}Iteration {iteration_num} started{ConsoleColor.RESET}')
-            cur_iteration_sample_size = min(self.config['mini_batch_size'], n_samples)
-            events, minibatch_cost = self.generate_mini_batch(cur_iteration_sample_size)
-            dataset_cost += minibatch_cost
-            dataset_generation_cost += minibatch_cost
-            for i, e in enumerate(events):
-                e.id = len(self.records) + i + 1
-            self.records.extend(events)
-            n_samples -= len(events)
+            if self.config.get('streaming', True):
+                n_generated, iteration_cost = self.generate_streaming(n_samples, path, iteration_num, dataset_cost,
+                                                                      on_event=on_event, stop_event=stop_event)
+            else:
+                cur_iteration_sample_size = min(self.config['mini_batch_size'], n_samples)
+                events, iteration_cost = self.generate_mini_batch(cur_iteration_sample_size)
+                self.add_events(events)
+                n_generated = len(events)
+                if on_event is not None:
+                    for event in events:
+                        on_event(event)
+            dataset_cost += iteration_cost
+            dataset_generation_cost += iteration_cost
+            n_samples -= n_generated
             iteration_num += 1
-            pickle.dump((self.records, iteration_num, dataset_cost), open(path, 'wb'))
-        challenge_scores = [r.description.challenge_level for r in self.records]
+            self.dump(path, iteration_num, dataset_cost)
+        challenge_scores = self.get_challenge_levels()
         average_challenge_level = mean(challenge_scores)
         std_challenge_level = stdev(challenge_scores) if len(challenge_scores) > 1 else 0
-        avg_n_policies = mean(len(r.description.policies) for r in self.records)
+        avg_n_policies = mean(m['n_policies'] for m in self.store.metadata)
         track_event(GenerateDatasetEvent(cost=dataset_generation_cost,
                                          initial_n_samples=initial_n_samples,
                                          total_n_samples=len(self.records),
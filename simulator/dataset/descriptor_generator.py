@@ -1,14 +1,24 @@
 from typing import List
 from pydantic import BaseModel, Field
-from simulator.utils.llm_utils import set_llm_chain, set_callback
-from simulator.utils.parallelism import batch_invoke, async_batch_invoke
-from typing import Tuple
+from simulator.utils.llm_utils import set_llm_chain, set_callback, get_dummy_callback
+from simulator.utils.parallelism import batch_invoke, async_batch_invoke, PipelineStage, ItemUsage, get_item_usage
+from typing import Tuple, Optional, Callable
 from simulator.utils.llm_utils import get_llm
 import networkx as nx
 import random, math
+import asyncio
+import functools
+import contextvars
+import hashlib
+import os
+import pickle
+import numpy as np
 from simulator.env import Env
 from dataclasses import dataclass
 from simulator.utils.logger_config import ConsoleColor, get_logger
+from simulator.dataset.candidate_pruning import CANDIDATE_PRUNING_CONFIG, get_candidate_pairs
+from simulator.dataset.prompt_diff import match_flows, get_changed_flows
+from simulator.dataset.policy_graph import PolicyGraph, SPARSIFY_CONFIG, sparsify_edges, get_graph_nbytes
 
 from simulator.healthcare_analytics import (
     ExtractFlowEvent,
@@ -18,6 +28,13 @@ from simulator.healthcare_analytics import (
 )
 
 
+def get_policy_key(flow: str, policy: str) -> str:
+    """
+    The content hash of a policy (used to reuse the policies edges when the graph is rebuilt)
+    """
+    return hashlib.sha1(f'{flow}\n{policy}'.encode('utf-8')).hexdigest()
+
+
 def policies_list_to_str(policies):
     return "\n".join([f"Policy {i} flow: {policy['flow']}\nPolicy {i} content: {policy['policy']}\n------" for
                       i, policy in enumerate(policies)])
@@ -28,6 +45,17 @@ class Rank(BaseModel):
     score: int = Field(description="The final score between 0-10")
 
 
+class PairRank(BaseModel):
+    """The rank of a policies pair"""
+    pair_id: int = Field(description="The id of the pair")
+    score: int = Field(description="The final score between 0-10")
+
+
+class RanksList(BaseModel):
+    """The ranks of the policies pairs"""
+    ranks: List[PairRank] = Field(description="The rank of each one of the pairs")
+
+
 class FlowsList(BaseModel):
     """The list of flows"""
     flows: List[str] = Field(description="A list of flows families")
@@ -50,6 +78,18 @@ class EventDescription(BaseModel):
     expected_behaviour: str = Field(description="The expected behaviour of the chatbot according to the policies")
 
 
+class ScenarioDescription(BaseModel):
+    """The description of a single scenario"""
+    scenario_id: int = Field(description="The id of the scenario")
+    event_description: str = Field(description="The event description")
+    expected_behaviour: str = Field(description="The expected behaviour of the chatbot according to the policies")
+
+
+class DescriptionsList(BaseModel):
+    """The descriptions of the scenarios"""
+    descriptions: List[ScenarioDescription] = Field(description="The description of each one of the scenarios")
+
+
 @dataclass
 class Description:
     """
@@ -63,6 +103,85 @@ class Description:
     symbolic_restrictions: str = None
 
 
+def get_scenarios_input(task_description: str, samples: list[dict]) -> dict:
+    """
+    The input of a packed description call (the task description is sent once)
+    """
+    return {'task_description': task_description,
+            'scenarios': '\n'.join([f"## Scenario {k}:\n{sample['policies']}" for k, sample in enumerate(samples)])}
+
+
+def get_valid_descriptions(result: DescriptionsList, n_scenarios: int) -> dict[int, ScenarioDescription]:
+    """
+    The accepted items of a packed description response: the scenario id should be valid and unique in the response
+    and both fields should not be empty
+    :return: The description of each accepted scenario id
+    """
+    ids = [item.scenario_id for item in result.descriptions]
+    return {item.scenario_id: item for item in result.descriptions
+            if 0 <= item.scenario_id < n_scenarios and ids.count(item.scenario_id) == 1
+            and item.event_description.strip() and item.expected_behaviour.strip()}
+
+
+class DescriptionPacker:
+    """
+    Packs the descriptions of the streaming pipeline: the concurrent description requests are buffered, and each
+    batch_size requests (or the requests that waited max_wait seconds) are described in a single call. The usage of
+    the pack call is split between its requests (also when the call failed or timed out)
+    """
+
+    def __init__(self, descriptions_llm, task_description: str, batch_size: int, max_wait: float, timeout: float,
+                 callback: Callable = get_dummy_callback):
+        self.descriptions_llm = descriptions_llm
+        self.callback = callback
+        self.task_description = task_description
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.pending = []  # The buffered (sample, future, item usage) requests
+        self.timer = None
+
+    async def describe(self, sample: dict) -> Optional[ScenarioDescription]:
+        """
+        Describe a sample in a pack
+        :return: The description (None if the pack call failed or the sample is missing from the response)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((sample, future, get_item_usage()))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_wait, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pack, self.pending = self.pending, []
+        if pack:
+            # The pack call runs in a new context, so its usage is not charged to the request that flushed it
+            contextvars.Context().run(asyncio.ensure_future, self.describe_pack(pack))
+
+    async def describe_pack(self, pack: list[tuple[dict, asyncio.Future, Optional[ItemUsage]]]):
+        descriptions = {}
+        with self.callback() as cb:
+            try:
+                result = await asyncio.wait_for(self.descriptions_llm.ainvoke(
+                    get_scenarios_input(self.task_description, [sample for sample, _, _ in pack])),
+                    timeout=self.timeout)
+                descriptions = get_valid_descriptions(result, len(pack))
+            except Exception as e:
+                get_logger().warning(f"{ConsoleColor.RED}Packed description failed, the {len(pack)} scenarios are "
+                                     f"described one by one: {e}{ConsoleColor.RESET}")
+        for k, (_, future, item_usage) in enumerate(pack):
+            if item_usage is not None:
+                item_usage.total_cost += cb.total_cost / len(pack)
+            if not future.done():  # The request may have been cancelled (timeout)
+                future.set_result(descriptions.get(k))
+
+
 class DescriptionGenerator:
     """
     This class is responsible for generating descriptions
@@ -87,24 +206,79 @@ class DescriptionGenerator:
             self.feedback_chain = set_llm_chain(llm, **self.config['refinement_config']['prompt_feedback'])
             self.refinement_chain = set_llm_chain(llm, **self.config['refinement_config']['prompt_refinement'])
 
-    def generate_policies_graph(self, override=False):
+    def generate_policies_graph(self, override=False, previous: 'DescriptionGenerator' = None):
         """
         Generate the policies graph
+        :param override: If True, regenerate all the graph steps
+        :param previous: The generator of a previous prompt version. If provided, only the flows that were affected
+        by the prompt changes are broken to policies again, and only the edges of new policies are ranked
         """
         logger = get_logger()
         if override or not hasattr(self, 'flows'):
             logger.info(f"{ConsoleColor.WHITE}Step 1: Breaking prompt to flows{ConsoleColor.RESET}")
             self.flows = self.extract_flows()
             logger.info(f"{ConsoleColor.WHITE}Finish step 1{ConsoleColor.RESET}")
+        matches = {}
         if override or not hasattr(self, 'policies'):
             logger.info(f"{ConsoleColor.WHITE}Step 2: Breaking each flow to policies{ConsoleColor.RESET}")
-            self.policies = self.extract_policies()
+            if previous is None:
+                self.policies = self.extract_policies()
+            else:
+                matches = match_flows(self.prompt, self.flows, previous.prompt, previous.policies)
+                changed_flows = get_changed_flows(self.prompt, self.flows, previous.prompt, previous.policies,
+                                                  matches)
+                logger.info(f"{ConsoleColor.CYAN}{len(changed_flows)} of {len(self.flows)} flows were changed"
+                            f"{ConsoleColor.RESET}")
+                policies = self.extract_policies(changed_flows)
+                self.policies = {flow: policies[flow] if flow in changed_flows else previous.policies[matches[flow]]
+                                 for flow in self.flows if flow in policies or flow not in changed_flows}
             logger.info(f"{ConsoleColor.WHITE}Finish step 2{ConsoleColor.RESET}")
         if override or not hasattr(self, 'relations'):
             logger.info(f"{ConsoleColor.WHITE}Step 3: Building the relations graph{ConsoleColor.RESET}")
-            self.extract_graph()
+            self.extract_graph(self.get_previous_edge_scores(previous, matches) if previous is not None else None)
             logger.info(f"{ConsoleColor.WHITE}Finish step 3{ConsoleColor.RESET}")
 
+    def get_previous_edge_scores(self, previous: 'DescriptionGenerator',
+                                 matches: dict[str, str]) -> dict[tuple[str, str], int]:
+        """
+        The edges scores of the previous graph, the policies of the renamed flows are keyed by their new flow name
+        :param previous: The generator of the previous prompt version
+        :param matches: The matched previous flow of each flow
+        """
+        renamed = {}
+        for flow, previous_flow in matches.items():
+            if flow != previous_flow and self.policies.get(flow) is previous.policies[previous_flow]:
+                renamed.update({get_policy_key(previous_flow, policy['policy']): get_policy_key(flow, policy['policy'])
+                                for policy in previous.policies[previous_flow]})
+        return {tuple(sorted(renamed.get(key, key) for key in pair)): score
+                for pair, score in previous.get_edge_scores().items()}
+
+    def get_edge_scores(self) -> dict[tuple[str, str], int]:
+        """
+        The LLM scores of the graph edges, by the policies content hashes
+        """
+        if 'edge_scores' in self.graph_info:
+            return self.graph_info['edge_scores']
+        # Older graphs: all the edges were ranked by the LLM
+        keys = [get_policy_key(node['flow'], node['policy']) for node in self.graph_info['nodes']]
+        return {tuple(sorted((keys[i], keys[j]))): data['weight']
+                for i, j, data in self.get_graph().edges(data=True)}
+
+    def get_graph(self) -> nx.Graph:
+        """
+        The networkx policies graph. The pickled generators keep only the graph edges list, the graph is rebuilt
+        from it on first use
+        """
+        if 'G' not in self.graph_info:
+            if 'edges' not in self.graph_info:
+                raise ValueError('The policies graph of the descriptions generator is missing (neither the networkx '
+                                 'graph nor its edges were saved), generate the policies graph again')
+            G = nx.Graph()
+            G.add_weighted_edges_from((int(u), int(v), weight.item()) for (u, v), weight in
+                                      zip(self.graph_info['edges'], self.graph_info['edge_weights']))
+            self.graph_info['G'] = G
+        return self.graph_info['G']
+
     def extract_flows(self):
         """
         Extract the flows from the prompt
@@ -126,15 +300,17 @@ class DescriptionGenerator:
                                      error_message=error_message))
         return flows.dict()['flows']
 
-    def extract_policies(self):
+    def extract_policies(self, flows: list[str] = None):
         """
         Extract the policies from the prompt
+        :param flows: The flows to break to policies (default: all the flows)
         """
+        flows = flows if flows is not None else self.flows
         llm = get_llm(self.config['llm_policy'])
         policy_extractor = set_llm_chain(llm, **self.config['policies_config']['prompt'], structure=PoliciesList)
         flows_policies = {}
         batch = []
-        for flow in self.flows:
+        for flow in flows:
             batch.append({'user_prompt': self.prompt, 'flow': flow})
         res = batch_invoke(policy_extractor.invoke, batch,
                            num_workers=self.config['policies_config']['num_workers'],
@@ -152,7 +328,7 @@ class DescriptionGenerator:
             extract_policies_cost += result.get('usage', 0)
 
             # Update flows_policies and calculate the number of policies
-            flow_key = self.flows[result['index']]
+            flow_key = flows[result['index']]
             policies = result['result'].dict().get('policies', [])
             flows_policies[flow_key] = policies
             n_policies_per_flow.append(len(policies) if policies is not None else None)
@@ -167,9 +343,11 @@ class DescriptionGenerator:
                     )
         return flows_policies
 
-    def extract_graph(self):
+    def extract_graph(self, previous_scores: dict[tuple[str, str], int] = None):
         """
         Extract the weighted relations between the policies
+        :param previous_scores: The edges scores of a previous graph (by the policies content hashes), these edges
+        are not ranked again
         """
         llm = get_llm(self.config['llm_edge'])
         self.graph_info = {'G': nx.Graph()}
@@ -181,23 +359,53 @@ class DescriptionGenerator:
         callback = set_callback(self.config['llm_edge']['type'])
         samples_batch = []
         policies_list = []
+        categories = []
         for flow, policies in self.policies.items():
             policies_list += [{'flow': flow, 'policy': policy['policy'], 'score': policy['challenge_score']}
                               for policy in policies]
+            categories += [policy.get('category', '') for policy in policies]
+        # Only the most similar pairs are ranked by the LLM, the rest get a default low weight
+        pruning_config = {**CANDIDATE_PRUNING_CONFIG, **self.config['edge_config'].get('candidate_pruning', {})}
+        candidate_pairs = get_candidate_pairs([{**policy, 'category': category} for policy, category in
+                                               zip(policies_list, categories)], pruning_config)
+        pruned_edges = []
+        reused_edges = []
+        keys = [get_policy_key(policy['flow'], policy['policy']) for policy in policies_list]
+        self.graph_info['edge_scores'] = {}
         for i, first_policy in enumerate(policies_list):
             for j, second_policy in enumerate(policies_list[i + 1:]):
+                if (i, j + i + 1) not in candidate_pairs:
+                    pruned_edges.append((i, j + i + 1, {'weight': pruning_config['default_weight']}))
+                    continue
+                key = tuple(sorted((keys[i], keys[j + i + 1])))
+                if previous_scores is not None and key in previous_scores:
+                    reused_edges.append((i, j + i + 1, {'weight': previous_scores[key]}))
+                    self.graph_info['edge_scores'][key] = previous_scores[key]
+                    continue
                 samples_batch.append({'policy1': policy_to_str(first_policy),
                                       'policy2': policy_to_str(second_policy),
                                       'ind1': i,
                                       'ind2': j + i + 1})
+        get_logger().info(f"{ConsoleColor.CYAN}Ranking {len(samples_batch)} policies pairs "
+                          f"({len(pruned_edges)} pairs were pruned, {len(reused_edges)} edges were reused)"
+                          f"{ConsoleColor.RESET}")
         self.graph_info['nodes'] = policies_list
         num_workers = self.config['edge_config'].get('num_workers', 1)
         timeout = self.config['edge_config'].get('timeout', 10)
-        res = async_batch_invoke(edge_llm.ainvoke, samples_batch, num_workers=num_workers,
-                                 callbacks=[callback], timeout=timeout)
         all_edges = []
         graph_creation_cost = 0
         batch_error_message = None
+        if self.config['edge_config'].get('batch_config', {}).get('enabled', False):
+            # Rank blocks of pairs in a single call, the pairs that are not ranked are ranked one by one
+            scores, graph_creation_cost = self.rank_edges_batched(samples_batch)
+            for index, score in scores.items():
+                cur_sample = samples_batch[index]
+                all_edges.append((cur_sample['ind1'], cur_sample['ind2'], {'weight': score}))
+                self.graph_info['edge_scores'][tuple(sorted((keys[cur_sample['ind1']],
+                                                             keys[cur_sample['ind2']])))] = score
+            samples_batch = [sample for i, sample in enumerate(samples_batch) if i not in scores]
+        res = async_batch_invoke(edge_llm.ainvoke, samples_batch, num_workers=num_workers,
+                                 callbacks=[callback], timeout=timeout, latency_signal=True)
         for result in res:
             if result['error'] is not None:
                 print(f"Error in sample {result['index']}: {result['error']}")
@@ -206,12 +414,25 @@ class DescriptionGenerator:
             graph_creation_cost += result['usage']
             cur_sample = samples_batch[result['index']]
             all_edges.append((cur_sample['ind1'], cur_sample['ind2'], {'weight': result['result'].score}))
+            self.graph_info['edge_scores'][tuple(sorted((keys[cur_sample['ind1']],
+                                                         keys[cur_sample['ind2']])))] = result['result'].score
+        all_edges += reused_edges + pruned_edges
         self.total_cost += graph_creation_cost
         n_edges = len(all_edges)
         avg_edge_weight = sum(edge[2]['weight'] for edge in all_edges) / n_edges
         # Calculate standard deviation
         std_edge_weight = math.sqrt(sum((edge[2]['weight'] - avg_edge_weight) ** 2 for edge in all_edges) / n_edges)
+        sparsify_config = {**SPARSIFY_CONFIG, **self.config['edge_config'].get('sparsify', {})}
+        if sparsify_config['enabled']:
+            kept_edges = sparsify_edges(len(policies_list), all_edges, sparsify_config['top_k'],
+                                        sparsify_config['min_weight'])
+            get_logger().info(f"{ConsoleColor.CYAN}Sparsified the policies graph: {n_edges} -> {len(kept_edges)} "
+                              f"edges, {get_graph_nbytes(len(policies_list), n_edges) / 2 ** 20:.2f}MB -> "
+                              f"{get_graph_nbytes(len(policies_list), len(kept_edges)) / 2 ** 20:.2f}MB"
+                              f"{ConsoleColor.RESET}")
+            all_edges = kept_edges
         self.graph_info['G'].add_edges_from(all_edges)
+        self.policy_graph = PolicyGraph.from_networkx(self.graph_info['G'], self.graph_info['nodes'])
         track_event(GenerateRelationsGraphEvent(cost=graph_creation_cost,
                                                 n_edges=n_edges,
                                                 avg_edge_weight=avg_edge_weight,
@@ -220,34 +441,92 @@ class DescriptionGenerator:
                                                 error_message=batch_error_message
                                                 ))
 
+    def get_pairs_blocks(self, samples: list[dict]) -> list[list[int]]:
+        """
+        Split the pairs to blocks that fit the context window of a single call
+        :param samples: The pairs samples (with policy1 and policy2)
+        :return: The blocks of samples indices
+        """
+        batch_config = self.config['edge_config']['batch_config']
+        max_pairs = batch_config.get('max_pairs_per_call', 50)
+        max_tokens = batch_config.get('max_prompt_tokens', 8000)
+        blocks = [[]]
+        n_tokens = 0
+        for i, sample in enumerate(samples):
+            pair_tokens = (len(sample['policy1']) + len(sample['policy2'])) // 4 + 10  # ~4 characters per token
+            if blocks[-1] and (len(blocks[-1]) >= max_pairs or n_tokens + pair_tokens > max_tokens):
+                blocks.append([])
+                n_tokens = 0
+            blocks[-1].append(i)
+            n_tokens += pair_tokens
+        return [block for block in blocks if block]
+
+    def rank_edges_batched(self, samples: list[dict]) -> Tuple[dict[int, int], float]:
+        """
+        Rank the policies pairs in blocks: each call ranks a whole block of pairs with a structured list output.
+        The pairs that are missing from a response (or from a failed call) are ranked again in new blocks
+        :param samples: The pairs samples (with policy1 and policy2)
+        :return: The score of each ranked sample index and the cost
+        """
+        batch_config = self.config['edge_config']['batch_config']
+        llm = get_llm(self.config['llm_edge'])
+        ranks_llm = set_llm_chain(llm, structure=RanksList, **batch_config['prompt'])
+        callback = set_callback(self.config['llm_edge']['type'])
+        num_workers = self.config['edge_config'].get('num_workers', 1)
+        timeout = batch_config.get('timeout', 60)
+        scores = {}
+        cost = 0
+        remaining = list(range(len(samples)))
+        for _ in range(batch_config.get('max_rounds', 2)):
+            if not remaining:
+                break
+            blocks = self.get_pairs_blocks([samples[i] for i in remaining])
+            blocks = [[remaining[i] for i in block] for block in blocks]
+            inputs = [{'pairs': '\n'.join([f"## Pair {k}:\n### Policy A:\n{samples[i]['policy1']}\n"
+                                           f"### Policy B:\n{samples[i]['policy2']}" for k, i in enumerate(block)])}
+                      for block in blocks]
+            res = async_batch_invoke(ranks_llm.ainvoke, inputs, num_workers=num_workers,
+                                     callbacks=[callback], timeout=timeout)
+            for result in res:
+                cost += result['usage']
+                if result['error'] is not None:
+                    continue
+                block = blocks[result['index']]
+                for rank in result['result'].ranks:
+                    if 0 <= rank.pair_id < len(block):
+                        scores[block[rank.pair_id]] = rank.score
+            remaining = [i for i in remaining if i not in scores]
+        get_logger().info(f"{ConsoleColor.CYAN}Ranked {len(scores)} policies pairs in blocks, {len(remaining)} "
+                          f"pairs are ranked one by one{ConsoleColor.RESET}")
+        return scores, cost
+
+    def get_policy_graph(self) -> PolicyGraph:
+        """
+        The frozen policies graph (graphs of older checkpoints are frozen on first use)
+        """
+        if getattr(self, 'policy_graph', None) is None:
+            self.policy_graph = PolicyGraph.from_networkx(self.get_graph(), self.graph_info['nodes'])
+        return self.policy_graph
+
+    def sample_paths(self, thresholds: list[float]) -> list[Tuple[list, float]]:
+        """
+        Sample paths from the graph (all of them at once). Traverse the graph according to edge weight probability
+        until each path sum exceeds its threshold.
+        :param thresholds: The threshold of each path
+        :return: The list of nodes in each path and the path sum
+        """
+        # The numpy generator is seeded from random, so random.seed keeps the sampling reproducible
+        rng = np.random.default_rng(random.getrandbits(64))
+        return [([self.graph_info['nodes'][t] for t in path], path_sum)
+                for path, path_sum in self.get_policy_graph().sample_paths(thresholds, rng)]
+
     def sample_from_graph(self, threshold) -> Tuple[list, int]:
         """
         Sample a path from the graph. Traverse the graph according to edge weight probability until the path sum exceeds the threshold.
         :param threshold:
         :return: list of nodes in the path and the path sum
         """
-        # Start with a random node
-        current_node = random.choice(list(self.graph_info['G'].nodes))
-        path = [current_node]
-        path_sum = self.graph_info['nodes'][current_node]['score']
-
-        # Traverse until the path sum exceeds the threshold
-        while path_sum < threshold:
-            # Get neighbors and weights for current node
-            neighbors = list(self.graph_info['G'].neighbors(current_node))
-            neighbors = [neighbor for neighbor in neighbors if neighbor not in path]
-            weights = [self.graph_info['G'][current_node][neighbor]['weight'] for neighbor in neighbors]
-
-            # Weighted choice of the next node
-            next_node = random.choices(neighbors, weights=weights)[0]
-
-            # Add the chosen node to the path and update path sum
-            path.append(next_node)
-            path_sum += self.graph_info['nodes'][next_node]['score']
-
-            # Move to the next node
-            current_node = next_node
-        return [self.graph_info['nodes'][t] for t in path], path_sum
+        return self.sample_paths([threshold])[0]
 
     def sample_description(self, challenge_complexity: int or list[int], num_samples: int = 1) -> Tuple[list[Description], float]:
         """
@@ -268,22 +547,30 @@ class DescriptionGenerator:
         samples_batch = []
         all_policies = []
         cost = 0
-        for i, cur_score in enumerate(challenge_complexity):
-            policies, path_sum = self.sample_from_graph(cur_score)
+        for policies, path_sum in self.sample_paths(challenge_complexity):
             all_policies.append({'policies': policies, 'path_sum': path_sum})
             samples_batch.append({'task_description': self.task_description,
                                   'policies': policies_list_to_str(policies)})
         num_workers = self.config['description_config'].get('num_workers', 1)
         timeout = self.config['description_config'].get('timeout', 10)
         callback = set_callback(self.config['llm_description']['type'])
-        res = async_batch_invoke(self.llm_description.ainvoke, samples_batch, num_workers=num_workers,
-                                 callbacks=[callback], timeout=timeout)
+        remaining = list(range(len(samples_batch)))
+        if self.config['description_config'].get('batch_config', {}).get('enabled', False):
+            # Several scenarios are described in a single call, the failed scenarios are described one by one
+            batch_results, batch_cost = self.describe_paths_batched(samples_batch)
+            cost += batch_cost
+            for index, result in batch_results.items():
+                all_policies[index]['description'] = result.event_description
+                all_policies[index]['expected_behaviour'] = result.expected_behaviour
+            remaining = [i for i in remaining if i not in batch_results]
+        res = async_batch_invoke(self.llm_description.ainvoke, [samples_batch[i] for i in remaining],
+                                 num_workers=num_workers, callbacks=[callback], timeout=timeout, latency_signal=True)
         for result in res:
             if result['error'] is not None:
                 continue
             cost += result['usage']
-            all_policies[result['index']]['description'] = result['result'].event_description
-            all_policies[result['index']]['expected_behaviour'] = result['result'].expected_behaviour
+            all_policies[remaining[result['index']]]['description'] = result['result'].event_description
+            all_policies[remaining[result['index']]]['expected_behaviour'] = result['result'].expected_behaviour
         all_policies = [policy for policy in all_policies if 'description' in policy]
         descriptions = [Description(event_description=policy['description'],
                                     expected_behaviour=policy['expected_behaviour'],
@@ -295,6 +582,97 @@ class DescriptionGenerator:
         cost += refinement_cost
         return descriptions, cost
 
+    def describe_paths_batched(self, samples: list[dict]) -> Tuple[dict[int, ScenarioDescription], float]:
+        """
+        Describe the sampled policies paths in packs: each call receives batch_size scenarios (the task description
+        is sent once) and returns a structured list of descriptions. An item is accepted only if its scenario id is
+        valid and unique in the response and both its fields are not empty.
+        :param samples: The description samples (with task_description and policies)
+        :return: The description of each accepted sample index and the cost
+        """
+        batch_config = self.config['description_config']['batch_config']
+        llm = get_llm(self.config['llm_description'])
+        descriptions_llm = set_llm_chain(llm, structure=DescriptionsList, **batch_config['prompt'])
+        callback = set_callback(self.config['llm_description']['type'])
+        batch_size = batch_config.get('batch_size', 5)
+        blocks = [list(range(i, min(i + batch_size, len(samples)))) for i in range(0, len(samples), batch_size)]
+        inputs = [get_scenarios_input(self.task_description, [samples[i] for i in block]) for block in blocks]
+        res = async_batch_invoke(descriptions_llm.ainvoke, inputs,
+                                 num_workers=self.config['description_config'].get('num_workers', 1),
+                                 callbacks=[callback], timeout=batch_config.get('timeout', 120))
+        results = {}
+        cost = 0
+        for result in res:
+            cost += result['usage']
+            if result['error'] is not None:
+                continue
+            block = blocks[result['index']]
+            for scenario_id, item in get_valid_descriptions(result['result'], len(block)).items():
+                results[block[scenario_id]] = item
+        get_logger().info(f"{ConsoleColor.CYAN}Described {len(results)} scenarios in packs of {batch_size}, "
+                          f"{len(samples) - len(results)} scenarios are described one by one{ConsoleColor.RESET}")
+        return results, cost
+
+    def get_pipeline_stage(self) -> PipelineStage:
+        """
+        The description stage of the streaming dataset pipeline (from a challenge complexity to a description).
+        If the batch_config is enabled, the descriptions are packed: the stage runs batch_size times more workers,
+        so each description call still gets a full pack
+        """
+        num_workers = self.config['description_config'].get('num_workers', 1)
+        timeout = self.config['description_config'].get('timeout', 10)
+        batch_config = self.config['description_config'].get('batch_config', {})
+        function = self.asample_single_description
+        if batch_config.get('enabled', False):
+            llm = get_llm(self.config['llm_description'])
+            packer = DescriptionPacker(set_llm_chain(llm, structure=DescriptionsList, **batch_config['prompt']),
+                                       self.task_description, batch_config.get('batch_size', 5),
+                                       batch_config.get('max_wait', 1), batch_config.get('timeout', 120),
+                                       callback=set_callback(self.config['llm_description']['type']))
+            function = functools.partial(self.asample_single_description, packer=packer)
+            num_workers *= packer.batch_size
+            timeout += packer.max_wait + packer.timeout
+        return PipelineStage(name='description', function=function, num_workers=num_workers, timeout=timeout,
+                             callbacks=[set_callback(self.config['llm_description']['type'])])
+
+    async def asample_single_description(self, challenge_complexity: int,
+                                         packer: DescriptionPacker = None) -> Description:
+        """
+        Sample a single description of event asynchronously (used by the streaming dataset pipeline)
+        :param challenge_complexity: The complexity of the generated description (it will be at least the provided number)
+        :param packer: If provided, the description is generated in a pack (and alone if the pack failed)
+        :return: The description of the event
+        """
+        policies, path_sum = self.sample_from_graph(challenge_complexity)
+        sample = {'task_description': self.task_description, 'policies': policies_list_to_str(policies)}
+        result = await packer.describe(sample) if packer is not None else None
+        if result is None:
+            result = await self.llm_description.ainvoke(sample)
+        description = Description(event_description=result.event_description,
+                                  expected_behaviour=result.expected_behaviour,
+                                  policies=policies,
+                                  challenge_level=path_sum)
+        if self.config['refinement_config']['do_refinement']:
+            description = await self.arefine_description(description)
+        return description
+
+    async def arefine_description(self, description: Description) -> Description:
+        """
+        Verify the expected behaviour of the chatbot according to each policy for a single description
+        :param description: The description to refine
+        :return: The refined description
+        """
+        sample = {'description': description.event_description,
+                  'behaviour': description.expected_behaviour,
+                  'prompt': self.prompt}
+        feedback = await self.feedback_chain.ainvoke(sample)
+        if 'None' in feedback.content:
+            return description
+        refined = await self.refinement_chain.ainvoke({**sample, 'feedback': feedback.content})
+        if 'None' not in refined.content:
+            description.expected_behaviour = refined.content
+        return description
+
     def expected_behaviour_refinement(self, descriptions: list[Description], num_iterations=1) -> Tuple[
         list[Description], float]:
         """
@@ -317,7 +695,7 @@ class DescriptionGenerator:
                                     'behaviour': descriptions[ind].expected_behaviour,
                                     'prompt': self.prompt})
             res = async_batch_invoke(self.feedback_chain.ainvoke, batch_input, num_workers=num_workers,
-                                     callbacks=[callback], timeout=timeout)
+                                     callbacks=[callback], timeout=timeout, latency_signal=True)
             cur_refine_indices = []
             improved_batch = []
             # refine the behaviour
@@ -332,7 +710,7 @@ class DescriptionGenerator:
                     cost += result['usage']
 
             res = async_batch_invoke(self.refinement_chain.ainvoke, improved_batch, num_workers=num_workers,
-                                     callbacks=[callback], timeout=timeout)
+                                     callbacks=[callback], timeout=timeout, latency_signal=True)
             for j, result in enumerate(res):
                 if result['error'] is not None or 'None' in result['result'].content:
                     continue
@@ -351,6 +729,15 @@ class DescriptionGenerator:
             del state['feedback_chain']
         if 'refinement_chain' in state:
             del state['refinement_chain']
+        # The frozen graph is saved to its own npz file (see save_descriptions_generator), and the networkx graph is
+        # replaced by its compact edges list (the graph is rebuilt from it if the npz file is missing)
+        graph_info = state.get('graph_info')
+        if graph_info is not None and 'G' in graph_info:
+            edges = list(graph_info['G'].edges(data='weight', default=1))
+            state['graph_info'] = {key: value for key, value in graph_info.items() if key != 'G'}
+            state['graph_info']['edges'] = np.array([(u, v) for u, v, _ in edges], dtype=np.int32).reshape(-1, 2)
+            state['graph_info']['edge_weights'] = np.array([w for _, _, w in edges], dtype=np.float32)
+        state['policy_graph'] = None
         return state
 
     def __setstate__(self, state):
@@ -363,3 +750,33 @@ class DescriptionGenerator:
             self.feedback_chain = set_llm_chain(llm, **self.config['refinement_config']['prompt_feedback'])
             self.refinement_chain = set_llm_chain(llm, **self.config['refinement_config']['prompt_refinement'])
         return self
+
+
+def get_policy_graph_path(generator_path: str) -> str:
+    return os.path.splitext(generator_path)[0] + '.npz'
+
+
+def save_descriptions_generator(generator: DescriptionGenerator, path: str):
+    """
+    Save the descriptions generator: the frozen policies graph is saved to a npz file next to the pickle
+    :param generator: The descriptions generator
+    :param path: The pickle path
+    """
+    generator.get_policy_graph().save(get_policy_graph_path(path))
+    with open(path, 'wb') as f:
+        pickle.dump(generator, f)
+
+
+def load_descriptions_generator(path: str) -> DescriptionGenerator:
+    """
+    Load a descriptions generator, the frozen policies graph is memory mapped
+    :param path: The pickle path
+    """
+    with open(path, 'rb') as f:
+        generator = pickle.load(f)
+    if os.path.isfile(get_policy_graph_path(path)):
+        generator.policy_graph = PolicyGraph.load(get_policy_graph_path(path))
+    elif hasattr(generator, 'graph_info'):
+        # Older checkpoints (or a missing npz file): the graph is frozen from the networkx graph or its edges list
+        generator.get_policy_graph()
+    return generator
@@ -0,0 +1,227 @@
+import os
+import pickle
+import struct
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping
+import pandas as pd
+
+# The rows frame header: magic, metadata length, payload length, crc32 of the metadata and the payload
+ROWS_FRAME_HEADER = struct.Struct('<4sIII')
+ROWS_FRAME_MAGIC = b'ROW1'
+ROWS_EXTENSION = 'rows'
+
+
+def get_row_hash(table_name: str, columns: tuple, values: tuple) -> str:
+    """
+    The content address of a row (rows with the same values of different types get different hashes)
+    """
+    return hashlib.sha1(pickle.dumps((table_name, columns, values), protocol=4)).hexdigest()
+
+
+class RowPool:
+    """
+    A content-addressed pool of the database rows of all the events in a dataset. Each row is stored once, no
+    matter how many events contain it. New rows are appended (per event and table) to the rows file as a columnar
+    frame: the row hashes in the frame metadata and a dict of column values as the payload. On open, only the
+    frames metadata is read; the columns are decoded when an event table is materialized.
+    """
+
+    def __init__(self, path: str, cache_size: int = 256):
+        """
+        Open (or create) the rows pool.
+        :param path: The rows file path
+        :param cache_size: The number of decoded frames kept in memory
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.frames = []  # The (payload offset, payload length) of each frame
+        self.index = {}  # row hash -> (frame index, row position in the frame)
+        self.lock = threading.Lock()
+        self.scan()
+        self.file = open(self.path, 'ab')
+
+    def scan(self):
+        """
+        Index the rows of the file frames, a torn last frame is truncated
+        """
+        if not os.path.isfile(self.path):
+            return
+        valid_end = 0
+        with open(self.path, 'rb') as f:
+            while True:
+                header = f.read(ROWS_FRAME_HEADER.size)
+                if len(header) < ROWS_FRAME_HEADER.size:
+                    break
+                magic, meta_len, payload_len, crc = ROWS_FRAME_HEADER.unpack(header)
+                if magic != ROWS_FRAME_MAGIC:
+                    break
+                meta = f.read(meta_len)
+                payload = f.read(payload_len)
+                if len(payload) < payload_len or zlib.crc32(payload, zlib.crc32(meta)) != crc:
+                    break
+                self.add_frame_index(pickle.loads(meta), valid_end + ROWS_FRAME_HEADER.size + meta_len, payload_len)
+                valid_end = f.tell()
+        if valid_end < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+
+    def add_frame_index(self, hashes: list[str], offset: int, length: int):
+        frame_index = len(self.frames)
+        self.frames.append((offset, length))
+        for i, row_hash in enumerate(hashes):
+            self.index.setdefault(row_hash, (frame_index, i))
+
+    def add_table(self, table_name: str, df: pd.DataFrame) -> 'TableRef':
+        """
+        Add the rows of a table to the pool (only the new rows are written)
+        :param table_name: The table name
+        :param df: The table
+        :return: The reference of the table
+        """
+        columns = tuple(df.columns)
+        rows = list(df.itertuples(index=False, name=None))
+        hashes = [get_row_hash(table_name, columns, values) for values in rows]
+        with self.lock:
+            new_positions = []
+            seen = set()
+            for i, row_hash in enumerate(hashes):
+                if row_hash not in self.index and row_hash not in seen:
+                    seen.add(row_hash)
+                    new_positions.append(i)
+            if new_positions:
+                meta = pickle.dumps([hashes[i] for i in new_positions], protocol=4)
+                payload = pickle.dumps({'columns': columns,
+                                        'data': [list(col) for col in zip(*[rows[i] for i in new_positions])]},
+                                       protocol=pickle.HIGHEST_PROTOCOL)
+                crc = zlib.crc32(payload, zlib.crc32(meta))
+                offset = self.file.tell()
+                self.file.write(ROWS_FRAME_HEADER.pack(ROWS_FRAME_MAGIC, len(meta), len(payload), crc) + meta + payload)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.add_frame_index([hashes[i] for i in new_positions],
+                                     offset + ROWS_FRAME_HEADER.size + len(meta), len(payload))
+        return TableRef(columns=columns, dtypes={c: str(t) for c, t in df.dtypes.items()}, row_hashes=hashes)
+
+    def get_frame(self, frame_index: int) -> dict:
+        """
+        Decode a frame (lock should be held)
+        """
+        if frame_index in self.cache:
+            self.cache.move_to_end(frame_index)
+            return self.cache[frame_index]
+        offset, length = self.frames[frame_index]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            frame = pickle.loads(f.read(length))
+        frame['columns'] = {c: i for i, c in enumerate(frame['columns'])}
+        self.cache[frame_index] = frame
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return frame
+
+    def get_table(self, table_ref: 'TableRef') -> pd.DataFrame:
+        """
+        Materialize a table
+        """
+        rows = []
+        with self.lock:
+            for row_hash in table_ref.row_hashes:
+                frame_index, position = self.index[row_hash]
+                frame = self.get_frame(frame_index)
+                rows.append([frame['data'][frame['columns'][c]][position] for c in table_ref.columns])
+        df = pd.DataFrame(rows, columns=list(table_ref.columns))
+        try:
+            df = df.astype(table_ref.dtypes)
+        except (ValueError, TypeError):
+            pass  # Keep the inferred types
+        return df
+
+    def add_database(self, database: dict) -> 'EventDatabase':
+        """
+        Add an event database to the pool
+        :param database: The event database (table name -> DataFrame)
+        :return: The lazy event database
+        """
+        if isinstance(database, EventDatabase):
+            database = database.to_dict()
+        event_database = EventDatabase({table_name: self.add_table(table_name, df)
+                                        for table_name, df in database.items()})
+        event_database.attach(self)
+        return event_database
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class TableRef:
+    """
+    The reference of an event table: the columns, their types and the rows content addresses
+    """
+
+    def __init__(self, columns: tuple, dtypes: dict, row_hashes: list[str]):
+        self.columns = columns
+        self.dtypes = dtypes
+        self.row_hashes = row_hashes
+
+
+class EventDatabase(Mapping):
+    """
+    A lazy event database (table name -> DataFrame). Only the tables references are pickled with the event, the
+    tables are materialized from the rows pool on first access.
+    """
+
+    def __init__(self, tables: dict[str, TableRef]):
+        self.tables = tables
+        self.pool = None
+        self.materialized = {}
+
+    def attach(self, pool: RowPool):
+        self.pool = pool
+
+    def __getitem__(self, table_name: str) -> pd.DataFrame:
+        if table_name not in self.materialized:
+            self.materialized[table_name] = self.pool.get_table(self.tables[table_name])
+        return self.materialized[table_name]
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def to_dict(self) -> dict[str, pd.DataFrame]:
+        """
+        Materialize a new copy of all the tables (so a dialog can modify it)
+        """
+        return {table_name: self.pool.get_table(table_ref) for table_name, table_ref in self.tables.items()}
+
+    def __getstate__(self):
+        return {'tables': self.tables}
+
+    def __setstate__(self, state):
+        self.tables = state['tables']
+        self.pool = None
+        self.materialized = {}
+
+
+class DialogDatabase(dict):
+    """
+    The tables of a dialog. Unlike a plain dict, the dialog tools can attach their state to it (so the state is
+    released with the dialog data)
+    """
+
+
+def materialize_database(database) -> dict[str, pd.DataFrame]:
+    """
+    Get the event database as a dict of DataFrames (a new mapping, a lazy database is materialized to a new copy)
+    """
+    if isinstance(database, EventDatabase):
+        return DialogDatabase(database.to_dict())
+    if isinstance(database, dict):
+        return DialogDatabase(database)
+    return database
@@ -0,0 +1,207 @@
+import os
+import json
+import pickle
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import List, Optional
+from simulator.dataset.definitions import Event
+from simulator.dataset.event_database import RowPool, EventDatabase, ROWS_EXTENSION
+from simulator.utils.logger_config import get_logger, ConsoleColor
+
+# The record frame header: magic, metadata length, payload length, crc32 of the metadata and the payload
+FRAME_HEADER = struct.Struct('<4sIII')
+FRAME_MAGIC = b'EVT1'
+
+# The store files extensions (the segment is the dataset path, the manifest and the rows pool are next to it)
+SEGMENT_EXTENSION = 'events'
+MANIFEST_EXTENSION = 'manifest.json'
+
+
+def get_manifest_path(segment_path: str) -> str:
+    return os.path.splitext(segment_path)[0] + '.' + MANIFEST_EXTENSION
+
+
+def get_rows_path(segment_path: str) -> str:
+    return os.path.splitext(segment_path)[0] + '.' + ROWS_EXTENSION
+
+
+def get_event_metadata(event: Event) -> dict:
+    """
+    The event metadata that is kept in memory (so the dataset statistics do not load the events)
+    """
+    return {'id': event.id,
+            'challenge_level': event.description.challenge_level,
+            'n_policies': len(event.description.policies)}
+
+
+class EventStore:
+    """
+    An append-only event store: each event is a single frame in a segment file, and the iteration number and the
+    cost are kept in a small manifest. An append writes the whole frame with one write call and fsyncs it, and the
+    manifest is replaced atomically, so a crash can only lose the frame that was being written (a torn frame is
+    truncated when the store is opened). The events payload is read lazily, only the metadata is kept in memory.
+    The events databases are stored in a shared, deduplicated rows pool (see RowPool), and the event frame keeps
+    only the tables references. The rows are written before the event frame, so an event never misses its rows.
+    """
+
+    def __init__(self, path: str, cache_size: int = 64):
+        """
+        Open (or create) the store.
+        :param path: The segment file path
+        :param cache_size: The number of loaded events kept in memory
+        """
+        self.path = path
+        self.manifest_path = get_manifest_path(path)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.offsets = []  # The (payload offset, payload length) of each event
+        self.metadata = []
+        self.iteration_num = 0
+        self.cost = 0
+        self.lock = threading.Lock()
+        if os.path.isfile(self.manifest_path):
+            manifest = json.load(open(self.manifest_path, 'r'))
+            self.iteration_num = manifest['iteration_num']
+            self.cost = manifest['cost']
+        self.scan()
+        self.pool = RowPool(get_rows_path(path))
+        self.file = open(self.path, 'ab')
+        self.records = EventRecords(self)
+
+    def scan(self):
+        """
+        Read the frames headers and metadata (the payloads are skipped), and truncate a torn last frame
+        """
+        if not os.path.isfile(self.path):
+            return
+        valid_end = 0
+        with open(self.path, 'rb') as f:
+            while True:
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    break
+                magic, meta_len, payload_len, crc = FRAME_HEADER.unpack(header)
+                if magic != FRAME_MAGIC:
+                    break
+                meta = f.read(meta_len)
+                payload = f.read(payload_len)
+                if len(payload) < payload_len or zlib.crc32(payload, zlib.crc32(meta)) != crc:
+                    break
+                self.metadata.append(json.loads(meta))
+                self.offsets.append((valid_end + FRAME_HEADER.size + meta_len, payload_len))
+                valid_end = f.tell()
+        if valid_end < os.path.getsize(self.path):
+            get_logger().warning(f'{ConsoleColor.RED}The last event of {self.path} is corrupted (interrupted write), '
+                                 f'it is removed from the dataset{ConsoleColor.RESET}')
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, events: List[Event]):
+        """
+        Append events to the store, the events ids are set according to their position
+        """
+        with self.lock:
+            for event in events:
+                event.id = len(self.offsets) + 1
+                if event.database:
+                    event.database = self.pool.add_database(event.database)
+                meta = json.dumps(get_event_metadata(event)).encode('utf-8')
+                payload = pickle.dumps(event, protocol=pickle.HIGHEST_PROTOCOL)
+                crc = zlib.crc32(payload, zlib.crc32(meta))
+                offset = self.file.tell()
+                self.file.write(FRAME_HEADER.pack(FRAME_MAGIC, len(meta), len(payload), crc) + meta + payload)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.offsets.append((offset + FRAME_HEADER.size + len(meta), len(payload)))
+                self.metadata.append(get_event_metadata(event))
+                self.cache_event(len(self.offsets) - 1, event)
+
+    def commit(self, iteration_num: int, cost: float):
+        """
+        Atomically update the manifest
+        :param iteration_num: The current iteration number
+        :param cost: The dataset cost so far
+        """
+        with self.lock:
+            self.iteration_num = iteration_num
+            self.cost = cost
+            tmp_path = self.manifest_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'n_events': len(self.offsets), 'iteration_num': iteration_num, 'cost': cost}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.manifest_path)
+
+    def cache_event(self, index: int, event: Event):
+        self.cache[index] = event
+        self.cache.move_to_end(index)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def get(self, index: int) -> Event:
+        """
+        Load a single event
+        :param index: The event index (event id - 1)
+        """
+        with self.lock:
+            if index in self.cache:
+                self.cache.move_to_end(index)
+                return self.cache[index]
+            offset, length = self.offsets[index]
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                event = pickle.loads(f.read(length))
+            if isinstance(event.database, EventDatabase):
+                event.database.attach(self.pool)
+            self.cache_event(index, event)
+            return event
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        self.pool.close()
+
+
+class EventRecords(Sequence):
+    """
+    A read only, lazily loaded view of the store events (supports len, indexing, slicing and iteration)
+    """
+
+    def __init__(self, store: EventStore):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.store.get(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('event index out of range')
+        return self.store.get(index)
+
+
+def migrate_pickle_dataset(pickle_path: str, path: Optional[str] = None) -> str:
+    """
+    Convert a pickle dataset dump (records, iteration_num, dataset_cost) to an event store
+    :param pickle_path: The pickle dump path
+    :param path: The store segment path (default: the pickle path with the events extension)
+    :return: The store segment path
+    """
+    if path is None:
+        path = os.path.splitext(pickle_path)[0] + '.' + SEGMENT_EXTENSION
+    records, iteration_num, dataset_cost = pickle.load(open(pickle_path, 'rb'))
+    store = EventStore(path)
+    if len(store) == 0:
+        store.append(records)
+        store.commit(iteration_num, dataset_cost)
+    store.close()
+    return path
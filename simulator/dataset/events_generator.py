@@ -1,7 +1,7 @@
 from simulator.agents_graphs.langgraph_tool import AgentTools
 from simulator.agents_graphs.event_graph import EventGraph
 import json
-from langchain import hub
+from simulator.utils.prompt_registry import pull_prompt
 from simulator.env import Env
 from typing_extensions import Annotated
 from langgraph.prebuilt import InjectedState
@@ -10,7 +10,7 @@ from simulator.dataset.definitions import *
 from simulator.utils.llm_utils import dict_to_str, set_llm_chain
 from simulator.utils.llm_utils import get_llm, set_callback
 from simulator.dataset.descriptor_generator import Description
-from simulator.utils.parallelism import async_batch_invoke
+from simulator.utils.parallelism import async_batch_invoke, PipelineStage
 from typing import Tuple
 from simulator.healthcare_analytics import ExceptionEvent, track_event
 
@@ -55,7 +55,7 @@ class EventsGenerator:
                 infer_schema=True,
             )
 
-            system_messages = hub.pull(self.config['event_graph']['prompt_executors']['prompt_hub_name'])
+            system_messages = pull_prompt(self.config['event_graph']['prompt_executors']['prompt_hub_name'])
             system_messages = system_messages.partial(schema=self.env.data_schema[table_name],
                                                       example=json.dumps(rows_data[table_name]))
             agent_executor = AgentTools(llm=self.llm, tools=[think, table_insertion_tools[table_name]],
@@ -84,7 +84,7 @@ class EventsGenerator:
         return tool_function, add_row_input
 
     def get_planner_prompt(self):
-        prompt = hub.pull("eladlev/planner_event_generator")
+        prompt = pull_prompt("eladlev/planner_event_generator")
         return prompt.partial(tables_info=dict_to_str(self.env.data_schema))
 
     def init_agent(self):
@@ -143,9 +143,29 @@ class EventsGenerator:
         res = async_batch_invoke(self.asymbolic_to_event, symbolic_events, num_workers=num_workers,
                                  callbacks=self.callbacks, timeout=timeout)
         all_events = [r['result'] for r in res if r['error'] is None]
-        total_cost = sum([r['usage'] for r in res if r['error'] is None])
+        total_cost = sum([r['usage'] for r in res])  # Including the cost of failed attempts
         return all_events, total_cost
 
+    async def adescription_to_symbolic(self, description: Description) -> EventSymbolic:
+        """
+        Generate the symbolic variables representation of a single description.
+        :param description: The description of the event
+        :return: The symbolic event
+        """
+        symbolic_info = await self.llm_symbolic.ainvoke({"tables_info": dict_to_str(self.env.data_schema),
+                                                         'scenario': description.event_description})
+        return EventSymbolic(symbolic_info=symbolic_info, description=description)
+
+    async def aget_symbolic_constraints(self, event: EventSymbolic) -> EventSymbolic:
+        """
+        Generate the policies constraints of a single symbolic event.
+        :param event: The symbolic event
+        :return: The symbolic event with the policies constraints
+        """
+        result = await self.llm_constraints.ainvoke({"symbolic_info": str(event), 'system_prompt': self.env.prompt})
+        event.policies_constraints = result.content
+        return event
+
     def descriptions_to_symbolic(self, descriptions: list[Description]) -> tuple[list[EventSymbolic], float]:
         """
         Generate symbolic variables representations based on the given descriptions.
@@ -153,22 +173,13 @@ class EventsGenerator:
         :return: The symbolic event including: enriched scenario with variables, symbolic variables list, the relations between the symbols, and tables rows.
                  The cost of the step.
         """
-        samples_batch = []
-        cost = 0
-        schema = dict_to_str(self.env.data_schema)
-        for i, description in enumerate(descriptions):
-            samples_batch.append({"tables_info": schema, 'scenario': description.event_description})
         num_workers = self.config['symbolic_enrichment_config'].get('num_workers', 1)
         timeout = self.config['symbolic_enrichment_config'].get('timeout', 40)
-        res = async_batch_invoke(self.llm_symbolic.ainvoke, samples_batch, num_workers=num_workers,
-                                 callbacks=self.callbacks, timeout=timeout)
-        events_info = []
-        for result in res:
-            if result['error'] is not None:
-                continue
-            cost += result['usage']
-            cur_event = EventSymbolic(symbolic_info=result['result'], description=descriptions[result['index']])
-            events_info.append(cur_event)
+        res = async_batch_invoke(self.adescription_to_symbolic, descriptions, num_workers=num_workers,
+                                 callbacks=self.callbacks, timeout=timeout, latency_signal=True)
+        res = sorted([r for r in res if r['error'] is None], key=lambda r: r['index'])
+        events_info = [r['result'] for r in res]
+        cost = sum([r['usage'] for r in res])
         return events_info, cost
 
     def get_symbolic_constraints(self, events: list[EventSymbolic]) -> Tuple[list[EventSymbolic], float]:
@@ -177,17 +188,32 @@ class EventsGenerator:
         :param events: The symbolic events
         :return: The symbolic events with the policies constraints and the cost of the step.
         """
-        samples_batch = []
-        cost = 0
-        for i, event in enumerate(events):
-            samples_batch.append({"symbolic_info": str(event), 'system_prompt': self.env.prompt})
         num_workers = self.config['symbolic_constraints_config'].get('num_workers', 1)
         timeout = self.config['symbolic_constraints_config'].get('timeout', 40)
-        res = async_batch_invoke(self.llm_constraints.ainvoke, samples_batch, num_workers=num_workers,
-                                 callbacks=self.callbacks, timeout=timeout)
-        for result in res:
-            if result['error'] is not None:
-                continue
-            cost += result['usage']
-            events[result['index']].policies_constraints = result['result'].content
+        res = async_batch_invoke(self.aget_symbolic_constraints, events, num_workers=num_workers,
+                                 callbacks=self.callbacks, timeout=timeout, latency_signal=True)
+        cost = sum([r['usage'] for r in res])
+        for r in res:
+            if r['error'] is not None:  # The event is kept without constraints
+                events[r['index']].policies_constraints = ''
         return events, cost
+
+    def get_pipeline_stages(self) -> list[PipelineStage]:
+        """
+        The stages of the streaming events generation pipeline (from a description to an event). Unlike
+        get_symbolic_constraints, an event whose constraints call failed (after its retries) is dropped, and the
+        streaming generation samples its difficulty again.
+        :return: The pipeline stages: symbolic enrichment, symbolic constraints and the event graph
+        """
+        return [PipelineStage(name='symbolic_enrichment', function=self.adescription_to_symbolic,
+                              num_workers=self.config['symbolic_enrichment_config'].get('num_workers', 1),
+                              timeout=self.config['symbolic_enrichment_config'].get('timeout', 40),
+                              callbacks=self.callbacks),
+                PipelineStage(name='symbolic_constraints', function=self.aget_symbolic_constraints,
+                              num_workers=self.config['symbolic_constraints_config'].get('num_workers', 1),
+                              timeout=self.config['symbolic_constraints_config'].get('timeout', 40),
+                              callbacks=self.callbacks),
+                PipelineStage(name='event_graph', function=self.asymbolic_to_event,
+                              num_workers=self.config['event_graph']['num_workers'],
+                              timeout=self.config['event_graph']['timeout'],
+                              callbacks=self.callbacks)]
@@ -0,0 +1,268 @@
+import struct
+import zipfile
+import numpy as np
+import networkx as nx
+
+# The arrays of a frozen policies graph (all of them are saved to the npz file)
+GRAPH_ARRAYS = ('indptr', 'indices', 'weights', 'scores', 'alias_prob', 'alias_index')
+
+# The default configuration of the graph sparsification (edge_config.sparsify)
+SPARSIFY_CONFIG = {'enabled': True,
+                   'top_k': 20,  # The number of the heaviest edges that are kept for each policy
+                   'min_weight': 2}  # Lighter edges are dropped (unless they are needed to keep the graph connected)
+
+
+def get_graph_nbytes(n_nodes: int, n_edges: int) -> int:
+    """
+    The size of a frozen graph arrays (each undirected edge is stored in both adjacency rows)
+    """
+    return (n_nodes + 1) * 8 + n_nodes * 4 + 2 * n_edges * (4 + 4 + 4 + 8)
+
+
+def sparsify_edges(n_nodes: int, edges: list[tuple], top_k: int, min_weight: float) -> list[tuple]:
+    """
+    Sparsify the policies graph: keep the top_k heaviest edges of each node with a weight of at least min_weight.
+    The graph connectivity is kept by adding the heaviest of the dropped edges that connect different components
+    (a maximum spanning forest over the components of the kept edges).
+    :param n_nodes: The number of nodes
+    :param edges: The edges (u, v, {'weight': w})
+    :param top_k: The number of edges kept per node
+    :param min_weight: The minimal weight of a kept edge
+    :return: The kept edges
+    """
+    if not edges:
+        return edges
+    u = np.array([edge[0] for edge in edges], dtype=np.int64)
+    v = np.array([edge[1] for edge in edges], dtype=np.int64)
+    weights = np.array([edge[2]['weight'] for edge in edges], dtype=np.float64)
+    # Each edge appears in the rows of both its nodes, the rows are sorted by node and then by decreasing weight
+    rows = np.concatenate([u, v])
+    edge_ids = np.concatenate([np.arange(len(edges))] * 2)
+    order = np.lexsort((-weights[edge_ids], rows))
+    rows, edge_ids = rows[order], edge_ids[order]
+    row_start = np.searchsorted(rows, np.arange(n_nodes))
+    rank = np.arange(len(rows)) - row_start[rows]
+    keep = np.zeros(len(edges), dtype=bool)
+    keep[edge_ids[(rank < top_k) & (weights[edge_ids] >= min_weight)]] = True
+
+    parent = list(range(n_nodes))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i in np.flatnonzero(keep):
+        parent[find(u[i])] = find(v[i])
+    for i in np.flatnonzero(~keep)[np.argsort(-weights[~keep], kind='stable')]:
+        root_u, root_v = find(u[i]), find(v[i])
+        if root_u != root_v:
+            parent[root_u] = root_v
+            keep[i] = True
+    return [edge for edge, kept in zip(edges, keep) if kept]
+
+
+def load_npz_mmap(path: str) -> dict[str, np.ndarray]:
+    """
+    Memory map the arrays of an uncompressed npz file (np.load does not memory map npz members). Compressed members
+    are read to memory.
+    :param path: The npz file path
+    :return: The arrays by name
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        for info in zf.infolist():
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with zf.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            name_len, extra_len = struct.unpack('<HH', local_header[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                     order='F' if fortran_order else 'C')
+    return arrays
+
+
+class PolicyGraph:
+    """
+    A frozen policies graph: a CSR adjacency (indptr, indices, weights) with the policies challenge scores. Each
+    adjacency row has a Vose alias table, so a weighted neighbor is sampled in O(1), and many paths are sampled at
+    once with vectorized numpy steps.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray, scores: np.ndarray,
+                 alias_prob: np.ndarray = None, alias_index: np.ndarray = None):
+        """
+        :param indptr: The row offsets of the adjacency (size n_nodes + 1)
+        :param indices: The neighbors of each row
+        :param weights: The edges weights (aligned to indices)
+        :param scores: The challenge score of each node
+        :param alias_prob: The alias tables acceptance probability (aligned to indices), computed if not provided
+        :param alias_index: The alias tables fallback edge (aligned to indices), computed if not provided
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.scores = scores
+        if alias_prob is None or alias_index is None:
+            alias_prob, alias_index = self.build_alias_tables()
+        self.alias_prob = alias_prob
+        self.alias_index = alias_index
+        cumulative_weight = np.concatenate([[0], np.cumsum(weights, dtype=np.float64)])
+        self.row_weight = cumulative_weight[indptr[1:]] - cumulative_weight[indptr[:-1]]
+
+    @classmethod
+    def from_networkx(cls, G: nx.Graph, nodes: list[dict]) -> 'PolicyGraph':
+        """
+        Freeze a networkx policies graph
+        :param G: The graph, the nodes are the positions in the nodes list and the edges have a 'weight'
+        :param nodes: The policies, each with a 'score'
+        """
+        n = len(nodes)
+        neighbors = [[] for _ in range(n)]
+        for u, v, data in G.edges(data=True):
+            neighbors[u].append((v, data.get('weight', 1)))
+            neighbors[v].append((u, data.get('weight', 1)))
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(row) for row in neighbors])
+        indices = np.array([v for row in neighbors for v, _ in row], dtype=np.int32)
+        weights = np.array([w for row in neighbors for _, w in row], dtype=np.float32)
+        scores = np.array([node['score'] for node in nodes], dtype=np.float32)
+        return cls(indptr, indices, weights, scores)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'PolicyGraph':
+        """
+        Load a frozen graph
+        :param path: The npz file path
+        :param mmap: If True, the arrays are memory mapped
+        """
+        if mmap:
+            arrays = load_npz_mmap(path)
+        else:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        return cls(**{name: arrays[name] for name in GRAPH_ARRAYS})
+
+    def save(self, path: str):
+        """
+        Save the graph as an uncompressed (memory mappable) npz file
+        """
+        np.savez(path, **{name: np.asarray(getattr(self, name)) for name in GRAPH_ARRAYS})
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.scores)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices) // 2
+
+    @property
+    def nbytes(self) -> int:
+        return sum(np.asarray(getattr(self, name)).nbytes for name in GRAPH_ARRAYS)
+
+    def build_alias_tables(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Build the Vose alias table of each adjacency row
+        """
+        alias_prob = np.ones(len(self.indices), dtype=np.float32)
+        alias_index = np.arange(len(self.indices), dtype=np.int64)
+        for node in range(len(self.indptr) - 1):
+            start, end = int(self.indptr[node]), int(self.indptr[node + 1])
+            total = float(self.weights[start:end].sum())
+            if end - start < 2 or total <= 0:
+                continue
+            prob = self.weights[start:end] * (end - start) / total
+            small = [i for i in range(end - start) if prob[i] < 1]
+            large = [i for i in range(end - start) if prob[i] >= 1]
+            while small and large:
+                s, l = small.pop(), large[-1]
+                alias_prob[start + s] = prob[s]
+                alias_index[start + s] = start + l
+                prob[l] -= 1 - prob[s]
+                if prob[l] < 1:
+                    small.append(large.pop())
+        return alias_prob, alias_index
+
+    def sample_neighbors(self, nodes: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        Sample a weighted neighbor of each node
+        :return: The neighbors, -1 for nodes without positive weight edges
+        """
+        if len(self.indices) == 0:
+            return np.full(len(nodes), -1)
+        start = self.indptr[nodes]
+        degree = self.indptr[nodes + 1] - start
+        valid = self.row_weight[nodes] > 0
+        edge = np.where(valid, start + (rng.random(len(nodes)) * degree).astype(np.int64), 0)
+        edge = np.where(rng.random(len(nodes)) < self.alias_prob[edge], edge, self.alias_index[edge])
+        return np.where(valid, self.indices[edge], -1)
+
+    def sample_paths(self, thresholds: list[float], rng: np.random.Generator = None,
+                     max_rejections: int = 8) -> list[tuple[list[int], int]]:
+        """
+        Sample paths from the graph. Each path starts from a random node and moves to a weighted random unvisited
+        neighbor until the path score sum reaches its threshold. A visited neighbor is rejected and sampled again;
+        after max_rejections the neighbor is drawn from the exact unvisited neighbors distribution. On a dead end
+        (no unvisited neighbor with a positive weight) the path continues from a random unvisited node, and it stops
+        if all the nodes were visited.
+        :param thresholds: The score threshold of each path
+        :param rng: The random generator
+        :param max_rejections: The number of vectorized resampling rounds of visited neighbors
+        :return: The nodes and the score sum of each path
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        n_paths = len(thresholds)
+        if n_paths == 0:
+            return []
+        visited = np.zeros((n_paths, self.n_nodes), dtype=bool)
+        current = rng.integers(self.n_nodes, size=n_paths)
+        visited[np.arange(n_paths), current] = True
+        paths = [[int(node)] for node in current]
+        path_sum = self.scores[current].astype(np.float64)
+        path_length = np.ones(n_paths, dtype=np.int64)
+        active = np.flatnonzero((path_sum < thresholds) & (path_length < self.n_nodes))
+        while len(active):
+            next_nodes = self.sample_neighbors(current[active], rng)
+            for _ in range(max_rejections):
+                rejected = (next_nodes < 0) | visited[active, np.maximum(next_nodes, 0)]
+                retry = np.flatnonzero(rejected & (next_nodes >= 0))
+                if len(retry) == 0:
+                    break
+                next_nodes[retry] = self.sample_neighbors(current[active[retry]], rng)
+            rejected = (next_nodes < 0) | visited[active, np.maximum(next_nodes, 0)]
+            for i in np.flatnonzero(rejected):
+                next_nodes[i] = self.sample_unvisited(int(current[active[i]]), visited[active[i]], rng)
+            current[active] = next_nodes
+            visited[active, next_nodes] = True
+            path_sum[active] += self.scores[next_nodes]
+            path_length[active] += 1
+            for path_index, node in zip(active, next_nodes):
+                paths[path_index].append(int(node))
+            active = active[(path_sum[active] < thresholds[active]) & (path_length[active] < self.n_nodes)]
+        return [(path, int(total)) for path, total in zip(paths, path_sum)]
+
+    def sample_unvisited(self, node: int, visited: np.ndarray, rng: np.random.Generator) -> int:
+        """
+        Sample a weighted unvisited neighbor of a node, or a random unvisited node on a dead end
+        """
+        start, end = int(self.indptr[node]), int(self.indptr[node + 1])
+        neighbors = np.asarray(self.indices[start:end])
+        weights = np.asarray(self.weights[start:end], dtype=np.float64) * ~visited[neighbors]
+        if weights.sum() > 0:
+            return int(neighbors[rng.choice(len(neighbors), p=weights / weights.sum())])
+        return int(rng.choice(np.flatnonzero(~visited)))
@@ -0,0 +1,111 @@
+import hashlib
+import numpy as np
+from simulator.dataset.candidate_pruning import STOP_WORDS, tfidf_vectors
+
+
+def get_paragraphs(prompt: str) -> list[str]:
+    """
+    The (unique) paragraphs of a prompt, in order
+    """
+    return list(dict.fromkeys(p.strip() for p in prompt.split('\n\n') if p.strip()))
+
+
+def get_paragraph_key(paragraph: str) -> str:
+    """
+    The content hash of a prompt paragraph
+    """
+    return hashlib.sha1(paragraph.strip().encode('utf-8')).hexdigest()
+
+
+def text_similarity(texts: list[str], others: list[str]) -> np.ndarray:
+    """
+    The cosine similarity of each text to each of the other texts. The stop words and the n-grams that appear in all
+    the texts are ignored, so unrelated texts have a zero similarity
+    :return: A matrix of shape (len(texts), len(others))
+    """
+    vectors = tfidf_vectors(texts + others, stop_words=STOP_WORDS, smooth_idf=False)
+    return vectors[:len(texts)] @ vectors[len(texts):].T
+
+
+def get_flow_text(flow: str, policies: list[dict]) -> str:
+    return flow + '\n' + '\n'.join(policy['policy'] for policy in policies)
+
+
+def get_flow_sources(prompt: str, policies: dict[str, list[dict]]) -> dict[str, set[str]]:
+    """
+    The source paragraphs of each flow: the content hashes of the prompt paragraphs its policies were extracted from
+    (the most similar paragraph of each policy)
+    :param prompt: The prompt the policies were extracted from
+    :param policies: The policies of each flow
+    """
+    paragraphs = get_paragraphs(prompt)
+    sources = {flow: set() for flow in policies}
+    items = [(flow, policy['policy']) for flow, flow_policies in policies.items() for policy in flow_policies]
+    if not paragraphs or not items:
+        return sources
+    keys = [get_paragraph_key(paragraph) for paragraph in paragraphs]
+    similarity = text_similarity([policy for _, policy in items], paragraphs)
+    for (flow, _), sim in zip(items, similarity):
+        if sim.max() > 0:
+            sources[flow].add(keys[int(sim.argmax())])
+    return sources
+
+
+def match_flows(prompt: str, flows: list[str], previous_prompt: str,
+                previous_policies: dict[str, list[dict]]) -> dict[str, str]:
+    """
+    Match the flows of a new prompt version to the flows of the previous version. A flow is matched by its name, or
+    (if the flow extraction reworded its name) to a previous flow whose source paragraphs contain the paragraph that
+    is the most similar to the new flow name
+    :param prompt: The new prompt
+    :param flows: The flows of the new prompt
+    :param previous_prompt: The previous prompt
+    :param previous_policies: The policies of each flow of the previous prompt
+    :return: The matched previous flow of each new flow (the new flows are not included)
+    """
+    matches = {flow: flow for flow in flows if flow in previous_policies}
+    new_flows = [flow for flow in flows if flow not in matches]
+    old_flows = [flow for flow in previous_policies if flow not in matches]
+    paragraphs = get_paragraphs(prompt)
+    if not new_flows or not old_flows or not paragraphs:
+        return matches
+    sources = get_flow_sources(previous_prompt, {flow: previous_policies[flow] for flow in old_flows})
+    anchors = text_similarity(new_flows, paragraphs)
+    names = text_similarity(new_flows, [get_flow_text(flow, previous_policies[flow]) for flow in old_flows])
+    candidates = []
+    for i, flow in enumerate(new_flows):
+        if anchors[i].max() <= 0:
+            continue
+        anchor = get_paragraph_key(paragraphs[int(anchors[i].argmax())])
+        candidates += [(names[i, j], flow, old_flow) for j, old_flow in enumerate(old_flows)
+                       if anchor in sources[old_flow]]
+    # The most similar names are matched first, each previous flow is matched at most once
+    for _, flow, old_flow in sorted(candidates, key=lambda candidate: -candidate[0]):
+        if flow not in matches and old_flow not in matches.values():
+            matches[flow] = old_flow
+    return matches
+
+
+def get_changed_flows(prompt: str, flows: list[str], previous_prompt: str, previous_policies: dict[str, list[dict]],
+                      matches: dict[str, str]) -> list[str]:
+    """
+    Get the flows that should be broken to policies again after the prompt was changed: the new flows, the flows
+    that one of their source paragraphs was edited or removed, and the flows an added paragraph is the most similar to.
+    The paragraphs are compared by their content hashes, so the unchanged flows are never extracted again
+    :param prompt: The new prompt
+    :param flows: The flows of the new prompt
+    :param previous_prompt: The previous prompt
+    :param previous_policies: The policies of each flow of the previous prompt
+    :param matches: The matched previous flow of each new flow (see match_flows)
+    """
+    paragraphs = {get_paragraph_key(paragraph): paragraph for paragraph in get_paragraphs(prompt)}
+    previous_keys = {get_paragraph_key(paragraph) for paragraph in get_paragraphs(previous_prompt)}
+    sources = get_flow_sources(previous_prompt, {flow: previous_policies[flow] for flow in set(matches.values())})
+    changed = {flow for flow in flows if flow not in matches or not sources[matches[flow]] <= paragraphs.keys()}
+    added = [paragraph for key, paragraph in paragraphs.items() if key not in previous_keys]
+    if added and flows:
+        flows_text = [get_flow_text(flow, previous_policies.get(matches.get(flow), [])) for flow in flows]
+        for sim in text_similarity(added, flows_text):
+            if sim.max() > 0:
+                changed.add(flows[int(sim.argmax())])
+    return [flow for flow in flows if flow in changed]
@@ -5,12 +5,15 @@ from simulator.agents_graphs.dialog_graph import Dialog
 from simulator.agents_graphs.langgraph_tool import AgentTools
 import re
 from langchain_core.messages import AIMessage
-from simulator.utils.llm_utils import get_llm, set_callback, get_prompt_template, set_llm_chain
+from simulator.utils.llm_utils import get_llm, set_callback, get_prompt_template, set_llm_chain, \
+    convert_messages_to_str
 from simulator.dataset.events_generator import Event
+from simulator.dataset.event_database import materialize_database
 import uuid
 from simulator.utils.sqlite_handler import SqliteSaver
-from simulator.utils.parallelism import async_batch_invoke
+from simulator.utils.parallelism import async_batch_invoke, PipelineStage
 from simulator.dialog.utils import intermediate_processing
+from simulator.dialog.result_journal import get_dialog_record
 from simulator.utils.logger_config import get_logger, ConsoleColor
 
 class DialogManager:
@@ -115,11 +118,17 @@ class DialogManager:
         user_prompt_params = user_prompt_params if user_prompt_params is not None else {}
         user_messages = self.user_prompt.format_messages(**user_prompt_params)
         recursion_limit = self.config.get('recursion_limit', 25)
-        return self.dialog.invoke(input={"user_messages": user_messages,
-                                         "chatbot_messages": self.chatbot_initial_messages,
-                                         "chatbot_args": chatbot_env_args,
-                                         "thread_id": str(uuid.uuid4()),
-                                         "user_thoughts": []}, config={'recursion_limit': recursion_limit})
+        thread_id = str(uuid.uuid4())
+        try:
+            return self.dialog.invoke(input={"user_messages": user_messages,
+                                             "chatbot_messages": self.chatbot_initial_messages,
+                                             "chatbot_args": chatbot_env_args,
+                                             "thread_id": thread_id,
+                                             "user_thoughts": []}, config={'recursion_limit': recursion_limit})
+        except BaseException:
+            # A failed dialog is retried with a new thread, so its partial thread is removed from the memory
+            self.memory.delete_thread(thread_id)
+            raise
 
     async def arun(self, user_prompt_params=None, chatbot_env_args=None):
         """
@@ -133,11 +142,18 @@ class DialogManager:
         user_prompt_params = user_prompt_params if user_prompt_params is not None else {}
         user_messages = self.user_prompt.format_messages(**user_prompt_params)
         recursion_limit = self.config.get('recursion_limit', 25)
-        return await self.dialog.ainvoke(input={"user_messages": user_messages,
-                                                "chatbot_messages": self.chatbot_initial_messages,
-                                                "chatbot_args": chatbot_env_args,
-                                                "thread_id": str(uuid.uuid4()),
-                                                "user_thoughts": []}, config={'recursion_limit': recursion_limit})
+        thread_id = str(uuid.uuid4())
+        try:
+            return await self.dialog.ainvoke(input={"user_messages": user_messages,
+                                                    "chatbot_messages": self.chatbot_initial_messages,
+                                                    "chatbot_args": chatbot_env_args,
+                                                    "thread_id": thread_id,
+                                                    "user_thoughts": []}, config={'recursion_limit': recursion_limit})
+        except BaseException:
+            # A failed (or timed out) dialog is retried with a new thread, so its partial thread is removed from the
+            # memory
+            self.memory.delete_thread(thread_id)
+            raise
 
     def run_event(self, event: Event):
         """
@@ -147,7 +163,7 @@ class DialogManager:
         return self.run(user_prompt_params={'scenario': event.scenario,
                                             'rows': event.relevant_rows,
                                             'expected_behaviour': event.description.expected_behaviour},
-                        chatbot_env_args={'data': event.database})
+                        chatbot_env_args={'data': materialize_database(event.database)})
 
     async def arun_event(self, event: Event):
         """
@@ -157,7 +173,23 @@ class DialogManager:
         return await self.arun(user_prompt_params={'scenario': event.scenario,
                                                    'rows': event.relevant_rows,
                                                    'expected_behaviour': event.description.expected_behaviour},
-                               chatbot_env_args={'data': event.database})
+                               chatbot_env_args={'data': materialize_database(event.database)})
+
+    async def arun_event_result(self, event: Event) -> dict:
+        """
+        Run the dialog on the event asynchronously, and return it in the simulator results format (the dialog
+        summary, the messages are kept in the memory).
+        :param event: The event to run.
+        """
+        return {'res': get_dialog_record(await self.arun_event(event)), 'event_id': event.id}
+
+    def get_pipeline_stage(self) -> PipelineStage:
+        """
+        The dialog stage of a streaming pipeline (from an event to a simulator result)
+        """
+        return PipelineStage(name='dialog', function=self.arun_event_result,
+                             num_workers=self.config['num_workers'], timeout=self.config['timeout'],
+                             callbacks=self.callbacks)
 
     def run_events(self, events: list[Event]):
         """
@@ -166,6 +198,23 @@ class DialogManager:
         """
         res = async_batch_invoke(self.arun_event, events, num_workers=self.config['num_workers'],
                                  callbacks=self.callbacks, timeout=self.config['timeout'])
-        final_result = [{'res': r['result'], 'event_id': events[r['index']].id} for r in res if r['error'] is None]
-        cost = sum([r['usage'] for r in res if r['error'] is None])
+        final_result = [{'res': get_dialog_record(r['result']), 'event_id': events[r['index']].id}
+                        for r in res if r['error'] is None]
+        cost = sum([r['usage'] for r in res])  # Including the cost of failed attempts
         return final_result, cost
+
+    def get_conversations(self, thread_ids: list[str]) -> dict[str, str]:
+        """
+        Fetch the conversations of the dialogs from the memory
+        :param thread_ids: The dialogs threads ids
+        :return: A dictionary {thread_id: the conversation text}
+        """
+        initial_messages = convert_messages_to_str(self.chatbot_initial_messages or [])
+        threads = self.memory.read_threads(thread_ids, tables=('Dialog',))
+        conversations = {}
+        for thread_id, tables in threads.items():
+            # The user stop message is not a part of the conversation
+            conversations[thread_id] = initial_messages + ''.join(
+                f"{'user' if role == 'Human' else 'chatbot'}: {message.rstrip(chr(10))}\n"
+                for _, _, role, message, _ in tables['Dialog'] if not (role == 'Human' and '###STOP' in message))
+        return conversations
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import pickle
+import threading
+from typing import Iterator
+from simulator.utils.logger_config import get_logger, ConsoleColor
+
+JOURNAL_FILE = 'results.jsonl'
+LEGACY_DUMP_FILE = 'res_dump.pickle'
+MIGRATED_SUFFIX = '.migrated'
+
+
+def get_dialog_record(state: dict) -> dict:
+    """
+    The summary of a dialog, that is kept instead of the dialog state (the messages are in the experiment memory.db,
+    and they are fetched by the thread_id when they are needed)
+    :param state: The final dialog state
+    """
+    user_thoughts = state.get('user_thoughts', []) or []
+    return {'thread_id': state.get('thread_id'),
+            'stop_signal': state.get('stop_signal', ''),
+            'critique_feedback': state.get('critique_feedback', ''),
+            'user_thought': user_thoughts[-1] if user_thoughts else '',
+            'n_user_messages': len(state.get('user_messages', []) or []),
+            'n_chatbot_messages': len(state.get('chatbot_messages', []) or [])}
+
+
+class ResultJournal:
+    """
+    An append-only journal of the simulation results: one dialog summary line per finished dialog (failed dialogs are
+    journaled too, with their cost). The appends are flushed immediately and fsynced in batches (every fsync_size
+    records or fsync_interval seconds), a torn last line is truncated when the journal is opened. A resumed
+    experiment skips the events that already have a result, and the analysis streams the results from the journal.
+    """
+
+    def __init__(self, experiment_dir: str, fsync_size: int = 10, fsync_interval: float = 5):
+        """
+        Open (or create) the journal.
+        :param experiment_dir: The experiment folder
+        :param fsync_size: The maximal number of records that are not fsynced
+        :param fsync_interval: The maximal time (in seconds) a record is not fsynced
+        """
+        self.path = os.path.join(experiment_dir, JOURNAL_FILE)
+        self.fsync_size = fsync_size
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.completed_events = set()
+        self.n_results = 0
+        self.cost = 0
+        self.pending = 0
+        self.last_fsync = time.monotonic()
+        legacy_path = os.path.join(experiment_dir, LEGACY_DUMP_FILE)
+        if not os.path.isfile(self.path) and os.path.isfile(legacy_path):
+            self.migrate(legacy_path)
+        self.scan()
+        self.file = open(self.path, 'a')
+
+    def scan(self):
+        """
+        Read the completed events and the cost, and truncate a torn last record
+        """
+        if not os.path.isfile(self.path):
+            return
+        valid_end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('Incomplete record')
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.add(record)
+                valid_end += len(line)
+        if valid_end < os.path.getsize(self.path):
+            get_logger().warning(f'{ConsoleColor.RED}The last result of {self.path} is corrupted (interrupted write), '
+                                 f'it is removed from the journal{ConsoleColor.RESET}')
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid_end)
+
+    def add(self, record: dict):
+        self.cost += record.get('usage', 0)
+        if record.get('res') is not None:
+            self.completed_events.add(record['event_id'])
+            self.n_results += 1
+
+    def migrate(self, legacy_path: str):
+        """
+        Convert the results dump of an older experiment (the full dialog states) to the journal. The journal is
+        written to a temporary file and renamed when it is complete, and the dump is kept (with a .migrated suffix),
+        as it holds the only full transcripts of the older experiments
+        """
+        all_res, _, total_cost = pickle.load(open(legacy_path, 'rb'))
+        records = [{'event_id': r['event_id'], 'res': get_dialog_record(r['res']), 'usage': 0, 'error': None}
+                   for r in all_res]
+        records.append({'event_id': None, 'res': None, 'usage': total_cost, 'error': None})
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        os.replace(legacy_path, legacy_path + MIGRATED_SUFFIX)
+
+    def append(self, record: dict):
+        """
+        Append a result record {'event_id', 'res', 'usage', 'error'} ('res' is None for failed dialogs)
+        """
+        line = json.dumps(record, default=str) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.add(record)
+            self.pending += 1
+            if self.pending >= self.fsync_size or time.monotonic() - self.last_fsync > self.fsync_interval:
+                self.fsync()
+
+    def fsync(self):
+        # Lock should be held
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_fsync = time.monotonic()
+
+    def sync(self):
+        with self.lock:
+            if self.pending:
+                self.fsync()
+
+    def iter_results(self) -> Iterator[dict]:
+        """
+        Stream the completed results {'event_id', 'res'} from the journal
+        """
+        self.sync()
+        with open(self.path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get('res') is not None:
+                    yield {'res': record['res'], 'event_id': record['event_id']}
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
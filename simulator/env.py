@@ -2,7 +2,7 @@ import os
 import pandas as pd
 from pathlib import Path
 from simulator.utils.llm_utils import load_tools, set_llm_chain, get_llm
-from langchain import hub
+from simulator.utils.prompt_registry import pull_prompt
 from simulator.utils.logger_config import get_logger, ConsoleColor
 from simulator.utils.file_reading import get_validators_from_module
 
@@ -42,7 +42,7 @@ class Env:
             self.prompt = self.config['prompt']
         elif 'prompt_hub_name' in self.config:
             hub_key = self.config.get("prompt_hub_key", None)
-            self.prompt = hub.pull(self.config['prompt_hub_name'], api_key=hub_key)
+            self.prompt = pull_prompt(self.config['prompt_hub_name'], api_key=hub_key)
         else:
             raise ValueError(
                 "The system prompt is missing, you must provide either prompt, prompt_path or prompt_hub_name")
@@ -1,7 +1,11 @@
 import os
 import json
 import uuid
+import time
+import queue
+import atexit
 import logging
+import threading
 import requests
 from datetime import datetime
 from functools import wraps, lru_cache
@@ -15,6 +19,12 @@ USER_DATA_DIR_NAME = "plurai_analytics"
 DO_NOT_TRACK_ENV = "PLURAI_DO_NOT_TRACK"
 DEBUG_TRACKING_ENV = "PLURAI_DEBUG_TRACKING"
 TRACK_TIMEOUT = 1  # seconds
+TRACK_QUEUE_SIZE = 10000  # Events are dropped (and never block the caller) when the queue is full
+TRACK_BATCH_SIZE = 100  # The maximal number of events that are sent in one flush
+TRACK_FLUSH_INTERVAL = 2  # seconds
+TRACK_EXIT_DEADLINE = 2  # The maximal time (in seconds) that the exit flush may take
+PENDING_EVENTS_FILE = "pending_events.jsonl"  # Events that could not be sent (offline), resent on the next run
+MAX_PENDING_EVENTS = 10000
 
 # Logger setup
 logger = logging.getLogger(__name__)
@@ -111,6 +121,7 @@ class AnalyzeSimulationResultsEvent(BaseEvent):
 class ExceptionEvent(BaseEvent):
     error_message: str
     exception_type: str
+    n_occurrences: int = Field(default=1)  # Identical exceptions of a flush are coalesced to a single event
 
 # Silent Decorator
 def silent(func):
@@ -124,9 +135,183 @@ def silent(func):
             return None
     return wrapper
 
+def coalesce_events(payloads: list[dict]) -> list[dict]:
+    """
+    Coalesce identical exception events (same type and message) to a single event with the number of occurrences
+    """
+    coalesced = []
+    exceptions = {}
+    for payload in payloads:
+        if payload.get("event_type") != "ExceptionEvent":
+            coalesced.append(payload)
+            continue
+        key = (payload.get("exception_type"), payload.get("error_message"))
+        if key in exceptions:
+            exceptions[key]["n_occurrences"] += payload.get("n_occurrences", 1)
+        else:
+            exceptions[key] = payload
+            coalesced.append(payload)
+    return coalesced
+
+
+class TelemetrySink:
+    """
+    A non-blocking events sink: track_event only puts the event payload on a bounded queue, and a background
+    thread sends the events in batches (with a keep-alive session per thread). Events that can not be sent (offline)
+    are spilled to a local JSONL file and resent on the next run. On exit, the queue is flushed with a bounded
+    deadline, and the events that were not sent in time (or that are tracked after the exit) are spilled.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=TRACK_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.stop_event = threading.Event()
+        self.deadline = None  # Set on exit, the events that are not sent before the deadline are spilled
+        self.closed = False  # The events that are put after close are spilled
+        self.local = threading.local()  # The keep-alive session of each thread
+        self.dropped = 0
+        self.spill_path = os.path.join(os.path.expanduser(f"~/.{USER_DATA_DIR_NAME}"), PENDING_EVENTS_FILE)
+
+    def start(self):
+        # The flusher is (re)started lazily, also in forked worker processes where the thread does not exist
+        with self.lock:
+            if self.thread is not None and self.pid == os.getpid():
+                return
+            if self.thread is not None:
+                self.queue = queue.Queue(maxsize=TRACK_QUEUE_SIZE)  # The parent events are sent by the parent
+                self.local = threading.local()  # The parent sessions are not used by the child
+            self.pid = os.getpid()
+            self.stop_event = threading.Event()
+            self.deadline = None
+            self.closed = False
+            self.thread = threading.Thread(target=self.run, name="telemetry-sink", daemon=True)
+            self.thread.start()
+
+    def put(self, payload: dict) -> bool:
+        self.start()
+        with self.lock:
+            if self.closed:
+                # The flusher is stopped, the event is sent by the next run
+                self.spill([payload])
+                return True
+            try:
+                self.queue.put_nowait(payload)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                return False
+
+    def drain(self, max_events: int) -> list[dict]:
+        payloads = []
+        while len(payloads) < max_events:
+            try:
+                payloads.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return [payload for payload in payloads if payload is not None]
+
+    def run(self):
+        self.send(self.load_spilled())
+        while not self.stop_event.is_set():
+            try:
+                payloads = [self.queue.get(timeout=TRACK_FLUSH_INTERVAL)]
+            except queue.Empty:
+                continue
+            payloads = [payload for payload in payloads if payload is not None]  # None wakes up the flusher
+            payloads += self.drain(TRACK_BATCH_SIZE - 1)
+            self.send(coalesce_events(payloads))
+
+    def get_session(self) -> requests.Session:
+        # A session is not thread safe, each thread has its own session
+        if getattr(self.local, "session", None) is None:
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def send(self, payloads: list[dict]):
+        """
+        Send the events, the events that were not sent (offline or after the exit deadline) are spilled
+        """
+        session = self.get_session()
+        for i, payload in enumerate(payloads):
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                self.spill(payloads[i:])
+                return
+            try:
+                response = session.post(USAGE_TRACKING_URL, json=payload, timeout=TRACK_TIMEOUT)
+                response.raise_for_status()
+                logger.info(f"Event sent successfully: {payload}")
+            except requests.HTTPError as e:
+                logger.error(f"HTTP error occurred: {e.response.status_code} - {e.response.text}")
+            except requests.RequestException as e:
+                logger.error(f"Request failed: {e}")
+                self.spill(payloads[i:])
+                return
+
+    def spill(self, payloads: list[dict]):
+        if not payloads:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            with open(self.spill_path, "a") as f:
+                for payload in payloads:
+                    f.write(json.dumps(payload) + "\n")
+        except OSError as e:
+            logger.error(f"Failed to spill the events: {e}")
+
+    def load_spilled(self) -> list[dict]:
+        """
+        Load (and remove) the spilled events of previous runs
+        """
+        if not os.path.isfile(self.spill_path):
+            return []
+        try:
+            tmp_path = f"{self.spill_path}.{os.getpid()}"
+            os.replace(self.spill_path, tmp_path)  # Another process may spill meanwhile
+            with open(tmp_path, "r") as f:
+                payloads = [json.loads(line) for line in f if line.strip()]
+            os.remove(tmp_path)
+            return coalesce_events(payloads[-MAX_PENDING_EVENTS:])
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load the spilled events: {e}")
+            return []
+
+    def close(self, timeout: float = TRACK_EXIT_DEADLINE):
+        """
+        Flush the queued events with a bounded deadline: the flusher finishes its current batch (its events that
+        are not sent before the deadline are spilled), and the rest of the queue is sent by the calling thread
+        """
+        if self.thread is None or self.pid != os.getpid():
+            return
+        with self.lock:
+            self.closed = True
+        self.deadline = time.monotonic() + timeout
+        self.stop_event.set()
+        try:
+            self.queue.put_nowait(None)  # Wake up an idle flusher
+        except queue.Full:
+            pass
+        # A request that started before the deadline ends within TRACK_TIMEOUT
+        self.thread.join(timeout=timeout + TRACK_TIMEOUT)
+        payloads = coalesce_events(self.drain(TRACK_QUEUE_SIZE))
+        if self.thread.is_alive():
+            self.spill(payloads)
+        else:
+            self.send(payloads)
+
+
+telemetry_sink = TelemetrySink()
+atexit.register(telemetry_sink.close)
+
+
 # Send Event Function
 @silent
 def track_event(event: BaseEvent):
+    """
+    Track an event, without blocking the caller (the event is sent by a background thread)
+    :return: True if the event was queued, False if it was dropped
+    """
     if do_not_track():
         logger.info("Tracking is disabled.")
         return
@@ -138,21 +323,8 @@ def track_event(event: BaseEvent):
     if _usage_event_debugging():
         logger.debug(f"Debugging Event Payload: {payload}")
         return True
-    
-    try:
-        response = requests.post(USAGE_TRACKING_URL, json=payload, timeout=TRACK_TIMEOUT)
-        response.raise_for_status()
-        logger.info(f"Event sent successfully: {payload}")
-        return True
-    except requests.Timeout as e:
-        logger.error(f"Request timed out: {e}")
-        return False
-    except requests.HTTPError as e:
-        logger.error(f"HTTP error occurred: {e.response.status_code} - {e.response.text}")
-        return False
-    except requests.RequestException as e:
-        logger.error(f"Request failed: {e}")
-        return False
+
+    return telemetry_sink.put(payload)
 '''
 if __name__ == "__main__":
     # Create a test event
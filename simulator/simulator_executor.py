@@ -1,18 +1,32 @@
 from simulator.env import Env
 import os
-from simulator.dataset.descriptor_generator import DescriptionGenerator
+from simulator.dataset.descriptor_generator import DescriptionGenerator, save_descriptions_generator, \
+    load_descriptions_generator
 from simulator.dataset.events_generator import EventsGenerator
 from simulator.dialog.dialog_manager import DialogManager
+from simulator.dialog.result_journal import ResultJournal
 from simulator.utils.logger_config import update_logger_file, setup_logger, ConsoleColor
-import pickle
 from simulator.utils.file_reading import get_latest_file
 from datetime import datetime
 from simulator.dataset.dataset_handler import Dataset
+from simulator.dataset.event_store import SEGMENT_EXTENSION
 import yaml
 import pandas as pd
 import json
 import uuid
+import queue
+import asyncio
+import itertools
+import threading
+from typing import Callable, Iterable
+from simulator.utils.parallelism import pipeline_ainvoke
 from simulator.utils.analysis import get_dialog_policies
+from simulator.utils.llm_cache import init_llm_cache, log_llm_cache_stats
+from simulator.utils.llm_cassette import init_llm_cassette, log_llm_cassette_stats
+from simulator.utils.concurrency import set_concurrency_config
+from simulator.utils.retry import set_retry_config
+from simulator.utils.llm_clients import set_llm_clients_config, log_llm_clients_stats
+from simulator.utils.prompt_registry import set_prompt_registry_config
 from simulator.healthcare_analytics import (
     RunSimulationEvent,
     AnalyzeSimulationResultsEvent,
@@ -35,8 +49,14 @@ class SimulatorExecutor:
         :param output_path: The artifacts output path.
         """
         self.config = config
-        self.environment = Env(config['environment'])
         description_generator_path = self.set_output_folder(output_path)
+        init_llm_cache(config.get('llm_cache', {}), output_path)
+        init_llm_cassette(config.get('llm_cassette', {}), output_path)
+        set_concurrency_config(config.get('concurrency', {}))
+        set_retry_config(config.get('retry', {}))
+        set_llm_clients_config(config.get('llm_clients', {}))
+        set_prompt_registry_config(config.get('prompt_registry', {}))
+        self.environment = Env(config['environment'])
         global logger
         logger = setup_logger(os.path.join(output_path, 'policies_graph', 'graph.log'))
         if description_generator_path is None:
@@ -45,11 +65,24 @@ class SimulatorExecutor:
                                                           config=config['description_generator'])
             descriptions_generator.generate_policies_graph()
             logger.info(f"{ConsoleColor.CYAN}Finish Building the policies graph{ConsoleColor.RESET}")
-            pickle.dump(descriptions_generator,
-                        open(os.path.join(output_path, 'policies_graph', 'descriptions_generator.pickle'), 'wb'))
+            log_llm_cache_stats()
+            log_llm_cassette_stats('policies_graph')
+            save_descriptions_generator(descriptions_generator,
+                                        os.path.join(output_path, 'policies_graph', 'descriptions_generator.pickle'))
         else:
-            descriptions_generator = pickle.load(
-                open(os.path.join(output_path, 'policies_graph', 'descriptions_generator.pickle'), 'rb'))
+            descriptions_generator = load_descriptions_generator(description_generator_path)
+            if descriptions_generator.prompt != self.environment.prompt and \
+                    config['description_generator'].get('incremental_config', {}).get('enabled', True):
+                logger.info(f"{ConsoleColor.CYAN}The prompt was changed, updating the policies graph:"
+                            f"{ConsoleColor.RESET}")
+                previous_generator = descriptions_generator
+                descriptions_generator = DescriptionGenerator(environment=self.environment,
+                                                              config=config['description_generator'])
+                descriptions_generator.generate_policies_graph(previous=previous_generator)
+                logger.info(f"{ConsoleColor.CYAN}Finish updating the policies graph{ConsoleColor.RESET}")
+                log_llm_cache_stats()
+                log_llm_cassette_stats('policies_graph')
+                save_descriptions_generator(descriptions_generator, description_generator_path)
 
         descriptions_generator = descriptions_generator
         event_generator = EventsGenerator(config=config['event_generator'], env=self.environment)
@@ -64,28 +97,38 @@ class SimulatorExecutor:
         """Generate a unique random Run ID."""
         return f"run-{uuid.uuid4().hex}"
 
-    def load_dataset(self, dataset_path='latest'):
+    def get_dataset_path(self, dataset_path='latest') -> str:
         """
-        Load the dataset. If latest, load the latest dataset.
+        Get the dataset path. If latest, get the latest dataset, if there is no dataset, get a new dataset path.
         :param dataset_path: The dataset path.
         """
         datasets_dir = os.path.join(self.output_path, 'datasets')
         if dataset_path == 'latest':
-            dataset_path = get_latest_file(datasets_dir)
+            # Older datasets (pickle dumps) are migrated to an event store when they are loaded
+            dataset_path = get_latest_file(datasets_dir, SEGMENT_EXTENSION) or get_latest_file(datasets_dir)
         if dataset_path is None:
             dt_string = datetime.now().strftime("%d_%m_%Y_%H_%M_%S")
-            dataset_path = 'dataset' + '__' + dt_string + '.pickle'
-        dataset_path = os.path.join(datasets_dir, dataset_path)
-        update_logger_file(os.path.join(datasets_dir, 'dataset.log'))
+            dataset_path = 'dataset' + '__' + dt_string + '.' + SEGMENT_EXTENSION
+        return os.path.join(datasets_dir, dataset_path)
+
+    def load_dataset(self, dataset_path='latest'):
+        """
+        Load the dataset. If latest, load the latest dataset.
+        :param dataset_path: The dataset path.
+        """
+        dataset_path = self.get_dataset_path(dataset_path)
+        update_logger_file(os.path.join(self.output_path, 'datasets', 'dataset.log'))
         self.dataset_handler.load_dataset(dataset_path)
+        log_llm_cache_stats()
+        log_llm_cassette_stats('dataset')
+        log_llm_clients_stats()
 
-    def run_simulation(self, experiment_name=''):
+    def init_experiment(self, experiment_name='') -> str:
         """
-        Run the simulation on the dataset.
+        Initialize the experiment folder and the dialog.
+        :param experiment_name: The experiment name. Default (empty) creating a new one
+        :return: The experiment folder
         """
-        if len(self.dataset_handler) == 0:
-            print(f"{ConsoleColor.BLUE}The dataset is empty. Loading the last dataset...{ConsoleColor.RESET}")
-            self.load_dataset()
         experiments_dir = os.path.join(self.output_path, 'experiments')
         if experiment_name == '':
             experiment_name = 'exp_{}'.format(len(os.listdir(experiments_dir)) + 1)
@@ -104,80 +147,193 @@ class SimulatorExecutor:
 
         # init the dialog
         self.dialog_manager.init_dialog(experiment_dir)
+        return experiment_dir
 
-        # Run the dialog
-        mini_batch_size = self.config['dialog_manager']['mini_batch_size']
-        records = self.dataset_handler.records
-        num_records = len(records)
+    def run_simulation(self, experiment_name=''):
+        """
+        Run the simulation on the dataset.
+        """
+        if len(self.dataset_handler) == 0:
+            print(f"{ConsoleColor.BLUE}The dataset is empty. Loading the last dataset...{ConsoleColor.RESET}")
+            self.load_dataset()
+        experiment_dir = self.init_experiment(experiment_name)
 
-        if num_records == 0:
+        # Run the dialogs: a single scheduler keeps num_workers dialogs in flight
+        records = self.dataset_handler.records
+        if len(records) == 0:
             logger.warning(f"{ConsoleColor.RED}No records found to process.{ConsoleColor.RESET}")
             return []  # or handle this case appropriately
 
-        num_batch = num_records // mini_batch_size
-        all_res = []
-        total_cost = 0
-        start_iteration = 0
+        journal = ResultJournal(experiment_dir)  # Resumed: the events that already have a result are skipped
+        events = [record for record in records if record.id not in journal.completed_events]
 
         logger.info(f"{ConsoleColor.CYAN}Start running the simulator{ConsoleColor.RESET}")
-        intermediate_res = os.path.join(experiment_dir, 'res_dump.pickle')
-        if os.path.isfile(intermediate_res):
-            all_res, start_iteration, total_cost = pickle.load(open(intermediate_res, 'rb'))
-        # Handle batches
-        for i in range(start_iteration, num_batch, 1):
-            if total_cost > self.config['dialog_manager']['cost_limit']:
+        if journal.cost > self.config['dialog_manager']['cost_limit']:
+            logger.warning(
+                f"{ConsoleColor.RED}The cost limit for the experiment is reached. "
+                f"Skipping remaining records.{ConsoleColor.RESET}")
+        elif events:
+            asyncio.run(self.simulate_events(events, journal, n_events=len(events)))
+        self.finalize_simulation(journal, experiment_dir)
+
+    def run_overlapped(self, dataset_path='latest', experiment_name=''):
+        """
+        Generate the dataset and run the simulation concurrently: the events are passed to the dialog manager
+        through a bounded queue as soon as they are generated. Both the dataset dump and the experiment results
+        dump are resumed (completed dialogs are skipped).
+        :param dataset_path: The dataset path. If latest, load the latest dataset.
+        :param experiment_name: The experiment name. Default (empty) creating a new one
+        """
+        dataset_path = self.get_dataset_path(dataset_path)
+        self.dataset_handler.dataset_name = os.path.splitext(os.path.basename(dataset_path))[0]
+        experiment_dir = self.init_experiment(experiment_name)
+        journal = ResultJournal(experiment_dir)
+        completed_events = journal.completed_events
+        num_workers = self.config['dialog_manager']['num_workers']
+        events_queue = queue.Queue(maxsize=self.config['dialog_manager'].get('queue_size', 2 * num_workers))
+        simulation_stopped = threading.Event()
+        generation_stopped = threading.Event()  # Also set by the dataset generation when its cost limit is reached
+
+        def stop_simulation():
+            # No new events are generated once the simulation is stopped
+            simulation_stopped.set()
+            generation_stopped.set()
+
+        def on_event(event):
+            if event.id in completed_events or simulation_stopped.is_set():
+                return
+            events_queue.put(event)
+
+        def generate_dataset():
+            try:
+                self.dataset_handler.load_dataset(dataset_path, on_event=on_event, stop_event=generation_stopped)
+            finally:
+                events_queue.put(None)  # Signal the end of the dataset
+
+        async def events_stream():
+            while True:
+                event = await asyncio.to_thread(events_queue.get)
+                if event is None:
+                    return
+                yield event
+
+        async def simulate():
+            await self.simulate_events(events_stream(), journal, on_stop=stop_simulation)
+
+        logger.info(f"{ConsoleColor.CYAN}Start generating the dataset and running the simulator{ConsoleColor.RESET}")
+        generation_thread = threading.Thread(target=generate_dataset, daemon=True)
+        generation_thread.start()
+        asyncio.run(simulate())
+        # Drain the queue so the dataset generation is never blocked after the simulation stopped, the generation
+        # only completes its samples in flight
+        stop_simulation()
+        while generation_thread.is_alive():
+            try:
+                events_queue.get(timeout=1)
+            except queue.Empty:
+                pass
+        generation_thread.join()
+        self.finalize_simulation(journal, experiment_dir)
+
+    async def simulate_events(self, events, journal: ResultJournal, n_events: int = None, on_stop: Callable = None):
+        """
+        Run the dialogs of the events with a sliding window of num_workers dialogs (a new dialog starts as soon as
+        one is completed). Each finished dialog is appended to the results journal, and the cost limit is checked
+        after each dialog (the dialogs in flight are completed).
+        :param events: The events (a list or an async iterable)
+        :param journal: The experiment results journal
+        :param n_events: The number of events (for the progress bar)
+        :param on_stop: Called when the cost limit is reached
+        """
+        stop_event = asyncio.Event()
+
+        def on_result(result: dict):
+            # The cost of failed dialogs is journaled too
+            record = result['result'] if result['error'] is None else {'event_id': None, 'res': None}
+            journal.append({**record, 'usage': result['usage'], 'error': result['error']})
+            if journal.cost > self.config['dialog_manager']['cost_limit'] and not stop_event.is_set():
                 logger.warning(
                     f"{ConsoleColor.RED}The cost limit for the experiment is reached. "
                     f"Stopping the simulation.{ConsoleColor.RESET}")
-                break
-            logger.info(f"{ConsoleColor.WHITE}Running batch {i}...{ConsoleColor.RESET}")
-            res, cost = self.dialog_manager.run_events(records[i * mini_batch_size:
-                                                               (i + 1) * mini_batch_size])
-            all_res.extend(res)
-            total_cost += cost
-            pickle.dump((all_res, i + 1, total_cost), open(intermediate_res, 'wb'))
-
-        # Handle remaining records if any
-        remaining_records = records[num_batch * mini_batch_size:]
-        if remaining_records:
-            logger.info(f"{ConsoleColor.WHITE}Running remaining records...{ConsoleColor.RESET}")
-            if total_cost <= self.config['dialog_manager']['cost_limit']:
-                res, cost = self.dialog_manager.run_events(remaining_records)
-                all_res.extend(res)
-                total_cost += cost
-            else:
-                logger.warning(
-                    f"{ConsoleColor.RED}The cost limit for the experiment is reached. "
-                    f"Skipping remaining records.{ConsoleColor.RESET}")
+                stop_event.set()
+                if on_stop is not None:
+                    on_stop()
+
+        await pipeline_ainvoke([self.dialog_manager.get_pipeline_stage()], events, n_inputs=n_events,
+                               on_result=on_result, stop_event=stop_event, keep_results=False)
 
+    def finalize_simulation(self, journal: ResultJournal, experiment_dir: str):
+        """
+        Report and analyze the simulation results.
+        """
+        self.dialog_manager.memory.flush()
+        journal.sync()
         logger.info(f"{ConsoleColor.CYAN}Finish running the simulator{ConsoleColor.RESET}")
-        track_event(RunSimulationEvent(cost=total_cost,
-                                       n_dialogs=len(all_res),
-                                       avg_n_user_messages_per_dialog=sum(
-                                           len(entry['res']['user_messages']) for entry in all_res) / len(
-                                           all_res) if all_res else 0,
-                                       avg_n_chatbot_messages_per_dialog=sum(
-                                           len(entry['res']['chatbot_messages']) for entry in all_res) / len(
-                                           all_res) if all_res else 0,
+        n_dialogs = n_user_messages = n_chatbot_messages = 0
+        for entry in journal.iter_results():
+            n_dialogs += 1
+            n_user_messages += entry['res']['n_user_messages']
+            n_chatbot_messages += entry['res']['n_chatbot_messages']
+        track_event(RunSimulationEvent(cost=journal.cost,
+                                       n_dialogs=n_dialogs,
+                                       avg_n_user_messages_per_dialog=n_user_messages / n_dialogs
+                                       if n_dialogs else 0,
+                                       avg_n_chatbot_messages_per_dialog=n_chatbot_messages / n_dialogs
+                                       if n_dialogs else 0,
                                        llm_critique=self.dialog_manager.config['critique_config']['llm'],
                                        llm_user=self.dialog_manager.config['llm_user'],
                                        llm_chat=self.dialog_manager.config['llm_chat']))
         logger.info(f"{ConsoleColor.CYAN}Analyzing the results{ConsoleColor.RESET}")
-        self.analyze_results(all_res, experiment_dir)
+        self.analyze_results(journal.iter_results(), experiment_dir)
+        journal.close()
+        log_llm_cache_stats()
+        log_llm_cassette_stats('simulation')
+        log_llm_clients_stats()
 
-    def analyze_results(self, results, experiment_dir):
+    def analyze_results(self, results: Iterable[dict], experiment_dir):
         """
-        Analyze the results of the simulation.
+        Analyze the results of the simulation. The results are streamed (from the journal) in batches of the
+        analysis batch_size.
         """
-        results = get_dialog_policies(self.config['analysis'], results, self.dataset_handler.records)
         all_rows = []
         valid_event_ind = []
+        results = iter(results)
+        batch_size = self.config['analysis'].get('batch_size', 100)
+        while batch := list(itertools.islice(results, batch_size)):
+            self.analyze_results_batch(batch, all_rows, valid_event_ind)
+        non_valid_rows = []
+        valid_event_ind = set(valid_event_ind)
+        for i, challenge_level in enumerate(self.dataset_handler.get_challenge_levels()):
+            if i in valid_event_ind:
+                continue
+            cur_row = {'id': i + 1, 'score': 0, 'challenge_level': challenge_level}
+            non_valid_rows.append(cur_row)
+        if all_rows:
+            df = pd.DataFrame(all_rows)
+            df.to_csv(os.path.join(experiment_dir, 'results.csv'), index=False)
+            error_df = pd.DataFrame(non_valid_rows)
+            error_df.to_csv(os.path.join(experiment_dir, 'err_events.csv'), index=False)
+            failure_rate = (df['score'] == False).mean()
+            track_event(
+                AnalyzeSimulationResultsEvent(
+                    failure_rate=failure_rate
+                )
+            )
+            logger.info(f"{ConsoleColor.CYAN}Finish running results analysis{ConsoleColor.RESET}")
+        else:
+            logger.info(f"{ConsoleColor.CYAN}No rows to process. Results are empty.{ConsoleColor.RESET}")
+
+    def analyze_results_batch(self, results: list[dict], all_rows: list[dict], valid_event_ind: list[int]):
+        """
+        Analyze a batch of results, the results rows and valid events indexes are appended
+        """
+        results = get_dialog_policies(self.config['analysis'], results, self.dataset_handler.records,
+                                      self.dialog_manager.get_conversations)
         for r in results:
             try:
                 cur_event = self.dataset_handler.records[r['event_id'] - 1]
-                user_messages = r['res'].get('user_messages', [])
                 stop_signal = r['res'].get('stop_signal', '')
-                if not user_messages:
+                if not r['res'].get('n_user_messages', 0):
                     continue  # Skip if no user messages
                 if 'FAILURE' in stop_signal:
                     score = 0
@@ -190,7 +346,7 @@ class SimulatorExecutor:
                     'id': r['event_id'],
                     'thread_id': r['res'].get('thread_id'),
                     'score': score,
-                    'reason': r['res']['user_thoughts'][-1] if 'user_thoughts' in r['res'] else None,
+                    'reason': r['res'].get('user_thought') or None,
                     'scenario': getattr(cur_event, 'scenario', None),
                     'expected_behaviour': getattr(cur_event.description, 'expected_behaviour', None),
                     'challenge_level': getattr(cur_event.description, 'challenge_level', None),
@@ -207,26 +363,6 @@ class SimulatorExecutor:
                 track_event(ExceptionEvent(exception_type=type(e).__name__,
                                            error_message=error_message))
                 continue
-        non_valid_rows = []
-        for i, event in enumerate(self.dataset_handler.records):
-            if i in valid_event_ind:
-                continue
-            cur_row = {'id': i + 1, 'score': 0, 'challenge_level': getattr(event.description, 'challenge_level', None)}
-            non_valid_rows.append(cur_row)
-        if all_rows:
-            df = pd.DataFrame(all_rows)
-            df.to_csv(os.path.join(experiment_dir, 'results.csv'), index=False)
-            error_df = pd.DataFrame(non_valid_rows)
-            error_df.to_csv(os.path.join(experiment_dir, 'err_events.csv'), index=False)
-            failure_rate = (df['score'] == False).mean()
-            track_event(
-                AnalyzeSimulationResultsEvent(
-                    failure_rate=failure_rate
-                )
-            )
-            logger.info(f"{ConsoleColor.CYAN}Finish running results analysis{ConsoleColor.RESET}")
-        else:
-            logger.info(f"{ConsoleColor.CYAN}No rows to process. Results are empty.{ConsoleColor.RESET}")
 
     @staticmethod
     def set_output_folder(output_path):
@@ -1,10 +1,9 @@
 from simulator.utils.parallelism import async_batch_invoke
 from simulator.utils.llm_utils import get_llm, set_llm_chain, set_callback
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Callable
 from simulator.dataset.events_generator import Event
 from simulator.dataset.descriptor_generator import policies_list_to_str
-from simulator.utils.llm_utils import convert_messages_to_str
 from typing import Optional
 
 
@@ -20,12 +19,14 @@ def policy_to_str(policy):
     return f"Flow: {policy['flow']}\npolicy: {policy['policy']}"
 
 
-def get_dialog_policies(config: dict, simulator_res: list[dict], events: list[Event]) -> list[dict]:
+def get_dialog_policies(config: dict, simulator_res: list[dict], events: list[Event],
+                        get_conversations: Callable[[list[str]], dict[str, str]]) -> list[dict]:
     """
     Get the dialog policies from the config
     :param config: The config analysis chain
-    :param simulator_res: The results of the simulator
+    :param simulator_res: The results of the simulator (the dialogs summaries)
     :param events: The events list
+    :param get_conversations: Fetch the conversations of the dialogs threads ids (from the memory)
     :return: enriching the simulator_res with the policies information
     """
 
@@ -33,17 +34,19 @@ def get_dialog_policies(config: dict, simulator_res: list[dict], events: list[Ev
     llm = set_llm_chain(llm, **config['prompt'], structure=PoliciesAnalysis)
     batch = []
     callback = set_callback(config['llm']['type'])
+    conversations = get_conversations([r['res']['thread_id'] for r in simulator_res])
     for r in simulator_res:
         cur_event = events[r['event_id'] - 1]
-        judgment_reason = r['res']['user_thoughts'][-1].split('Thought:\n')[-1]
+        judgment_reason = r['res']['user_thought'].split('Thought:\n')[-1]
         batch.append({'policies': policies_list_to_str(cur_event.description.policies),
-                      'conversation': convert_messages_to_str(r['res']['chatbot_messages'][1:]),
+                      'conversation': conversations.get(r['res']['thread_id'], ''),
                       'judgment': f"{r['res']['stop_signal']}\n{judgment_reason}",
                       'feedback': r['res']['critique_feedback']})
 
     num_workers = config.get('num_workers', 1)
     timeout = config.get('timeout', 10)
-    res = async_batch_invoke(llm.ainvoke, batch, num_workers=num_workers, timeout=timeout, callbacks=[callback])
+    res = async_batch_invoke(llm.ainvoke, batch, num_workers=num_workers, timeout=timeout, callbacks=[callback],
+                             latency_signal=True)
     for r in res:
         if r['error'] is not None:
             continue
@@ -0,0 +1,251 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+from simulator.utils.logger_config import get_logger
+
+# The default configuration of the adaptive concurrency controller (can be updated by set_concurrency_config)
+CONCURRENCY_CONFIG = {'adaptive': True,  # If False, use a static limit of num_workers
+                      'max_workers_factor': 1,  # The limit can grow up to num_workers * max_workers_factor
+                      # (the default of 1 only lets the limit shrink below num_workers, growing is opt-in)
+                      'min_workers': 1,
+                      'increase_step': 1,  # Additive increase (per limit successful tasks)
+                      'decrease_factor': 0.5,  # Multiplicative decrease on throttling
+                      'latency_spike_factor': 3,  # A task slower than factor * average latency is a latency spike
+                      'warmup_samples': 5}  # The number of finished tasks before detecting latency spikes
+
+# The rate limiters, shared by all the models with the same type and name
+model_rate_limiters = {}
+model_rate_limiters_lock = threading.Lock()
+
+
+def set_concurrency_config(config: dict):
+    """
+    Update the adaptive concurrency configuration
+    :param config: The concurrency configuration
+    """
+    CONCURRENCY_CONFIG.update(config)
+
+
+def is_throttling_error(e: Exception) -> bool:
+    """
+    Check if the exception is a provider rate limit error (HTTP 429 or a RateLimitError of the provider SDK)
+    """
+    if 'RateLimit' in type(e).__name__ or 'Throttl' in type(e).__name__:
+        return True
+    status_code = getattr(e, 'status_code', None)
+    if status_code is None and getattr(e, 'response', None) is not None:
+        status_code = getattr(e.response, 'status_code', None)
+    return status_code == 429
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    An AIMD (additive increase, multiplicative decrease) concurrency limiter.
+    The number of tasks in flight grows by increase_step for every `limit` successful tasks, and shrinks by
+    decrease_factor when a task is throttled (rate limit error or timeout) or its latency spikes (only for the tasks
+    that report their latency).
+    Only tasks that started after the last decrease may trigger another decrease, so a burst of throttled
+    tasks shrinks the limit once.
+    """
+
+    def __init__(self, initial_limit: int, max_limit: int = None, min_limit: int = 1, increase_step: float = 1,
+                 decrease_factor: float = 0.5, latency_spike_factor: float = 3, warmup_samples: int = 5):
+        """
+        Initialize the limiter.
+        :param initial_limit: The initial number of concurrent tasks
+        :param max_limit: The maximal number of concurrent tasks (default: initial_limit)
+        :param min_limit: The minimal number of concurrent tasks
+        :param increase_step: The additive increase per window of successful tasks
+        :param decrease_factor: The multiplicative decrease on throttling
+        :param latency_spike_factor: A latency above factor * average latency is considered as a spike
+        :param warmup_samples: The number of successful tasks before latency spikes are detected
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(initial_limit, max_limit if max_limit is not None else initial_limit)
+        self.limit = float(max(self.min_limit, initial_limit))
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_spike_factor = latency_spike_factor
+        self.warmup_samples = warmup_samples
+        self.in_flight = 0
+        self.generation = 0  # Incremented on each decrease
+        self.avg_latency = None
+        self.n_samples = 0
+        self.n_throttled = 0
+        self.condition = None
+
+    @classmethod
+    def from_config(cls, num_workers: int, config: dict = None) -> 'AdaptiveConcurrencyLimiter':
+        """
+        Create a limiter according to the concurrency configuration
+        :param num_workers: The configured number of workers (the initial limit)
+        :param config: The concurrency configuration (default: CONCURRENCY_CONFIG)
+        """
+        config = config if config is not None else CONCURRENCY_CONFIG
+        if not config.get('adaptive', True):
+            return cls(num_workers, max_limit=num_workers, min_limit=num_workers)
+        return cls(num_workers, max_limit=int(num_workers * config.get('max_workers_factor', 1)),
+                   min_limit=config.get('min_workers', 1),
+                   increase_step=config.get('increase_step', 1),
+                   decrease_factor=config.get('decrease_factor', 0.5),
+                   latency_spike_factor=config.get('latency_spike_factor', 3),
+                   warmup_samples=config.get('warmup_samples', 5))
+
+    async def acquire(self) -> int:
+        """
+        Wait for a free slot
+        :return: The generation of the slot (should be provided when reporting the task outcome)
+        """
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            return self.generation
+
+    async def release(self):
+        """
+        Release a slot
+        """
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self, latency: Optional[float], generation: int):
+        """
+        Report a successful task
+        :param latency: The task latency (in seconds), None if the latency is not a load signal for the task
+        :param generation: The generation returned by acquire
+        """
+        if latency is None:
+            self.limit = min(self.max_limit, self.limit + self.increase_step / self.limit)
+            return
+        self.n_samples += 1
+        if self.avg_latency is not None and self.n_samples > self.warmup_samples \
+                and latency > self.latency_spike_factor * self.avg_latency:
+            self.decrease(generation, 'latency spike')
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase_step / self.limit)
+        self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+
+    def on_throttle(self, generation: int):
+        """
+        Report a throttled task (rate limit error or timeout)
+        :param generation: The generation returned by acquire
+        """
+        self.n_throttled += 1
+        self.decrease(generation, 'throttling')
+
+    def decrease(self, generation: int, reason: str):
+        if generation != self.generation:
+            return  # The limit was already decreased since this task started
+        self.generation += 1
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        get_logger().debug(f'Concurrency limit decreased to {int(self.limit)} due to {reason}')
+
+
+class ModelRateLimiter(BaseRateLimiter):
+    """
+    A requests-per-minute and tokens-per-minute rate limiter for a model, over a sliding window of 60 seconds.
+    The tokens usage is reported by the TokenUsageHandler callback, and the tokens of the next request are
+    estimated by the average tokens per request.
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None, check_every_n_seconds: float = 0.1):
+        """
+        Initialize the rate limiter.
+        :param rpm: The requests per minute budget (None means unlimited)
+        :param tpm: The tokens per minute budget (None means unlimited)
+        :param check_every_n_seconds: The polling interval while waiting for budget
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.check_every_n_seconds = check_every_n_seconds
+        self.requests = deque()
+        self.tokens = deque()
+        self.tokens_in_window = 0
+        self.avg_request_tokens = 0
+        self.lock = threading.Lock()
+
+    def _purge(self, now: float):
+        while self.requests and now - self.requests[0] > 60:
+            self.requests.popleft()
+        while self.tokens and now - self.tokens[0][0] > 60:
+            self.tokens_in_window -= self.tokens.popleft()[1]
+
+    def _consume(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self._purge(now)
+            if self.rpm is not None and len(self.requests) >= self.rpm:
+                return False
+            if self.tpm is not None and self.tokens and \
+                    self.tokens_in_window + self.avg_request_tokens > self.tpm:
+                return False
+            self.requests.append(now)
+            return True
+
+    def record_tokens(self, n_tokens: int):
+        """
+        Record the tokens usage of a finished request
+        """
+        with self.lock:
+            self.tokens.append((time.monotonic(), n_tokens))
+            self.tokens_in_window += n_tokens
+            self.avg_request_tokens = n_tokens if self.avg_request_tokens == 0 \
+                else 0.9 * self.avg_request_tokens + 0.1 * n_tokens
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        if not blocking:
+            return self._consume()
+        while not self._consume():
+            time.sleep(self.check_every_n_seconds)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        if not blocking:
+            return self._consume()
+        while not self._consume():
+            await asyncio.sleep(self.check_every_n_seconds)
+        return True
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """
+    A callback that reports the tokens usage of each LLM call to the model rate limiter
+    """
+
+    def __init__(self, rate_limiter: ModelRateLimiter):
+        self.rate_limiter = rate_limiter
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> Any:
+        n_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+                if usage:
+                    n_tokens += usage.get('total_tokens', 0)
+        if n_tokens == 0 and response.llm_output:
+            n_tokens = response.llm_output.get('token_usage', {}).get('total_tokens', 0)
+        if n_tokens > 0:
+            self.rate_limiter.record_tokens(n_tokens)
+
+
+def get_model_rate_limiter(config: dict) -> Optional[ModelRateLimiter]:
+    """
+    Get the rate limiter of the model, shared by all the models with the same type and name
+    :param config: The llm configuration (the budgets are set by the 'rpm' and 'tpm' keys)
+    :return: The rate limiter (None if no budget is configured)
+    """
+    if config.get('rpm', None) is None and config.get('tpm', None) is None:
+        return None
+    key = (config['type'].lower(), config.get('name', ''))
+    with model_rate_limiters_lock:
+        if key not in model_rate_limiters:
+            model_rate_limiters[key] = ModelRateLimiter(rpm=config.get('rpm', None), tpm=config.get('tpm', None))
+        return model_rate_limiters[key]
@@ -156,7 +156,7 @@ def get_latest_dataset(base_path="./results"):
         return None
     last_dir = last_dir / 'datasets'
     # Get the last created database file in the last created directory
-    last_dataset = get_latest_file(str(last_dir))
+    last_dataset = get_latest_file(str(last_dir), 'events') or get_latest_file(str(last_dir))
     if last_dataset is None:
         return None
     last_dataset = last_dir / last_dataset
@@ -0,0 +1,174 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import time
+from typing import Any, Optional, Sequence
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+from simulator.utils.logger_config import get_logger, ConsoleColor
+from simulator.healthcare_analytics import ExceptionEvent, track_event
+
+# The process-wide cache, set by init_llm_cache
+llm_cache = None
+
+
+class LLMCache(BaseCache):
+    """
+    A persistent, content-addressed LLM response cache stored in a SQLite database.
+    The key is a hash of the canonicalized prompt messages and the serialized model configuration (model name,
+    temperature, bound tools and structured output schema), so identical calls are served from disk.
+    Entries are evicted by TTL and by LRU order once the number of entries exceeds max_entries.
+    Only deterministic calls should be cached: a sampling call (e.g. a description of a sampled path) with a repeated
+    prompt would get the same cached response.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 100000, ttl: Optional[float] = None):
+        """
+        Initialize the cache.
+        :param db_path: The path of the SQLite cache file
+        :param max_entries: The maximal number of cached responses (LRU eviction)
+        :param ttl: The time to live of an entry (in seconds). None means no expiration
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS LLMCache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON LLMCache (last_access)')
+        self.conn.commit()
+
+    @staticmethod
+    def get_key(prompt: str, llm_string: str) -> str:
+        """
+        Get the content address of a call
+        :param prompt: The serialized prompt (langchain serializes the messages list)
+        :param llm_string: The serialized model configuration
+        :return: The sha256 key
+        """
+        return hashlib.sha256(f'{llm_string}\n{prompt}'.encode('utf-8')).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = self.get_key(prompt, llm_string)
+        now = time.time()
+        try:
+            with self.lock:
+                row = self.conn.execute('SELECT response, created_at FROM LLMCache WHERE key = ?',
+                                        (key,)).fetchone()
+                if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                    self.conn.execute('DELETE FROM LLMCache WHERE key = ?', (key,))
+                    self.conn.commit()
+                    self.evictions += 1
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                self.conn.execute('UPDATE LLMCache SET last_access = ? WHERE key = ?', (now, key))
+                self.conn.commit()
+                self.hits += 1
+            return [loads(generation) for generation in json.loads(row[0])]
+        except Exception as e:
+            # A corrupted entry should never break the run, we simply call the provider
+            track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                       error_message=f'LLM cache lookup failed: {e}'))
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = self.get_key(prompt, llm_string)
+        now = time.time()
+        try:
+            response = json.dumps([dumps(generation) for generation in return_val])
+            with self.lock:
+                self.conn.execute('INSERT OR REPLACE INTO LLMCache (key, response, created_at, last_access) '
+                                  'VALUES (?, ?, ?, ?)', (key, response, now, now))
+                self.evict()
+                self.conn.commit()
+        except Exception as e:
+            track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                       error_message=f'LLM cache update failed: {e}'))
+
+    def evict(self):
+        """
+        Remove expired entries and the least recently used entries above max_entries (lock should be held)
+        """
+        if self.ttl is not None:
+            cursor = self.conn.execute('DELETE FROM LLMCache WHERE created_at < ?', (time.time() - self.ttl,))
+            self.evictions += cursor.rowcount
+        n_entries = self.conn.execute('SELECT COUNT(*) FROM LLMCache').fetchone()[0]
+        if n_entries > self.max_entries:
+            cursor = self.conn.execute('DELETE FROM LLMCache WHERE key IN '
+                                       '(SELECT key FROM LLMCache ORDER BY last_access ASC LIMIT ?)',
+                                       (n_entries - self.max_entries,))
+            self.evictions += cursor.rowcount
+
+    def clear(self, **kwargs: Any) -> None:
+        with self.lock:
+            self.conn.execute('DELETE FROM LLMCache')
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        """
+        :return: The cache counters
+        """
+        with self.lock:
+            n_entries = self.conn.execute('SELECT COUNT(*) FROM LLMCache').fetchone()[0]
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': n_entries,
+                'hit_rate': self.hits / total if total > 0 else 0}
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+def init_llm_cache(config: dict, output_path: str) -> Optional[LLMCache]:
+    """
+    Initialize the process-wide LLM cache, all the models created by get_llm will use it
+    :param config: The llm_cache configuration
+    :param output_path: The artifacts output path (the default location of the cache file)
+    :return: The cache (None if disabled)
+    """
+    global llm_cache
+    if not config.get('enabled', False):
+        llm_cache = None
+        return None
+    db_path = config.get('path', '')
+    if db_path == '':
+        db_path = os.path.join(output_path, 'llm_cache.db')
+    if llm_cache is not None and llm_cache.db_path == db_path:
+        return llm_cache
+    llm_cache = LLMCache(db_path, max_entries=config.get('max_entries', 100000), ttl=config.get('ttl', None))
+    return llm_cache
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """
+    :return: The process-wide LLM cache (None if not initialized)
+    """
+    return llm_cache
+
+
+def log_llm_cache_stats():
+    """
+    Log the cache hit/miss counters
+    """
+    if llm_cache is None:
+        return
+    stats = llm_cache.stats()
+    get_logger().info(f"{ConsoleColor.CYAN}LLM cache: {stats['hits']} hits, {stats['misses']} misses "
+                      f"(hit rate {stats['hit_rate']:.2f}), {stats['entries']} entries{ConsoleColor.RESET}")
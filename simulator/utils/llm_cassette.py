@@ -0,0 +1,268 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import threading
+import numpy as np
+from typing import Any, Optional, Sequence
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+from simulator.utils.llm_cache import LLMCache
+from simulator.utils.logger_config import get_logger, ConsoleColor
+from simulator.healthcare_analytics import ExceptionEvent, track_event
+
+# The process-wide cassette, set by init_llm_cassette
+llm_cassette = None
+
+# The call-site is the first frame outside these modules (the generic LLM plumbing)
+PLUMBING_MODULES = ('langchain', 'langsmith', 'asyncio', 'concurrent', 'threading', 'simulator.utils.llm_utils',
+                    'simulator.utils.llm_cassette', 'simulator.utils.parallelism', 'simulator.utils.retry',
+                    'simulator.utils.concurrency')
+
+
+class CassetteMissError(Exception):
+    """A replayed call that was not recorded"""
+
+
+def get_call_site(llm_string: str) -> str:
+    """
+    Get the call-site of an LLM call: the calling function (outside the LLM plumbing) and the structured output/tool
+    names of the call. The async batches run in their own tasks, so their calling function is the batch helper and
+    only the output/tool names identify them
+    """
+    caller = 'async'
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module and not module.startswith(PLUMBING_MODULES):
+            caller = f'{module}:{frame.f_code.co_name}'
+            break
+        frame = frame.f_back
+    params = llm_string.rsplit('---', 1)[-1]
+    names = sorted(set(re.findall(r"'name': '([^']+)'", params)))
+    return f"{caller}[{','.join(names)}]" if names else caller
+
+
+class LLMCassette:
+    """
+    Records every LLM request/response pair (keyed by the call-site and the content hash of the prompt and the model
+    config) to a JSONL file, and replays them offline. In replay mode, a call that was not recorded is divergent: it
+    is served the next recorded response of its call-site (or raises CassetteMissError if strict), and it is reported.
+    The cassette measures the time spent in the LLM calls, so the non-LLM overhead of a run can be isolated.
+    """
+
+    def __init__(self, path: str, mode: str, strict: bool = False):
+        """
+        Initialize the cassette.
+        :param path: The path of the cassette JSONL file
+        :param mode: 'record' or 'replay'
+        :param strict: Replay only: raise an error on divergent calls (instead of serving a substitute)
+        """
+        self.path = path
+        self.mode = mode
+        self.strict = strict
+        self.lock = threading.Lock()
+        self.responses = {}  # key -> the recorded responses (served in order)
+        self.call_sites = {}  # call-site -> the recorded keys (substitutes of divergent calls)
+        self.counters = {}  # key/call-site -> the number of served responses
+        self.started = {}  # key -> the start times of the pending recorded calls
+        self.divergences = []
+        self.stats = {'calls': 0, 'replayed': 0, 'divergent': 0, 'recorded': 0, 'llm_seconds': 0.0}
+        self.start_time = time.perf_counter()
+        self.stage_time = self.start_time
+        self.stages = {}  # stage -> wall time (in seconds)
+        if mode == 'replay':
+            self.load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            open(path, 'w').close()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            raise FileNotFoundError(f'The cassette {self.path} does not exist, record it first (mode: record)')
+        with open(self.path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self.responses.setdefault(entry['key'], []).append(entry)
+                self.call_sites.setdefault(entry['call_site'], []).append(entry['key'])
+
+    def next_response(self, counter_key: str, entries: list) -> Any:
+        # Lock should be held
+        index = self.counters.get(counter_key, 0)
+        self.counters[counter_key] = index + 1
+        return entries[min(index, len(entries) - 1)]
+
+    def replay(self, prompt: str, llm_string: str) -> Sequence[Generation]:
+        key = LLMCache.get_key(prompt, llm_string)
+        call_site = get_call_site(llm_string)
+        with self.lock:
+            self.stats['calls'] += 1
+            if key in self.responses:
+                entry = self.next_response(key, self.responses[key])
+                self.stats['replayed'] += 1
+            else:
+                self.stats['divergent'] += 1
+                substitutes = self.call_sites.get(call_site, [])
+                self.divergences.append({'call_site': call_site, 'key': key, 'substituted': bool(substitutes)})
+                if self.strict or not substitutes:
+                    raise CassetteMissError(f'The call {key[:12]} of {call_site} was not recorded')
+                entry = self.responses[self.next_response(call_site, substitutes)][0]
+            self.stats['llm_seconds'] += entry['latency']
+        return [loads(generation) for generation in entry['response']]
+
+    def start(self, prompt: str, llm_string: str):
+        """
+        A call that is not served by the cache is sent to the provider
+        """
+        key = LLMCache.get_key(prompt, llm_string)
+        with self.lock:
+            self.started.setdefault(key, []).append(time.perf_counter())
+
+    def record(self, prompt: str, llm_string: str, return_val: Sequence[Generation], cached: bool = False):
+        key = LLMCache.get_key(prompt, llm_string)
+        entry = {'key': key, 'call_site': get_call_site(llm_string), 'cached': cached,
+                 'response': [dumps(generation) for generation in return_val]}
+        with self.lock:
+            started = self.started.get(key)
+            entry['latency'] = 0.0 if cached or not started else time.perf_counter() - started.pop(0)
+            self.stats['calls'] += 1
+            self.stats['recorded'] += 1
+            self.stats['llm_seconds'] += entry['latency']
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def get_report(self) -> dict:
+        """
+        :return: The counters, the divergent calls and the timing of the run. The llm time is the sum of the (recorded)
+        calls latencies. A replayed run spends no time in the LLM calls, so all its time is the non-LLM overhead
+        """
+        with self.lock:
+            elapsed = time.perf_counter() - self.start_time
+            return {'mode': self.mode, **self.stats, 'elapsed_seconds': elapsed,
+                    'overhead_seconds': elapsed if self.mode == 'replay' else None,
+                    'stages': dict(self.stages), 'divergences': list(self.divergences)}
+
+
+class CassetteCache(BaseCache):
+    """
+    The cache of a model that is recorded/replayed by the cassette. In record mode, the model cache (if any) is
+    still used, and its hits are recorded too
+    """
+
+    def __init__(self, cassette: LLMCassette, inner: Optional[BaseCache] = None):
+        self.cassette = cassette
+        self.inner = inner
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        try:
+            if self.cassette.mode == 'replay':
+                return self.cassette.replay(prompt, llm_string)
+            result = self.inner.lookup(prompt, llm_string) if self.inner is not None else None
+            if result is not None:
+                self.cassette.record(prompt, llm_string, result, cached=True)
+            else:
+                self.cassette.start(prompt, llm_string)
+            return result
+        except CassetteMissError:
+            raise
+        except Exception as e:
+            # The recording should never break the run
+            track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                       error_message=f'LLM cassette lookup failed: {e}'))
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if self.cassette.mode == 'replay':
+            return
+        try:
+            self.cassette.record(prompt, llm_string, return_val)
+        except Exception as e:
+            track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                       error_message=f'LLM cassette update failed: {e}'))
+        if self.inner is not None:
+            self.inner.update(prompt, llm_string, return_val)
+
+    # The async calls are served in the event loop thread (the call-site is taken from the running task stack)
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        self.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        if self.inner is not None:
+            self.inner.clear(**kwargs)
+
+
+def init_llm_cassette(config: dict, output_path: str) -> Optional[LLMCassette]:
+    """
+    Initialize the process-wide LLM cassette, all the models created by get_llm will be recorded/replayed
+    :param config: The llm_cassette configuration
+    :param output_path: The artifacts output path (the default location of the cassette file)
+    :return: The cassette (None if disabled)
+    """
+    global llm_cassette
+    mode = config.get('mode', '') or ''
+    if mode == '':
+        llm_cassette = None
+        return None
+    if mode not in ('record', 'replay'):
+        raise ValueError(f"Unknown llm_cassette mode: {mode} (should be 'record' or 'replay')")
+    path = config.get('path', '') or os.path.join(output_path, 'llm_cassette.jsonl')
+    # The events sampling should be the same in the recorded and the replayed runs (or the calls diverge)
+    random.seed(config.get('seed', 0))
+    np.random.seed(config.get('seed', 0))
+    llm_cassette = LLMCassette(path, mode, strict=config.get('strict', False))
+    get_logger().info(f"{ConsoleColor.CYAN}LLM cassette: {mode} {path}{ConsoleColor.RESET}")
+    return llm_cassette
+
+
+def get_llm_cassette() -> Optional[LLMCassette]:
+    """
+    :return: The process-wide LLM cassette (None if not initialized)
+    """
+    return llm_cassette
+
+
+def attach_llm_cassette(llm):
+    """
+    Record/replay the model calls with the process-wide cassette (wrapping the model cache)
+    """
+    if llm_cassette is None or not hasattr(llm, 'cache'):
+        return
+    cache = llm.cache
+    if isinstance(cache, CassetteCache):
+        if cache.cassette is llm_cassette:
+            return
+        cache = cache.inner  # A cassette of a previous run
+    llm.cache = CassetteCache(llm_cassette, cache if isinstance(cache, BaseCache) else None)
+
+
+def log_llm_cassette_stats(stage: str):
+    """
+    Log the cassette counters and the timing of a stage, and save the run report next to the cassette
+    :param stage: The name of the finished stage
+    """
+    if llm_cassette is None:
+        return
+    with llm_cassette.lock:
+        now = time.perf_counter()
+        stage_seconds = now - llm_cassette.stage_time
+        llm_cassette.stage_time = now
+        llm_cassette.stages[stage] = stage_seconds
+    report = llm_cassette.get_report()
+    if report['mode'] == 'replay':
+        details = f"{report['replayed']} replayed, {report['divergent']} divergent, non-LLM overhead " \
+                  f"{report['overhead_seconds']:.2f}s (recorded LLM time {report['llm_seconds']:.2f}s)"
+    else:
+        details = f"{report['recorded']} recorded, LLM time {report['llm_seconds']:.2f}s"
+    get_logger().info(f"{ConsoleColor.CYAN}LLM cassette {stage}: {stage_seconds:.2f}s, {report['calls']} calls, "
+                      f"{details}{ConsoleColor.RESET}")
+    report_path = os.path.splitext(llm_cassette.path)[0] + f"_{report['mode']}_report.json"
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,173 @@
+import json
+import asyncio
+import threading
+import weakref
+from typing import Callable
+import httpx
+from simulator.utils.logger_config import get_logger, ConsoleColor
+
+# The default configuration of the shared LLM clients (can be updated by set_llm_clients_config)
+LLM_CLIENTS_CONFIG = {'shared': True,  # If False, get_llm creates a new client on every call
+                      'max_connections': 100,  # The connections limit of each HTTP pool
+                      'max_keepalive_connections': 50,
+                      'keepalive_expiry': 60}  # Idle connections are closed after this number of seconds
+
+# The shared LLM clients (by the normalized model config) and HTTP pools (by the provider endpoint)
+llm_clients = {}
+http_pools = {}
+llm_clients_lock = threading.Lock()
+llm_clients_stats = {'hits': 0, 'misses': 0}
+
+
+def set_llm_clients_config(config: dict):
+    """
+    Update the shared LLM clients configuration
+    :param config: The LLM clients configuration
+    """
+    LLM_CLIENTS_CONFIG.update(config)
+
+
+def get_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=LLM_CLIENTS_CONFIG['max_connections'],
+                        max_keepalive_connections=LLM_CLIENTS_CONFIG['max_keepalive_connections'],
+                        keepalive_expiry=LLM_CLIENTS_CONFIG['keepalive_expiry'])
+
+
+def count_connections(transport) -> int:
+    pool = getattr(transport, '_pool', None)
+    return len(getattr(pool, 'connections', []) or [])
+
+
+class CountingTransport(httpx.BaseTransport):
+    """
+    A keep-alive connections pool that counts its requests
+    """
+
+    def __init__(self):
+        self.transport = httpx.HTTPTransport(limits=get_limits())
+        self.requests = 0
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        return self.transport.handle_request(request)
+
+    def close(self):
+        self.transport.close()
+
+
+class LoopAwareTransport(httpx.AsyncBaseTransport):
+    """
+    An async keep-alive connections pool per event loop. The async batches run each in its own event loop
+    (asyncio.run), and the connections of an async pool can not be used from another loop, so the client is shared
+    while every loop gets its own pool (it is dropped with the loop).
+    """
+
+    def __init__(self):
+        self.transports = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def get_transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if loop not in self.transports:
+                self.transports[loop] = httpx.AsyncHTTPTransport(limits=get_limits())
+            return self.transports[loop]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        return await self.get_transport().handle_async_request(request)
+
+    async def aclose(self):
+        transport = self.transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class HttpPool:
+    """
+    The sync and async HTTP clients of a provider endpoint, shared by all its models
+    """
+
+    def __init__(self, timeout: float):
+        self.sync_transport = CountingTransport()
+        self.async_transport = LoopAwareTransport()
+        self.sync_client = httpx.Client(transport=self.sync_transport, timeout=timeout)
+        self.async_client = httpx.AsyncClient(transport=self.async_transport, timeout=timeout)
+
+    def get_stats(self) -> dict:
+        return {'sync_requests': self.sync_transport.requests,
+                'async_requests': self.async_transport.requests,
+                'sync_connections': count_connections(self.sync_transport.transport),
+                'async_connections': sum(count_connections(t) for t in list(self.async_transport.transports.values())),
+                'event_loops': len(self.async_transport.transports)}
+
+
+def get_http_clients(endpoint: str, timeout: float) -> dict:
+    """
+    Get the shared HTTP clients of a provider endpoint (the http_client and http_async_client of the model)
+    :param endpoint: The provider endpoint (the pools are shared by all the models of the same endpoint)
+    :param timeout: The requests timeout
+    """
+    if not LLM_CLIENTS_CONFIG['shared']:
+        return {}
+    key = f'{endpoint}|{timeout}'
+    with llm_clients_lock:
+        if key not in http_pools:
+            http_pools[key] = HttpPool(timeout)
+        pool = http_pools[key]
+    return {'http_client': pool.sync_client, 'http_async_client': pool.async_client}
+
+
+def get_llm_key(config: dict, timeout: float) -> str:
+    """
+    The normalized model config (all the config keys, with the type in lower case and the defaults filled in)
+    """
+    return json.dumps({**config, 'type': config['type'].lower(), 'temperature': config.get('temperature', 0),
+                       'model_kwargs': config.get('model_kwargs', {}), 'timeout': timeout},
+                      sort_keys=True, default=str)
+
+
+def get_shared_llm(config: dict, timeout: float, create_llm: Callable):
+    """
+    Get the shared client of a model config, the client is created on the first request
+    :param config: The model config
+    :param timeout: The requests timeout
+    :param create_llm: Create a new client (config, timeout) -> llm
+    """
+    if not LLM_CLIENTS_CONFIG['shared']:
+        return create_llm(config, timeout)
+    key = get_llm_key(config, timeout)
+    with llm_clients_lock:
+        if key in llm_clients:
+            llm_clients_stats['hits'] += 1
+            return llm_clients[key]
+        llm_clients_stats['misses'] += 1
+    llm = create_llm(config, timeout)
+    with llm_clients_lock:
+        # Keep the first client if it was created concurrently
+        return llm_clients.setdefault(key, llm)
+
+
+def get_llm_clients_stats() -> dict:
+    """
+    The shared clients registry and HTTP pools statistics
+    """
+    with llm_clients_lock:
+        return {'clients': len(llm_clients),
+                'hits': llm_clients_stats['hits'],
+                'misses': llm_clients_stats['misses'],
+                'pools': {key: pool.get_stats() for key, pool in http_pools.items()}}
+
+
+def log_llm_clients_stats():
+    """
+    Log the shared clients and the HTTP pools usage
+    """
+    stats = get_llm_clients_stats()
+    get_logger().info(f"{ConsoleColor.CYAN}LLM clients: {stats['clients']} shared clients ({stats['hits']} reuses), "
+                      f"{len(stats['pools'])} HTTP pools{ConsoleColor.RESET}")
+    for key, pool_stats in stats['pools'].items():
+        get_logger().info(f"{ConsoleColor.CYAN}  {key.split('|')[0]}: {pool_stats['sync_requests']} sync / "
+                          f"{pool_stats['async_requests']} async requests, {pool_stats['sync_connections']} sync / "
+                          f"{pool_stats['async_connections']} async open connections{ConsoleColor.RESET}")
@@ -1,27 +1,39 @@
-from langchain import hub
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.runnables.base import Runnable
 import importlib
 import os
 import sys
-from langchain_community.callbacks import get_openai_callback
-from langchain_community.callbacks.manager import get_bedrock_anthropic_callback
-from langchain_openai import ChatOpenAI
-from langchain_community.llms import HuggingFacePipeline
-from langchain_openai.chat_models import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 import yaml
+from typing import Optional
 from simulator.healthcare_analytics import ExceptionEvent, track_event
+from simulator.utils.llm_cache import get_llm_cache
+from simulator.utils.llm_cassette import attach_llm_cassette
+from simulator.utils.prompt_registry import pull_prompt
+from simulator.utils.llm_clients import get_shared_llm, get_http_clients
+from simulator.utils.concurrency import get_model_rate_limiter, TokenUsageHandler
 from langchain_core.messages import HumanMessage, AIMessage
 import pandas as pd
 
-LLM_ENV = yaml.safe_load(open('config/llm_env.yml', 'r'))
+# The providers credentials, loaded on first use (see get_llm_env)
+LLM_ENV = None
+
+
+def get_llm_env() -> dict:
+    """
+    Load the providers credentials (config/llm_env.yml) on first use
+    """
+    global LLM_ENV
+    if LLM_ENV is None:
+        with open('config/llm_env.yml', 'r') as f:
+            LLM_ENV = yaml.safe_load(f)
+    return LLM_ENV
 
 
 def get_prompt_template(args: dict) -> ChatPromptTemplate:
     if "prompt_hub_name" in args:
         hub_key = args.get("prompt_hub_key", None)
-        return hub.pull(args["prompt_hub_name"], api_key=hub_key)
+        return pull_prompt(args["prompt_hub_name"], api_key=hub_key)
     elif "prompt" in args:
         return args["prompt"]
     elif 'from_str' in args:
@@ -43,6 +55,17 @@ def get_prompt_template(args: dict) -> ChatPromptTemplate:
         raise ValueError("Either prompt or prompt_hub_name should be provided")
 
 
+def get_message_text(msg) -> Optional[str]:
+    """
+    The text of a (langchain) message, None if its content is a list without a text part
+    """
+    if isinstance(msg.content, list):
+        if (not msg.content) or ('text' not in msg.content[0].keys()):
+            return None
+        return msg.content[0]['text']
+    return msg.content
+
+
 def convert_messages_to_str(messages: list, with_tools=False) -> str:
     """
     Convert a list of (langchain) messages to a string
@@ -62,12 +85,9 @@ def convert_messages_to_str(messages: list, with_tools=False) -> str:
                 formatted_string += f"chatbot tool_response: {msg.content}\n"
             continue
 
-        if isinstance(msg.content, list):
-            if (not msg.content) or ('text' not in msg.content[0].keys()):
-                continue
-            msg_content = msg.content[0]['text']
-        else:
-            msg_content = msg.content
+        msg_content = get_message_text(msg)
+        if msg_content is None:
+            continue
         msg_content = msg_content.rstrip('\n')
 
         formatted_string += f"{'user' if isinstance(msg, HumanMessage) else 'chatbot'}: {msg_content}\n"
@@ -89,10 +109,21 @@ def data_to_str(data: dict[pd.DataFrame]):
                       name, df in data.items()])
 
 
+def attach_llm_cache(llm: BaseChatModel):
+    """
+    Attach the process-wide LLM cache to the model (if the cache is initialized and the model has no cache setting)
+    """
+    cache = get_llm_cache()
+    if cache is not None and getattr(llm, 'cache', False) is None:
+        llm.cache = cache
+
+
 def set_llm_chain(llm: BaseChatModel, **kwargs) -> Runnable:
     """
     Initialize a chain
     """
+    attach_llm_cache(llm)
+    attach_llm_cassette(llm)
     system_prompt_template = get_prompt_template(kwargs)
     if "structure" in kwargs:
         return system_prompt_template | llm.with_structured_output(kwargs["structure"])
@@ -195,9 +226,12 @@ def get_dummy_callback():
 
 
 def set_callback(llm_type):
+    # The providers packages are imported only when they are used (importing them is slow)
     if llm_type.lower() == 'openai' or llm_type.lower() == 'azure':
+        from langchain_community.callbacks import get_openai_callback
         callback = get_openai_callback
     elif llm_type.lower() == 'anthropic_bedrock':
+        from langchain_community.callbacks.manager import get_bedrock_anthropic_callback
         callback = get_bedrock_anthropic_callback
     else:
         callback = get_dummy_callback
@@ -229,7 +263,21 @@ def load_yaml_content(yaml_content: str) -> dict:
 
 def get_llm(config: dict, timeout=60):
     """
-    Returns the LLM model
+    Returns the LLM model. The models are shared: all the calls with the same (normalized) config get the same
+    client, and the clients of the same provider endpoint share their HTTP connections pools
+    :param config: dictionary with the configuration
+    :return: The llm model
+    """
+    llm = get_shared_llm(config, timeout, create_llm)
+    if config.get('cache', False):
+        attach_llm_cache(llm)  # The cache may be initialized after the client was created
+    attach_llm_cassette(llm)  # The recording/replay applies to all the models (including the ones without cache)
+    return llm
+
+
+def create_llm(config: dict, timeout=60):
+    """
+    Create a new LLM model
     :param config: dictionary with the configuration
     :return: The llm model
     """
@@ -241,38 +289,46 @@ def get_llm(config: dict, timeout=60):
         model_kwargs = config['model_kwargs']
     else:
         model_kwargs = {}
+    LLM_ENV = get_llm_env()
 
+    # The providers packages are imported only when they are used (importing them is slow)
     if config['type'].lower() == 'openai':
+        from langchain_openai import ChatOpenAI
         if LLM_ENV['openai']['OPENAI_ORGANIZATION'] == '':
-            return ChatOpenAI(temperature=temperature, model_name=config['name'],
-                              openai_api_key=config.get('openai_api_key', LLM_ENV['openai']['OPENAI_API_KEY']),
-                              openai_api_base=config.get('openai_api_base', 'https://api.openai.com/v1'),
-                              model_kwargs=model_kwargs, timeout=timeout)
+            llm = ChatOpenAI(temperature=temperature, model_name=config['name'],
+                             openai_api_key=config.get('openai_api_key', LLM_ENV['openai']['OPENAI_API_KEY']),
+                             openai_api_base=config.get('openai_api_base', 'https://api.openai.com/v1'),
+                             model_kwargs=model_kwargs, timeout=timeout,
+                             **get_http_clients(config.get('openai_api_base', 'https://api.openai.com/v1'), timeout))
         else:
-            return ChatOpenAI(temperature=temperature, model_name=config['name'],
-                              openai_api_key=config.get('openai_api_key', LLM_ENV['openai']['OPENAI_API_KEY']),
-                              openai_api_base=config.get('openai_api_base', 'https://api.openai.com/v1'),
-                              openai_organization=config.get('openai_organization',
-                                                             LLM_ENV['openai']['OPENAI_ORGANIZATION']),
-                              model_kwargs=model_kwargs, timeout=timeout)
+            llm = ChatOpenAI(temperature=temperature, model_name=config['name'],
+                             openai_api_key=config.get('openai_api_key', LLM_ENV['openai']['OPENAI_API_KEY']),
+                             openai_api_base=config.get('openai_api_base', 'https://api.openai.com/v1'),
+                             openai_organization=config.get('openai_organization',
+                                                            LLM_ENV['openai']['OPENAI_ORGANIZATION']),
+                             model_kwargs=model_kwargs, timeout=timeout,
+                             **get_http_clients(config.get('openai_api_base', 'https://api.openai.com/v1'), timeout))
     elif config['type'].lower() == 'azure':
-        return AzureChatOpenAI(temperature=temperature, azure_deployment=config['name'],
-                               openai_api_key=config.get('openai_api_key', LLM_ENV['azure']['AZURE_OPENAI_API_KEY']),
-                               azure_endpoint=config.get('azure_endpoint', LLM_ENV['azure']['AZURE_OPENAI_ENDPOINT']),
-                               openai_api_version=config.get('openai_api_version',
-                                                             LLM_ENV['azure']['OPENAI_API_VERSION']),
-                               timeout=timeout)
+        from langchain_openai.chat_models import AzureChatOpenAI
+        llm = AzureChatOpenAI(temperature=temperature, azure_deployment=config['name'],
+                              openai_api_key=config.get('openai_api_key', LLM_ENV['azure']['AZURE_OPENAI_API_KEY']),
+                              azure_endpoint=config.get('azure_endpoint', LLM_ENV['azure']['AZURE_OPENAI_ENDPOINT']),
+                              openai_api_version=config.get('openai_api_version',
+                                                            LLM_ENV['azure']['OPENAI_API_VERSION']),
+                              timeout=timeout,
+                              **get_http_clients(config.get('azure_endpoint', LLM_ENV['azure']['AZURE_OPENAI_ENDPOINT']),
+                                                 timeout))
 
     elif config['type'].lower() == 'google':
         from langchain_google_genai import ChatGoogleGenerativeAI
-        return ChatGoogleGenerativeAI(temperature=temperature, model=config['name'],
-                                      google_api_key=LLM_ENV['google']['GOOGLE_API_KEY'],
-                                      model_kwargs=model_kwargs, timeout=timeout)
+        llm = ChatGoogleGenerativeAI(temperature=temperature, model=config['name'],
+                                     google_api_key=LLM_ENV['google']['GOOGLE_API_KEY'],
+                                     model_kwargs=model_kwargs, timeout=timeout)
     elif config['type'].lower() == 'oracle':
         from langchain_community.chat_models.oci_generative_ai import ChatOCIGenAI
         if not "max_tokens" in model_kwargs:
             model_kwargs['max_tokens'] = 4000
-        return ChatOCIGenAI(
+        llm = ChatOCIGenAI(
             model_id=config['name'],
             service_endpoint=LLM_ENV['oracle']['SERVICE_ENDPOINT'],
             compartment_id=LLM_ENV['oracle']['COMPARTMENT_ID'],
@@ -281,22 +337,28 @@ def get_llm(config: dict, timeout=60):
 
     elif config['type'].lower() == 'anthropic_vertex':
         from langchain_google_vertexai.model_garden import ChatAnthropicVertex
-        return ChatAnthropicVertex(temperature=temperature, model=config['name'],
-                                   project=LLM_ENV['anthropic_vertex']['PROJECT_ID'],
-                                   location=LLM_ENV['anthropic_vertex']['REGION'],
-                                   model_kwargs=model_kwargs, timeout=timeout)
+        llm = ChatAnthropicVertex(temperature=temperature, model=config['name'],
+                                  project=LLM_ENV['anthropic_vertex']['PROJECT_ID'],
+                                  location=LLM_ENV['anthropic_vertex']['REGION'],
+                                  model_kwargs=model_kwargs, timeout=timeout)
 
     elif config['type'].lower() == 'anthropic':
         from langchain_anthropic import ChatAnthropic
-        return ChatAnthropic(temperature=temperature, model=config['name'],
-                             anthropic_api_key=LLM_ENV['anthropic']['ANTHROPIC_KEY'],
-                             model_kwargs=model_kwargs, timeout=timeout)
+        llm = ChatAnthropic(temperature=temperature, model=config['name'],
+                            anthropic_api_key=LLM_ENV['anthropic']['ANTHROPIC_KEY'],
+                            model_kwargs=model_kwargs, timeout=timeout)
+
+    elif config['type'].lower() in ('mock', 'replay'):
+        # A local stand-in model (for benchmarks and offline runs)
+        from simulator.utils.mock_llm import MockChatModel
+        llm = MockChatModel(settings=config)
 
     elif config['type'].lower() == 'huggingfacepipeline':
+        from langchain_community.llms import HuggingFacePipeline
         device = config.get('gpu_device', -1)
         device_map = config.get('device_map', None)
 
-        return HuggingFacePipeline.from_model_id(
+        llm = HuggingFacePipeline.from_model_id(
             model_id=config['name'],
             task="text-generation",
             pipeline_kwargs={"max_new_tokens": config['max_new_tokens']},
@@ -305,3 +367,13 @@ def get_llm(config: dict, timeout=60):
         )
     else:
         raise NotImplementedError("LLM not implemented")
+    if not config.get('cache', False):
+        # The cache is opt-in: the sampled models (the simulated user, the chatbot) must not replay the same dialogs
+        llm.cache = False
+    else:
+        attach_llm_cache(llm)
+    rate_limiter = get_model_rate_limiter(config)
+    if rate_limiter is not None and hasattr(llm, 'rate_limiter'):
+        llm.rate_limiter = rate_limiter
+        llm.callbacks = (llm.callbacks or []) + [TokenUsageHandler(rate_limiter)]
+    return llm
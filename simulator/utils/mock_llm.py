@@ -0,0 +1,238 @@
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Any, Callable, Optional, Sequence
+import yaml
+from pydantic import PrivateAttr
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# The default configuration of the mock model (can be overridden in the llm config)
+MOCK_LLM_CONFIG = {'seed': 0,
+                   'latency': {'distribution': 'constant', 'mean': 0, 'std': 0},  # in seconds (constant/normal/lognormal)
+                   'errors': {'rate': 0, 'types': {'RateLimitError': 0.5, 'TimeoutError': 0.5}},
+                   'tool_call_rate': 0.5,  # The probability of a tool call (when tools are bound and not required)
+                   'stop_after': 3,  # The number of user turns before the simulated user sends '###STOP'
+                   # The text response template, the default can be parsed by the user parser (thought mode), as a
+                   # YAML dict (events executors) and it passes the critique ('CORRECT')
+                   'text_template': 'Thought: {sentence}\nUser Response: {sentence} CORRECT',
+                   'stop_template': 'Thought: {sentence}\nUser Response: ###STOP',
+                   'responses': {},  # Scripted outputs by schema/tool name (merged over the generated arguments)
+                   'script_path': ''}  # A YAML file {name: [outputs]}, served in order (cycling)
+
+WORDS = ['the', 'user', 'flight', 'order', 'booking', 'policy', 'request', 'account', 'change', 'refund', 'item',
+         'reservation', 'payment', 'status', 'update', 'cancel', 'details', 'information', 'customer', 'support',
+         'please', 'check', 'confirm', 'return', 'exchange', 'address', 'date', 'ticket', 'class', 'price']
+
+# The responders registered by the code, by schema/tool name: (messages, rng) -> the output arguments (or text)
+mock_responders = {}
+
+
+class RateLimitError(Exception):
+    """A simulated provider rate limit error"""
+
+
+class MockLLMError(Exception):
+    """A simulated provider error"""
+
+
+def register_mock_responder(name: str, responder: Callable[[list[BaseMessage], random.Random], Any]):
+    """
+    Register a responder of the mock model
+    :param name: The structured output schema name, the tool name, or 'text' for the text responses
+    :param responder: A function (messages, rng) -> the output arguments dict (or the text for 'text')
+    """
+    mock_responders[name] = responder
+
+
+def get_sentence(rng: random.Random, n_words: int = 8) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + '.'
+
+
+def generate_value(schema: dict, rng: random.Random, defs: dict) -> Any:
+    """
+    Generate a random value of a JSON schema
+    """
+    if '$ref' in schema:
+        schema = defs.get(schema['$ref'].split('/')[-1], {})
+    for key in ('anyOf', 'oneOf', 'allOf'):
+        if key in schema:
+            options = [option for option in schema[key] if option.get('type') != 'null']
+            return generate_value(options[0] if options else {}, rng, defs)
+    if 'enum' in schema:
+        return rng.choice(schema['enum'])
+    schema_type = schema.get('type', 'string')
+    if schema_type == 'integer':
+        return rng.randint(0, 10)
+    if schema_type == 'number':
+        return round(rng.uniform(0, 10), 2)
+    if schema_type == 'boolean':
+        return rng.random() < 0.5
+    if schema_type == 'array':
+        return [generate_value(schema.get('items', {}), rng, defs) for _ in range(rng.randint(1, 3))]
+    if schema_type == 'object':
+        required = schema.get('required', list(schema.get('properties', {})))
+        return {name: generate_value(property_schema, rng, defs)
+                for name, property_schema in schema.get('properties', {}).items()
+                if name in required or rng.random() < 0.5}
+    return get_sentence(rng)
+
+
+def messages_to_text(messages: list[BaseMessage]) -> str:
+    return '\n'.join(f'{message.type}: {message.content}' for message in messages)
+
+
+class MockChatModel(BaseChatModel):
+    """
+    A deterministic local stand-in for the providers models. Each call is seeded by the model seed and the request
+    content, so the same request always gets the same response. Structured outputs and tool calls are generated
+    from the tools JSON schemas, and can be scripted by name (responses config, a script file or a registered
+    responder). The simulated user sends '###STOP' after stop_after user turns. The latency and the error
+    distributions are configurable, they are drawn per attempt (seeded by the request content and the attempt
+    number), so a retried request that failed can succeed.
+    """
+    settings: dict = {}  # The llm config (merged over MOCK_LLM_CONFIG)
+    _script: dict = PrivateAttr(default_factory=dict)
+    _script_counters: dict = PrivateAttr(default_factory=dict)
+    _attempts: dict = PrivateAttr(default_factory=dict)  # The number of attempts of each request content
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.settings = {**MOCK_LLM_CONFIG, **self.settings}
+        if self.settings.get('script_path'):
+            with open(self.settings['script_path'], 'r') as f:
+                self._script = yaml.safe_load(f) or {}
+
+    @property
+    def _llm_type(self) -> str:
+        return 'mock-chat'
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {'model_name': self.settings.get('name', 'mock'), 'seed': self.settings['seed']}
+
+    def bind_tools(self, tools: Sequence, tool_choice: Optional[str] = None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], tool_choice=tool_choice, **kwargs)
+
+    def get_content_key(self, messages: list[BaseMessage], tools: Optional[list]) -> str:
+        content = f"{self.settings['seed']}\n{messages_to_text(messages)}\n{json.dumps(tools, sort_keys=True, default=str)}"
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get_rng(self, messages: list[BaseMessage], tools: Optional[list]) -> random.Random:
+        """
+        The random generator of the response (seeded by the request content)
+        """
+        return random.Random(int(self.get_content_key(messages, tools)[:16], 16))
+
+    def get_attempt_rng(self, messages: list[BaseMessage], tools: Optional[list]) -> random.Random:
+        """
+        The random generator of the latency and the errors of a call (seeded by the request content and the number
+        of previous attempts of the same request)
+        """
+        key = self.get_content_key(messages, tools)
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+        return random.Random(f'{key}:{attempt}')
+
+    def get_scripted(self, name: str) -> Optional[Any]:
+        outputs = self._script.get(name)
+        if not outputs:
+            return None
+        with self._lock:
+            index = self._script_counters.get(name, 0)
+            self._script_counters[name] = index + 1
+        return outputs[index % len(outputs)]
+
+    def get_output(self, name: str, messages: list[BaseMessage], rng: random.Random, generate: Callable) -> Any:
+        """
+        The output of a schema/tool/text: a registered responder, then the script, then the generated output (with
+        the scripted responses merged over it)
+        """
+        if name in mock_responders:
+            return mock_responders[name](messages, rng)
+        scripted = self.get_scripted(name)
+        if scripted is not None:
+            return scripted
+        if self.settings.get('type', 'mock').lower() == 'replay':
+            raise ValueError(f'The replay model has no scripted output for {name}')
+        output = generate()
+        if isinstance(output, dict):
+            output.update(self.settings['responses'].get(name, {}))
+        return output
+
+    def get_text(self, messages: list[BaseMessage], rng: random.Random) -> str:
+        template = self.settings['text_template']
+        last_message = messages[-1].content if messages and isinstance(messages[-1].content, str) else ''
+        if '# Conversation:' in last_message:
+            # The simulated user: stop after stop_after user turns
+            n_turns = len(re.findall(r'^user: ', last_message, re.MULTILINE))
+            if n_turns >= self.settings['stop_after']:
+                template = self.settings['stop_template']
+        return self.get_output('text', messages, rng,
+                               lambda: re.sub('{sentence}', lambda _: get_sentence(rng), template))
+
+    def get_tool_call(self, tool: dict, messages: list[BaseMessage], rng: random.Random) -> dict:
+        function = tool.get('function', tool)
+        name = function.get('name', tool.get('title', 'tool'))
+        parameters = function.get('parameters', function.get('input_schema', {}))
+        args = self.get_output(name, messages, rng,
+                               lambda: generate_value(parameters, rng, parameters.get('$defs', {})))
+        return {'name': name, 'args': args, 'id': f'call_{rng.getrandbits(48):012x}', 'type': 'tool_call'}
+
+    def raise_error(self, attempt_rng: random.Random):
+        """
+        Raise a simulated error according to the errors distribution
+        """
+        errors = self.settings['errors']
+        if errors.get('rate', 0) and attempt_rng.random() < errors['rate']:
+            error_type = attempt_rng.choices(list(errors['types']), weights=list(errors['types'].values()))[0]
+            error_class = {'RateLimitError': RateLimitError, 'TimeoutError': TimeoutError}.get(error_type,
+                                                                                                MockLLMError)
+            raise error_class(f'Simulated {error_type}')
+
+    def get_message(self, messages: list[BaseMessage], tools: Optional[list], tool_choice: Optional[Any]) -> AIMessage:
+        rng = self.get_rng(messages, tools)
+        tool_calls = []
+        if tools:
+            required = tool_choice not in (None, 'none', 'auto')
+            answered = bool(messages) and isinstance(messages[-1], ToolMessage)
+            if required or (not answered and rng.random() < self.settings['tool_call_rate']):
+                if isinstance(tool_choice, str) and tool_choice not in ('any', 'required'):
+                    tools = [t for t in tools if t.get('function', t).get('name') == tool_choice] or tools
+                tool_calls = [self.get_tool_call(rng.choice(tools), messages, rng)]
+        content = '' if tool_calls else self.get_text(messages, rng)
+        input_tokens = len(messages_to_text(messages)) // 4
+        output_tokens = (len(content) + len(json.dumps([t['args'] for t in tool_calls], default=str))) // 4
+        return AIMessage(content=content, tool_calls=tool_calls,
+                         usage_metadata={'input_tokens': input_tokens, 'output_tokens': output_tokens,
+                                         'total_tokens': input_tokens + output_tokens})
+
+    def get_latency(self, rng: random.Random) -> float:
+        latency = self.settings['latency']
+        if latency.get('distribution') == 'normal':
+            return max(0.0, rng.gauss(latency.get('mean', 0), latency.get('std', 0)))
+        if latency.get('distribution') == 'lognormal' and latency.get('mean', 0) > 0:
+            return rng.lognormvariate(0, latency.get('std', 0)) * latency['mean']
+        return latency.get('mean', 0)
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None,
+                  tools: Optional[list] = None, tool_choice: Optional[Any] = None, **kwargs) -> ChatResult:
+        attempt_rng = self.get_attempt_rng(messages, tools)
+        time.sleep(self.get_latency(attempt_rng))
+        self.raise_error(attempt_rng)
+        return ChatResult(generations=[ChatGeneration(message=self.get_message(messages, tools, tool_choice))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None,
+                         tools: Optional[list] = None, tool_choice: Optional[Any] = None, **kwargs) -> ChatResult:
+        attempt_rng = self.get_attempt_rng(messages, tools)
+        await asyncio.sleep(self.get_latency(attempt_rng))
+        self.raise_error(attempt_rng)
+        return ChatResult(generations=[ChatGeneration(message=self.get_message(messages, tools, tool_choice))])
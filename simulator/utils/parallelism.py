@@ -1,11 +1,17 @@
 from simulator.utils.logger_config import get_logger, ConsoleColor
-from typing import Any
+from typing import Any, Callable, Iterable, Optional
+from dataclasses import dataclass, field
 from langchain_core.callbacks import BaseCallbackHandler
 import contextlib
 from tqdm import trange, tqdm
 import concurrent.futures
 import asyncio
+import inspect
+import contextvars
+import time
 from simulator.healthcare_analytics import ExceptionEvent, track_event
+from simulator.utils.concurrency import AdaptiveConcurrencyLimiter, is_throttling_error
+from simulator.utils.retry import RetryPolicy
 
 
 def batch_invoke(llm_function, inputs: list[Any], num_workers: int, callbacks: list[BaseCallbackHandler]) -> list[Any]:
@@ -50,52 +56,93 @@ def batch_invoke(llm_function, inputs: list[Any], num_workers: int, callbacks: l
 
 
 async def batch_ainvoke(llm_async_function, inputs: list[Any], num_workers: int,
-                        callbacks: list[BaseCallbackHandler], timeout: int = 5) -> list[Any]:
+                        callbacks: list[BaseCallbackHandler], timeout: int = 5,
+                        limiter: AdaptiveConcurrencyLimiter = None, retry_policy: RetryPolicy = None,
+                        latency_signal: bool = False) -> list[Any]:
     """
     Invoke a langchain runnable function in parallel
     :param llm_async_function: The agent invoking function
     :param inputs: The list of all inputs
-    :param num_workers: The number of workers
+    :param num_workers: The number of workers (the initial concurrency limit)
     :param callbacks: Langchain callbacks list
     :param timeout: The timeout for each task (in seconds)
-    :return: A list of results
+    :param limiter: The concurrency limiter. If None, an adaptive limiter is created according to the concurrency
+    configuration
+    :param retry_policy: The retry policy of the batch. If None, it is created according to the retry configuration
+    :param latency_signal: If True, a latency spike decreases the concurrency limit. Only for tasks that are a
+    single LLM call, the duration of a dialog or a pack depends on its work (and not only on the provider load)
+    :return: A list of results, each result contains also the number of retries and the usage of all the attempts
     """
     logger = get_logger()
+    if limiter is None:
+        limiter = AdaptiveConcurrencyLimiter.from_config(num_workers)
+    if retry_policy is None:
+        retry_policy = RetryPolicy.from_config(len(inputs))
+
     def sample_generator():
         for i, sample in enumerate(inputs):
             yield i, sample
 
-    async def process_sample_with_progress(sample):
+    async def process_sample_with_progress(sample, generation):
         i, sample = sample
         error = None
-        with contextlib.ExitStack() as stack:
-            CB = [stack.enter_context(callback()) for callback in callbacks]
-            try:
-                result = await llm_async_function(sample)
-            except Exception as e:
-                logger.error('Error in chain invoke: {}'.format(e))
-                result = None
-                error = 'Error while running: ' + str(e)
-                track_event(ExceptionEvent(exception_type=type(e).__name__,
-                                   error_message=error))
-            for cb in CB:
-                accumulate_usage = cb.total_cost
-        return {'index': i, 'result': result, 'usage': accumulate_usage, 'error': error}
+        error_type = None
+        try:
+            result = await llm_async_function(sample)
+        except Exception as e:
+            logger.error('Error in chain invoke: {}'.format(e))
+            result = None
+            error = 'Error while running: ' + str(e)
+            error_type = type(e).__name__
+            if is_throttling_error(e):
+                limiter.on_throttle(generation)
+                error_type = 'RateLimitError'
+            track_event(ExceptionEvent(exception_type=type(e).__name__,
+                               error_message=error))
+        return {'index': i, 'result': result, 'error': error, 'error_type': error_type}
 
-    semaphore = asyncio.Semaphore(num_workers)  # Limit to 2 workers
+    # Running a single attempt, after acquiring a slot from the concurrency limiter
+    async def attempt_runner(func_input):
+        generation = await limiter.acquire()
+        start_time = time.monotonic()
+        try:
+            # The callbacks are entered outside the timeout, so the usage of a timed out attempt is still counted
+            with contextlib.ExitStack() as stack:
+                CB = [stack.enter_context(callback()) for callback in callbacks]
+                try:
+                    result = await asyncio.wait_for(process_sample_with_progress(func_input, generation),
+                                                    timeout=timeout)
+                    if result['error'] is None:
+                        limiter.on_success(time.monotonic() - start_time if latency_signal else None, generation)
+                except asyncio.TimeoutError as e:
+                    print(f"Task reached timeout and was terminated.")
+                    limiter.on_throttle(generation)
+                    error_message = 'Timeout'
+                    track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                       error_message=error_message))
+                    result = {'index': func_input[0], 'result': None,
+                              'error': error_message, 'error_type': 'TimeoutError'}
+                result['usage'] = 0
+                for cb in CB:
+                    result['usage'] = cb.total_cost
+            return result
+        finally:
+            await limiter.release()
 
-    # Task runner that acquires the semaphore
+    # Task runner that retries failed attempts (the backoff sleep does not hold a limiter slot)
     async def task_runner(func_input):
-        async with semaphore:
-            try:
-                return await asyncio.wait_for(process_sample_with_progress(func_input), timeout=timeout)
-            except asyncio.TimeoutError as e:
-                print(f"Task reached timeout and was terminated.")
-                error_message = 'Timeout'
-                track_event(ExceptionEvent(exception_type=type(e).__name__,
-                                   error_message=error_message))
-                return {'index': func_input[0], 'result': None, 'usage': 0,
-                        'error': 'error_message'}  # Return None or any appropriate value for a failed task
+        attempt = 0
+        total_usage = 0
+        while True:
+            result = await attempt_runner(func_input)
+            attempt += 1
+            total_usage += result['usage']
+            if result['error'] is None or not retry_policy.should_retry(result['error_type'], attempt):
+                break
+            await asyncio.sleep(retry_policy.get_delay(attempt))
+        result['usage'] = total_usage
+        result['retries'] = attempt - 1
+        return result
 
     # Create tasks
     tasks = [task_runner(func_input) for func_input in sample_generator()]
@@ -105,9 +152,188 @@ async def batch_ainvoke(llm_async_function, inputs: list[Any], num_workers: int,
     for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
         result = await task
         results.append(result)
+    if retry_policy.n_retries > 0:
+        n_salvaged = sum(1 for r in results if r['retries'] > 0 and r['error'] is None)
+        logger.info(f"{retry_policy.n_retries} retries, {n_salvaged} samples were salvaged, "
+                    f"{sum(1 for r in results if r['error'] is not None)} samples failed")
     return results
 
 
 def async_batch_invoke(llm_async_function, inputs: list[Any], num_workers: int,
-                       callbacks: list[BaseCallbackHandler], timeout: int = 5) -> list[Any]:
-    return asyncio.run(batch_ainvoke(llm_async_function, inputs, num_workers, callbacks, timeout))
+                       callbacks: list[BaseCallbackHandler], timeout: int = 5,
+                       retry_policy: RetryPolicy = None, latency_signal: bool = False) -> list[Any]:
+    return asyncio.run(batch_ainvoke(llm_async_function, inputs, num_workers, callbacks, timeout,
+                                     retry_policy=retry_policy, latency_signal=latency_signal))
+
+
+class ItemUsage:
+    """
+    The usage of a pipeline item that is not reported by the stage callbacks, e.g. its share of a call that is
+    shared by several items (it is added to the item usage)
+    """
+
+    def __init__(self):
+        self.total_cost = 0
+
+
+# The extra usage of the pipeline item that is processed in the current context
+current_item_usage = contextvars.ContextVar('current_item_usage', default=None)
+
+
+def get_item_usage() -> Optional[ItemUsage]:
+    """
+    :return: The extra usage of the current pipeline item (None outside of a pipeline stage)
+    """
+    return current_item_usage.get()
+
+
+@dataclass
+class PipelineStage:
+    """
+    A stage of a streaming pipeline: an async function that maps a single item to the input of the next stage
+    """
+    name: str
+    function: Callable
+    num_workers: int = 1
+    timeout: int = 60
+    callbacks: list = field(default_factory=list)
+    queue_size: int = None  # The size of the stage input queue (default: 2 * num_workers)
+
+
+async def pipeline_ainvoke(stages: list[PipelineStage], inputs: Iterable[Any], n_inputs: int = None,
+                           on_result: Callable = None, stop_event: asyncio.Event = None,
+                           keep_results: bool = True) -> list[dict]:
+    """
+    Run the inputs through a pipeline of stages. Each stage has its own bounded queue and pool of workers, and each
+    item moves to the next stage as soon as it is processed, so there is no barrier between the stages.
+    :param stages: The pipeline stages
+    :param inputs: The pipeline inputs (can be a lazy iterable or an async iterable)
+    :param n_inputs: The number of inputs (for the progress bar and the retry budget). If None, the retry budget
+    grows as the inputs are fed
+    :param on_result: A callback (or an async callback) that is called with each result as soon as it leaves the
+    pipeline
+    :param stop_event: If set, no new inputs are fed into the pipeline (items in flight are completed). A
+    threading.Event can be set by another thread
+    :param keep_results: If False, the results are only passed to on_result (and an empty list is returned)
+    :return: A list of results {'index', 'result', 'usage', 'error', 'stage'} (in order of completion)
+    """
+    logger = get_logger()
+    queues = [asyncio.Queue(maxsize=stage.queue_size if stage.queue_size is not None else 2 * stage.num_workers)
+              for stage in stages]
+    finished_workers = [0] * len(stages)
+    retry_policy = RetryPolicy.from_config(n_inputs if n_inputs is not None else 0)
+    results = []
+    stop_signal = object()
+    # The items that entered each stage and did not leave it yet (including the items waiting for a retry), a stage is
+    # stopped once its upstream is done and it has no items in flight
+    in_flight = [0] * len(stages)
+    upstream_done = [False] * len(stages)
+    stopped = [False] * len(stages)
+    retry_tasks = set()
+    pbar = tqdm(total=n_inputs, desc="Processing samples")
+
+    async def run_stage_item(stage: PipelineStage, item):
+        error = None
+        error_type = None
+        usage = 0
+        item_usage = ItemUsage()
+        token = current_item_usage.set(item_usage)  # The stage function task runs in a copy of this context
+        with contextlib.ExitStack() as stack:
+            CB = [stack.enter_context(callback()) for callback in stage.callbacks]
+            try:
+                result = await asyncio.wait_for(stage.function(item), timeout=stage.timeout)
+            except asyncio.TimeoutError as e:
+                result = None
+                error = 'Timeout'
+                error_type = 'TimeoutError'
+                track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                           error_message=error))
+            except Exception as e:
+                logger.error('Error in chain invoke: {}'.format(e))
+                result = None
+                error = 'Error while running: ' + str(e)
+                error_type = 'RateLimitError' if is_throttling_error(e) else type(e).__name__
+                track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                           error_message=error))
+            for cb in CB:
+                usage = cb.total_cost
+        current_item_usage.reset(token)
+        return result, usage + item_usage.total_cost, error, error_type
+
+    async def finish(result: dict):
+        if keep_results:
+            results.append(result)
+        pbar.update(1)
+        if on_result is not None:
+            callback_result = on_result(result)
+            if inspect.isawaitable(callback_result):
+                await callback_result
+
+    async def stop_stage_if_done(k: int):
+        if upstream_done[k] and in_flight[k] == 0 and not stopped[k]:
+            stopped[k] = True
+            for _ in range(stages[k].num_workers):
+                await queues[k].put(stop_signal)
+
+    async def retry_item(k: int, item, delay: float):
+        await asyncio.sleep(delay)
+        await queues[k].put(item)
+
+    async def worker(k: int):
+        stage = stages[k]
+        while True:
+            item = await queues[k].get()
+            if item is stop_signal:
+                break
+            i, value, total_usage, attempt = item
+            result, usage, error, error_type = await run_stage_item(stage, value)
+            attempt += 1
+            total_usage += usage
+            if error is not None and retry_policy.should_retry(error_type, attempt):
+                # The item is enqueued again after the backoff, so the delay does not hold a worker
+                task = asyncio.create_task(retry_item(k, (i, value, total_usage, attempt),
+                                                      retry_policy.get_delay(attempt)))
+                retry_tasks.add(task)
+                task.add_done_callback(retry_tasks.discard)
+                continue
+            if error is not None:
+                await finish({'index': i, 'result': None, 'usage': total_usage, 'error': error, 'stage': stage.name})
+            elif k == len(stages) - 1:
+                await finish({'index': i, 'result': result, 'usage': total_usage, 'error': None, 'stage': stage.name})
+            else:
+                in_flight[k + 1] += 1
+                await queues[k + 1].put((i, result, total_usage, 0))
+            in_flight[k] -= 1
+            await stop_stage_if_done(k)
+        # Once all the workers of the stage are done, the next stage has no more inputs
+        finished_workers[k] += 1
+        if finished_workers[k] == stage.num_workers and k < len(stages) - 1:
+            upstream_done[k + 1] = True
+            await stop_stage_if_done(k + 1)
+
+    async def producer():
+        if hasattr(inputs, '__aiter__'):
+            i = 0
+            async for value in inputs:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                in_flight[0] += 1
+                if n_inputs is None:
+                    retry_policy.add_samples()
+                await queues[0].put((i, value, 0, 0))
+                i += 1
+        else:
+            for i, value in enumerate(inputs):
+                if stop_event is not None and stop_event.is_set():
+                    break
+                in_flight[0] += 1
+                if n_inputs is None:
+                    retry_policy.add_samples()
+                await queues[0].put((i, value, 0, 0))
+        upstream_done[0] = True
+        await stop_stage_if_done(0)
+
+    workers = [worker(k) for k, stage in enumerate(stages) for _ in range(stage.num_workers)]
+    await asyncio.gather(producer(), *workers)
+    pbar.close()
+    return results
@@ -0,0 +1,145 @@
+import os
+import argparse
+import threading
+from typing import Any, Optional
+from langchain_core.load import dumps, loads
+from simulator.utils.logger_config import get_logger, ConsoleColor
+from simulator.healthcare_analytics import ExceptionEvent, track_event
+
+# The default configuration of the local prompt registry (can be updated by set_prompt_registry_config)
+PROMPT_REGISTRY_CONFIG = {'enabled': True,  # If False, every prompt is pulled from the hub
+                          'path': 'config/prompt_registry',  # The registry directory
+                          'offline': False}  # If True, a prompt that is missing from the registry raises an error
+
+# Prompts that are pulled by the code (and not through the configuration)
+CODE_PROMPTS = ['eladlev/planner_event_generator']
+
+# The parsed prompts, by hub name
+memoized_prompts = {}
+memoized_prompts_lock = threading.Lock()
+
+
+def set_prompt_registry_config(config: dict):
+    """
+    Update the prompt registry configuration
+    :param config: The prompt registry configuration
+    """
+    PROMPT_REGISTRY_CONFIG.update(config)
+
+
+def get_prompt_path(name: str) -> str:
+    """
+    The registry file of a hub prompt: <registry>/<owner>/<repo>/<commit>.json (latest.json for unpinned names)
+    :param name: The hub name, e.g. 'eladlev/description_generation:c7ecf9ea'
+    """
+    repo, _, commit = name.partition(':')
+    return os.path.join(PROMPT_REGISTRY_CONFIG['path'], *repo.split('/'), f'{commit or "latest"}.json')
+
+
+def save_prompt(name: str, prompt: Any):
+    """
+    Save a prompt to the registry, pinned prompts are also saved under their commit hash
+    """
+    paths = [get_prompt_path(name)]
+    commit = (getattr(prompt, 'metadata', None) or {}).get('lc_hub_commit_hash')
+    if commit and ':' not in name:
+        paths.append(get_prompt_path(f'{name}:{commit[:8]}'))
+    content = dumps(prompt, pretty=True)
+    for path in paths:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+def load_prompt(name: str) -> Optional[Any]:
+    """
+    Load a prompt from the registry
+    :return: The prompt, None if it is missing
+    """
+    path = get_prompt_path(name)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as f:
+        return loads(f.read())
+
+
+def pull_from_hub(name: str, api_key: str = None) -> Any:
+    from langchain import hub  # The hub client is imported only when a prompt is pulled (importing it is slow)
+    return hub.pull(name, api_key=api_key)
+
+
+def pull_prompt(name: str, api_key: str = None, refresh: bool = False) -> Any:
+    """
+    Resolve a hub prompt: from the process memo, then from the local registry, and only then from the hub (the
+    pulled prompt is saved to the registry)
+    :param name: The hub name, optionally pinned to a commit hash ('owner/repo:commit')
+    :param api_key: The hub api key
+    :param refresh: If True, pull the prompt from the hub even if it is in the registry
+    :return: The prompt
+    """
+    if not PROMPT_REGISTRY_CONFIG['enabled']:
+        return pull_from_hub(name, api_key=api_key)
+    with memoized_prompts_lock:
+        if not refresh and name in memoized_prompts:
+            return memoized_prompts[name]
+    prompt = None if refresh else load_prompt(name)
+    if prompt is None:
+        if PROMPT_REGISTRY_CONFIG['offline']:
+            error_message = f'The prompt {name} is missing from the prompt registry ({PROMPT_REGISTRY_CONFIG["path"]})'
+            track_event(ExceptionEvent(exception_type='FileNotFoundError', error_message=error_message))
+            raise FileNotFoundError(error_message)
+        prompt = pull_from_hub(name, api_key=api_key)
+        try:
+            save_prompt(name, prompt)
+        except OSError as e:
+            get_logger().warning(f'{ConsoleColor.RED}Failed to save the prompt {name} to the registry: {e}'
+                                 f'{ConsoleColor.RESET}')
+    with memoized_prompts_lock:
+        memoized_prompts[name] = prompt
+    return prompt
+
+
+def get_config_prompts(config: Any) -> list[str]:
+    """
+    Collect all the hub prompts names of a configuration
+    """
+    names = []
+    if isinstance(config, dict):
+        for key, value in config.items():
+            if key == 'prompt_hub_name' and isinstance(value, str):
+                names.append(value)
+            else:
+                names += get_config_prompts(value)
+    elif isinstance(config, list):
+        for value in config:
+            names += get_config_prompts(value)
+    return names
+
+
+def sync_prompts(config: dict, refresh: bool = False) -> list[str]:
+    """
+    Prefetch all the prompts of the configuration (and the prompts that are used by the code) to the registry
+    :param config: The simulator configuration
+    :param refresh: If True, pull all the prompts from the hub again (pinned prompts are not pulled if they exist)
+    :return: The synced prompts names
+    """
+    set_prompt_registry_config(config.get('prompt_registry', {}))
+    names = list(dict.fromkeys(get_config_prompts(config) + CODE_PROMPTS))
+    for name in names:
+        # A pinned commit never changes, so it is pulled only once
+        pull_prompt(name, refresh=refresh and (':' not in name or load_prompt(name) is None))
+        get_logger().info(f'{ConsoleColor.GREEN}Synced {name} -> {get_prompt_path(name)}{ConsoleColor.RESET}')
+    return names
+
+
+if __name__ == '__main__':
+    from simulator.utils.file_reading import override_config
+
+    parser = argparse.ArgumentParser(description='Prefetch the hub prompts to the local prompt registry.')
+    parser.add_argument('--config_path', type=str, default='config/config_default.yml',
+                        help='The configuration diff file path.')
+    parser.add_argument('--refresh', action='store_true', help='Pull the unpinned prompts from the hub again.')
+    args = parser.parse_args()
+    sync_prompts(override_config(args.config_path), refresh=args.refresh)
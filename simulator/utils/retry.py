@@ -0,0 +1,101 @@
+import random
+
+# The default retry configuration (can be updated by set_retry_config)
+RETRY_CONFIG = {'max_attempts': 3,  # The maximal number of attempts per sample (including the first one)
+                'base_delay': 1,  # The backoff delay of the first retry (in seconds)
+                'max_delay': 30,  # The maximal backoff delay (in seconds)
+                'retry_budget': 0.3,  # The maximal number of retries per batch, as a fraction of the batch size
+                # The maximal number of attempts per error class, overrides max_attempts. 1 means no retries
+                'rules': {'TimeoutError': 2,
+                          'RateLimitError': 5,
+                          'AuthenticationError': 1,
+                          'PermissionDeniedError': 1,
+                          'NotFoundError': 1,
+                          'BadRequestError': 1,
+                          'NotImplementedError': 1}}
+
+
+def set_retry_config(config: dict):
+    """
+    Update the retry configuration
+    :param config: The retry configuration
+    """
+    rules = {**RETRY_CONFIG['rules'], **config.get('rules', {})}
+    RETRY_CONFIG.update(config)
+    RETRY_CONFIG['rules'] = rules
+
+
+class RetryPolicy:
+    """
+    The retry policy of a batch: the number of attempts per error class, jittered exponential backoff and a retry
+    budget shared by all the samples of the batch (so a failing provider does not multiply the batch cost).
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1, max_delay: float = 30,
+                 retry_budget: float = 0.3, rules: dict = None, n_samples: int = 0):
+        """
+        Initialize the retry policy.
+        :param max_attempts: The maximal number of attempts per sample (including the first one)
+        :param base_delay: The backoff delay of the first retry (in seconds)
+        :param max_delay: The maximal backoff delay (in seconds)
+        :param retry_budget: The maximal number of retries in the batch. A float < 1 is a fraction of n_samples
+        :param rules: The maximal number of attempts per error class name
+        :param n_samples: The number of samples in the batch
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rules = rules if rules is not None else {}
+        self.retry_budget = retry_budget
+        self.n_samples = n_samples
+        self.n_retries = 0
+
+    @property
+    def remaining_budget(self) -> int:
+        budget = self.retry_budget
+        if isinstance(budget, float) and budget < 1:
+            budget = max(1, int(budget * self.n_samples))
+        return budget - self.n_retries
+
+    def add_samples(self, n_samples: int = 1):
+        """
+        Add samples to the batch (for a stream of an unknown size, the retry budget grows as the samples arrive)
+        :param n_samples: The number of new samples
+        """
+        self.n_samples += n_samples
+
+    @classmethod
+    def from_config(cls, n_samples: int, config: dict = None) -> 'RetryPolicy':
+        """
+        Create a retry policy for a batch according to the retry configuration
+        :param n_samples: The number of samples in the batch
+        :param config: The retry configuration (default: RETRY_CONFIG)
+        """
+        config = config if config is not None else RETRY_CONFIG
+        return cls(max_attempts=config.get('max_attempts', 3),
+                   base_delay=config.get('base_delay', 1),
+                   max_delay=config.get('max_delay', 30),
+                   retry_budget=config.get('retry_budget', 0.3),
+                   rules=config.get('rules', {}),
+                   n_samples=n_samples)
+
+    def get_max_attempts(self, error_type: str) -> int:
+        return self.rules.get(error_type, self.max_attempts)
+
+    def should_retry(self, error_type: str, attempt: int) -> bool:
+        """
+        Check if a failed sample should be retried, and consume the retry budget if so
+        :param error_type: The error class name
+        :param attempt: The number of attempts that were already made
+        """
+        if attempt >= self.get_max_attempts(error_type) or self.remaining_budget <= 0:
+            return False
+        self.n_retries += 1
+        return True
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        The full-jitter exponential backoff delay before the next attempt
+        :param attempt: The number of attempts that were already made
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
@@ -1,128 +1,362 @@
+import os
 import sqlite3
 import threading
+import queue
+import atexit
 from typing import Optional
 import time
 from simulator.healthcare_analytics import ExceptionEvent, track_event
 
+# The insert statement of each table
+INSERT_QUERIES = {'Dialog': "INSERT INTO Dialog (thread_id, role, message, time) VALUES (?, ?, ?, ?)",
+                  'Thoughts': "INSERT INTO Thoughts (thread_id, message, time) VALUES (?, ?, ?)",
+                  'Tools': "INSERT INTO Tools (thread_id, tool_name, input, output, time) VALUES (?, ?, ?, ?, ?)"}
+
+# The tables schema, the seq column is a monotonic sequence number that keeps the insertion order
+TABLES_SCHEMA = {'Dialog': '''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        seq INTEGER PRIMARY KEY,
+                        thread_id TEXT NOT NULL,
+                        role TEXT NOT NULL,
+                        message TEXT NOT NULL,
+                        time INTEGER NOT NULL
+                    )
+                 ''',
+                 'Thoughts': '''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        seq INTEGER PRIMARY KEY,
+                        thread_id TEXT NOT NULL,
+                        message TEXT NOT NULL,
+                        time INTEGER NOT NULL
+                    )
+                 ''',
+                 'Tools': '''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        seq INTEGER PRIMARY KEY,
+                        thread_id TEXT NOT NULL,
+                        tool_name TEXT NOT NULL,
+                        input TEXT,
+                        output TEXT,
+                        time INTEGER NOT NULL
+                    )
+                 '''}
+
+# Per thread summary, maintained on insert
+SUMMARY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS ThreadSummary (
+        thread_id TEXT PRIMARY KEY,
+        n_turns INTEGER NOT NULL DEFAULT 0,
+        n_tool_calls INTEGER NOT NULL DEFAULT 0,
+        n_thoughts INTEGER NOT NULL DEFAULT 0,
+        last_time INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+# The summary counter of each table
+SUMMARY_COUNTERS = {'Dialog': 'n_turns', 'Thoughts': 'n_thoughts', 'Tools': 'n_tool_calls'}
+
+# The maximal number of thread ids per query (SQLite variables limit)
+MAX_QUERY_THREADS = 500
+
+# The columns of each table (without the seq column)
+TABLES_COLUMNS = {'Dialog': ['thread_id', 'role', 'message', 'time'],
+                  'Thoughts': ['thread_id', 'message', 'time'],
+                  'Tools': ['thread_id', 'tool_name', 'input', 'output', 'time']}
+
+
+class ThreadDeletion:
+    """
+    A queued deletion of all the rows of a thread (it is applied after the rows that were queued before it)
+    """
+
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+
+
 class SqliteSaver:
     """A checkpoint saver that stores checkpoints in a SQLite database.
     This class is a inspired by:
     https://github.com/langchain-ai/langgraph/blob/a73f9affab7d7fb1cca477f055a4d503563332d8/libs/checkpoint-sqlite/langgraph/checkpoint/sqlite/__init__.py
+    The inserts are queued and written by a background thread, which group-commits them (WAL mode), so the
+    dialogs never wait for the disk. Each row gets a monotonic sequence number (seq) that keeps the insertion order.
     """
 
 
-    def __init__(self, db_path: str):
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+    def __init__(self, db_path: str, batch_size: int = 500, flush_interval: float = 0.5, writer: bool = True):
+        """
+        Initialize the saver.
+        :param db_path: Path to the SQLite3 database file
+        :param batch_size: The maximal number of rows per commit
+        :param flush_interval: The maximal time (in seconds) a row waits in the queue before it is committed
+        :param writer: If False, the saver is used only for reading (no background writer thread), the database is
+        opened read-only and its tables are not changed (an older database is migrated once)
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
         self.lock = threading.Lock()
+        read_only = not writer and os.path.isfile(db_path)
+        if read_only:
+            self.conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, check_same_thread=False)
+            if not self.is_migrated():
+                self.conn.close()
+                read_only = False
+        if not read_only:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
         self.cursor = self.conn.cursor()
-        self.init_tables()
+        if not read_only:
+            self.init_tables(verbose=writer)
+        self.queue = queue.Queue()
+        self.deleted_threads = set()  # The new rows of these threads are dropped
+        self.closed = not writer
+        self.writer = None
+        if writer:
+            self.writer = threading.Thread(target=self.write_loop, daemon=True)
+            self.writer.start()
+            atexit.register(self.close)
 
 
-    def init_tables(self):
+    def is_migrated(self) -> bool:
         """
-        Creates three tables: Dialog, Thoughts, and Tools in the specified SQLite database.
+        :return: True if the database has all the tables, with the seq column
+        """
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'ThreadSummary' not in tables or not set(TABLES_SCHEMA) <= tables:
+            return False
+        return all('seq' in [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+                   for table in TABLES_SCHEMA)
 
-        Parameters:
-        db_path (str): Path to the SQLite3 database file.
+    def init_tables(self, verbose: bool = True):
+        """
+        Creates three tables: Dialog, Thoughts, and Tools in the specified SQLite database.
+        Tables of older databases (with a time based primary key) are migrated to the seq primary key.
+        :param verbose: Print a message when the tables are ready
         """
         try:
-            # Dialog table with a 'time' column to store Unix timestamps
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS Dialog (
-                    thread_id TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    time INTEGER NOT NULL,
-                    PRIMARY KEY (thread_id, message, time)
-                )
-            ''')
-
-            # Thoughts table with a 'time' column for Unix timestamp
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS Thoughts (
-                    thread_id TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    time INTEGER NOT NULL,
-                    PRIMARY KEY (thread_id, message, time)
-                )
-            ''')
-
-            # Tools table with a 'time' column for Unix timestamp
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS Tools (
-                    thread_id TEXT NOT NULL,
-                    tool_name TEXT NOT NULL,
-                    input TEXT,
-                    output TEXT,
-                    time INTEGER NOT NULL,
-                    PRIMARY KEY (thread_id, tool_name, time)
-                )
-            ''')
+            for table, schema in TABLES_SCHEMA.items():
+                self.cursor.execute(schema.format(table=table))
+                self.migrate_table(table)
+                self.cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table.lower()}_thread ON {table} (thread_id, seq)")
+            has_summary = self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND "
+                                              "name = 'ThreadSummary'").fetchone() is not None
+            self.cursor.execute(SUMMARY_SCHEMA)
+            if not has_summary:
+                self.rebuild_summary()
 
             # Commit the transaction
             self.conn.commit()
-            print("Tables created successfully.")
+            if verbose:
+                print("Tables created successfully.")
 
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
             track_event(ExceptionEvent(exception_type=type(e).__name__,
                                    error_message=str(e)))
 
-    def exit(self):
-        # Commit any changes and close the connection when exiting the context
-        if self.conn:
-            self.conn.commit()
-            self.cursor.close()
-            self.conn.close()
+    def migrate_table(self, table: str):
+        """
+        Migrate a table of an older database (without the seq column), keeping the rows order
+        """
+        columns = [row[1] for row in self.cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+        if 'seq' in columns:
+            return
+        columns_str = ', '.join(TABLES_COLUMNS[table])
+        self.cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        self.cursor.execute(TABLES_SCHEMA[table].format(table=table))
+        self.cursor.execute(f"INSERT INTO {table} ({columns_str}) SELECT {columns_str} FROM {table}_legacy "
+                            f"ORDER BY time ASC, rowid ASC")
+        self.cursor.execute(f"DROP TABLE {table}_legacy")
 
-    def insert_dialog(self, thread_id: str, role: str, message: str):
+    def rebuild_summary(self):
+        """
+        Rebuild the threads summary table from the Dialog, Thoughts and Tools tables
+        """
+        self.cursor.execute("DELETE FROM ThreadSummary")
+        for table, counter in SUMMARY_COUNTERS.items():
+            self.cursor.execute(f"INSERT INTO ThreadSummary (thread_id, {counter}, last_time) "
+                                f"SELECT thread_id, COUNT(*), MAX(time) FROM {table} WHERE true GROUP BY thread_id "
+                                f"ON CONFLICT(thread_id) DO UPDATE SET {counter} = excluded.{counter}, "
+                                f"last_time = MAX(last_time, excluded.last_time)")
+
+    def update_summary(self, rows: list[tuple]):
+        """
+        Update the threads summary with the inserted rows (lock should be held)
+        """
+        summary = {}
+        for table, values in rows:
+            thread_summary = summary.setdefault(values[0], {'n_turns': 0, 'n_thoughts': 0, 'n_tool_calls': 0,
+                                                            'last_time': 0})
+            thread_summary[SUMMARY_COUNTERS[table]] += 1
+            thread_summary['last_time'] = max(thread_summary['last_time'], values[-1])
+        self.cursor.executemany(
+            "INSERT INTO ThreadSummary (thread_id, n_turns, n_thoughts, n_tool_calls, last_time) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(thread_id) DO UPDATE SET "
+            "n_turns = n_turns + excluded.n_turns, n_thoughts = n_thoughts + excluded.n_thoughts, "
+            "n_tool_calls = n_tool_calls + excluded.n_tool_calls, last_time = MAX(last_time, excluded.last_time)",
+            [(thread_id, v['n_turns'], v['n_thoughts'], v['n_tool_calls'], v['last_time'])
+             for thread_id, v in summary.items()])
+
+    def write_loop(self):
+        """
+        The background writer: group-commits the queued rows
+        """
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = []
+            for r in batch:
+                if isinstance(r, tuple):
+                    rows.append(r)
+                elif isinstance(r, ThreadDeletion):
+                    if rows:
+                        self.write_rows(rows)
+                        rows = []
+                    self.delete_rows(r.thread_id)
+            if rows:
+                self.write_rows(rows)
+            # Signal the flush/close requests (only after all the rows before them were committed)
+            for r in batch:
+                if isinstance(r, threading.Event):
+                    r.set()
+            if any(r is None for r in batch):
+                return
+
+    def write_rows(self, rows: list[tuple]):
+        """
+        Commit the rows in a single transaction. If the transaction fails, it is rolled back and the rows are
+        committed one by one, so a single bad row does not drop the rest of the batch
+        """
         try:
             with self.lock:
-                current_time = int(time.time() * 1000) # in milliseconds
-                self.cursor.execute(
-                    "INSERT INTO Dialog (thread_id, role, message, time) VALUES (?, ?, ?, ?)",
-                    (thread_id, role, message, current_time)
-                )
-                self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred while inserting into Dialog: {e}")
-            track_event(ExceptionEvent(exception_type=type(e).__name__,
-                                   error_message=str(e)))
-            
-    def insert_thought(self, thread_id: str, message: str):
+                self.insert_rows(rows)
+            return
+        except Exception as e:
+            self.rollback()
+            if len(rows) == 1:
+                print(f"An error occurred while inserting into the memory: {e}")
+                track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                           error_message=str(e)))
+                return
+        for row in rows:
+            self.write_rows([row])
+
+    def insert_rows(self, rows: list[tuple]):
+        # Lock should be held
+        for table, values in rows:
+            self.cursor.execute(INSERT_QUERIES[table], values)
+        self.update_summary(rows)
+        self.conn.commit()
+
+    def delete_rows(self, thread_id: str):
+        """
+        Delete all the rows of a thread and its summary
+        """
         try:
             with self.lock:
-                current_time = int(time.time() * 1000) # in milliseconds
-                self.cursor.execute(
-                    "INSERT INTO Thoughts (thread_id, message, time) VALUES (?, ?, ?)",
-                    (thread_id, message, current_time)
-                )
+                for table in TABLES_SCHEMA:
+                    self.cursor.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+                self.cursor.execute("DELETE FROM ThreadSummary WHERE thread_id = ?", (thread_id,))
                 self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred while inserting into Thoughts: {e}")
+        except Exception as e:
+            self.rollback()
+            print(f"An error occurred while deleting a thread from the memory: {e}")
             track_event(ExceptionEvent(exception_type=type(e).__name__,
-                                   error_message=str(e)))
+                                       error_message=str(e)))
 
-    def insert_tool(self, thread_id: str, tool_name: str, input: Optional[str], output: Optional[str]):
+    def rollback(self):
         try:
             with self.lock:
-                current_time = int(time.time() * 1000) # in milliseconds
-                self.cursor.execute(
-                    "INSERT INTO Tools (thread_id, tool_name, input, output, time) VALUES (?, ?, ?, ?, ?)",
-                    (thread_id, tool_name, input, output, current_time)
-                )
-                self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"An error occurred while inserting into Tools: {e}")
+                self.conn.rollback()
+        except Exception as e:
             track_event(ExceptionEvent(exception_type=type(e).__name__,
-                                   error_message=str(e)))
-            
+                                       error_message=f'Memory rollback failed: {e}'))
 
+    def flush(self, timeout: Optional[float] = 30):
+        """
+        Wait until all the queued rows are committed
+        :param timeout: The maximal time to wait (in seconds), None means no limit. The wait also ends if the writer
+        thread is not running
+        """
+        if self.closed or not self.writer.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not done.wait(self.flush_interval):
+            if not self.writer.is_alive() or (deadline is not None and time.monotonic() >= deadline):
+                return
+
+    def close(self, timeout: Optional[float] = 10):
+        """
+        Commit all the queued rows and close the connection
+        :param timeout: The maximal time to wait for the queued rows (in seconds)
+        """
+        if self.writer is None:
+            # A read only saver
+            with self.lock:
+                self.conn.close()
+            return
+        if self.closed:
+            return
+        self.closed = True
+        done = threading.Event()
+        self.queue.put(done)
+        self.queue.put(None)
+        done.wait(timeout)
+        self.writer.join(timeout)
+        with self.lock:
+            self.cursor.close()
+            self.conn.close()
+        atexit.unregister(self.close)
+
+    def exit(self):
+        # Commit any changes and close the connection when exiting the context
+        self.close()
+
+    def delete_thread(self, thread_id: str):
+        """
+        Delete the rows of a thread (e.g. the partial rows of a failed dialog attempt), including its rows that are
+        still queued. Rows of the thread that are inserted later are dropped
+        :param thread_id: The thread id
+        """
+        self.deleted_threads.add(thread_id)
+        self.queue.put(ThreadDeletion(thread_id))
+
+    def insert_dialog(self, thread_id: str, role: str, message: str):
+        if thread_id in self.deleted_threads:
+            return
+        current_time = int(time.time() * 1000) # in milliseconds
+        self.queue.put(('Dialog', (thread_id, role, message, current_time)))
+
+    def insert_thought(self, thread_id: str, message: str):
+        if thread_id in self.deleted_threads:
+            return
+        current_time = int(time.time() * 1000) # in milliseconds
+        self.queue.put(('Thoughts', (thread_id, message, current_time)))
+
+    def insert_tool(self, thread_id: str, tool_name: str, input: Optional[str], output: Optional[str]):
+        if thread_id in self.deleted_threads:
+            return
+        current_time = int(time.time() * 1000) # in milliseconds
+        self.queue.put(('Tools', (thread_id, tool_name, input, output, current_time)))
 
     def read_dialog(self, thread_id: str):
         try:
-            self.cursor.execute("SELECT thread_id, role, message FROM Dialog WHERE thread_id = ?", (thread_id,))
-            rows = self.cursor.fetchall()
+            self.flush()
+            with self.lock:
+                self.cursor.execute("SELECT thread_id, role, message FROM Dialog WHERE thread_id = ? ORDER BY seq",
+                                    (thread_id,))
+                rows = self.cursor.fetchall()
             return rows if rows else None  # Return None if no rows are found
         except sqlite3.Error as e:
             print(f"An error occurred while reading from Dialog: {e}")
@@ -132,8 +366,11 @@ class SqliteSaver:
 
     def read_thought(self, thread_id: str):
         try:
-            self.cursor.execute("SELECT thread_id, message FROM Thoughts WHERE thread_id = ?", (thread_id,))
-            rows = self.cursor.fetchall()
+            self.flush()
+            with self.lock:
+                self.cursor.execute("SELECT thread_id, message FROM Thoughts WHERE thread_id = ? ORDER BY seq",
+                                    (thread_id,))
+                rows = self.cursor.fetchall()
             return rows if rows else None  # Return None if no rows are found
         except sqlite3.Error as e:
             print(f"An error occurred while reading from Thoughts: {e}")
@@ -143,11 +380,94 @@ class SqliteSaver:
 
     def read_tool(self, thread_id: str):
         try:
-            self.cursor.execute("SELECT * FROM Tools WHERE thread_id = ?", (thread_id,))
-            rows = self.cursor.fetchall()
+            self.flush()
+            with self.lock:
+                self.cursor.execute("SELECT thread_id, tool_name, input, output, time FROM Tools "
+                                    "WHERE thread_id = ? ORDER BY seq", (thread_id,))
+                rows = self.cursor.fetchall()
             return rows if rows else None  # Return None if no rows are found
         except sqlite3.Error as e:
             print(f"An error occurred while reading from Tools: {e}")
             track_event(ExceptionEvent(exception_type=type(e).__name__,
                                    error_message=str(e)))
             return None
+
+    def read_page(self, table: str, thread_id: str, cursor: int = 0, limit: int = 100) -> tuple[list, Optional[int]]:
+        """
+        Read a page of the thread rows, ordered by insertion
+        :param table: The table name (Dialog, Thoughts or Tools)
+        :param thread_id: The thread id
+        :param cursor: The seq of the last row of the previous page (0 for the first page)
+        :param limit: The page size
+        :return: The rows (starting with the seq column) and the cursor of the next page (None if it is the last page)
+        """
+        columns_str = ', '.join(['seq'] + TABLES_COLUMNS[table])
+        try:
+            self.flush()
+            with self.lock:
+                rows = self.cursor.execute(f"SELECT {columns_str} FROM {table} WHERE thread_id = ? AND seq > ? "
+                                           f"ORDER BY seq LIMIT ?", (thread_id, cursor, limit)).fetchall()
+            next_cursor = rows[-1][0] if len(rows) == limit else None
+            return rows, next_cursor
+        except sqlite3.Error as e:
+            print(f"An error occurred while reading from {table}: {e}")
+            track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                   error_message=str(e)))
+            return [], None
+
+    def read_threads(self, thread_ids: list[str], tables: tuple = ('Dialog', 'Thoughts', 'Tools')) -> dict:
+        """
+        Load all the rows of many threads at once
+        :param thread_ids: The threads ids
+        :param tables: The tables to read
+        :return: A dictionary {thread_id: {table: rows}}, rows are ordered by insertion and start with the seq column
+        """
+        threads = {thread_id: {table: [] for table in tables} for thread_id in thread_ids}
+        try:
+            self.flush()
+            for table in tables:
+                columns_str = ', '.join(['seq'] + TABLES_COLUMNS[table])
+                for i in range(0, len(thread_ids), MAX_QUERY_THREADS):
+                    chunk = thread_ids[i:i + MAX_QUERY_THREADS]
+                    placeholders = ', '.join(['?'] * len(chunk))
+                    with self.lock:
+                        rows = self.cursor.execute(f"SELECT {columns_str} FROM {table} WHERE thread_id IN "
+                                                   f"({placeholders}) ORDER BY thread_id, seq", chunk).fetchall()
+                    for row in rows:
+                        threads[row[1]][table].append(row)
+        except sqlite3.Error as e:
+            print(f"An error occurred while reading threads: {e}")
+            track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                   error_message=str(e)))
+        return threads
+
+    def read_summary(self, thread_ids: list[str] = None, cursor: str = '', limit: int = 1000) -> tuple[
+        list[dict], Optional[str]]:
+        """
+        Read the threads summary (number of turns, tool calls, thoughts and the last message time)
+        :param thread_ids: The threads to read. If None, read a page of all the threads
+        :param cursor: The last thread id of the previous page ('' for the first page), ignored if thread_ids is given
+        :param limit: The page size, ignored if thread_ids is given
+        :return: The summaries and the cursor of the next page (None if it is the last page)
+        """
+        columns = ['thread_id', 'n_turns', 'n_tool_calls', 'n_thoughts', 'last_time']
+        query = f"SELECT {', '.join(columns)} FROM ThreadSummary"
+        try:
+            self.flush()
+            rows = []
+            with self.lock:
+                if thread_ids is None:
+                    rows = self.cursor.execute(f"{query} WHERE thread_id > ? ORDER BY thread_id LIMIT ?",
+                                               (cursor, limit)).fetchall()
+                else:
+                    for i in range(0, len(thread_ids), MAX_QUERY_THREADS):
+                        chunk = thread_ids[i:i + MAX_QUERY_THREADS]
+                        rows += self.cursor.execute(f"{query} WHERE thread_id IN ({', '.join(['?'] * len(chunk))})",
+                                                    chunk).fetchall()
+            next_cursor = rows[-1][0] if thread_ids is None and len(rows) == limit else None
+            return [dict(zip(columns, row)) for row in rows], next_cursor
+        except sqlite3.Error as e:
+            print(f"An error occurred while reading from ThreadSummary: {e}")
+            track_event(ExceptionEvent(exception_type=type(e).__name__,
+                                   error_message=str(e)))
+            return [], None
@@ -1,12 +1,12 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 import sys
 from pathlib import Path
 import os
 project_root = Path(__file__).resolve().parent.parent.parent.parent
 sys.path.append(str(project_root))
 from simulator.utils.file_reading import get_last_db
+from simulator.utils.sqlite_handler import SqliteSaver
 def add_dataframe(self, df):
     """Add a DataFrame to the log display as a table."""
     html_table = df.to_html(classes='dataframe', index=False, escape=False)
@@ -45,6 +45,12 @@ class Logger:
         return mk
 
 
+# The number of rows of each table of the selected thread that are loaded per page
+PAGE_SIZE = 100
+# The number of events in each page of the events list
+EVENTS_PAGE_SIZE = 1000
+
+
 def extract_threads(memory_path):
     # Extract unique thread ids from the database
     if memory_path is None:
@@ -53,7 +59,7 @@ def extract_threads(memory_path):
     results_path = os.path.join(dir_name, 'results.csv')
     if not os.path.isfile(results_path):
         raise FileNotFoundError(f"Results file not found at {results_path}")
-    df = pd.read_csv(results_path)
+    df = pd.read_csv(results_path, usecols=['id', 'thread_id'])
     df = df.sort_values(by='id', ascending=True, inplace=False)
     event_list = df['id'].tolist()
     event_list = [str(event) for event in event_list]
@@ -66,11 +72,32 @@ def update_thread_list():
     event_id, thread_list = extract_threads(st.session_state["memory_path"])
     st.session_state["threads"] = thread_list
     st.session_state["event_id"] = event_id
+    st.session_state["events_page"] = 1
+
+
+@st.cache_resource
+def get_memory(memory_path):
+    # A read only memory, shared by all the sessions (the rows are read through the thread_id indexes)
+    return SqliteSaver(memory_path, writer=False)
+
+
+def load_thread_page():
+    # Load the next page of each table of the selected thread (a None cursor means the table was fully loaded)
+    memory = get_memory(st.session_state["memory_path"])
+    thread_id = st.session_state["thread_id"]
+    for table, cursor in st.session_state["cursors"].items():
+        if cursor is None:
+            continue
+        rows, st.session_state["cursors"][table] = memory.read_page(table, thread_id, cursor, PAGE_SIZE)
+        st.session_state["thread"][table] += rows
+
+
+def has_more_rows() -> bool:
+    return any(cursor is not None for cursor in st.session_state.get("cursors", {}).values())
 
 
 def on_select_thread():
-    conn = sqlite3.connect(st.session_state["memory_path"])
-    cursor = conn.cursor()
+    memory = get_memory(st.session_state["memory_path"])
     event_id = st.session_state["selected_event"]
     thread_id = st.session_state["threads"][st.session_state["event_id"].index(event_id)]
 
@@ -80,44 +107,57 @@ def on_select_thread():
 
     st.session_state["chatbot_log"] = "Updated Content for Selected Thread"
 
-    try:
-        with col2:
-            cursor.execute("SELECT * FROM Dialog WHERE thread_id = ? ORDER BY time ASC", (thread_id,))
-            rows = cursor.fetchall()
-            for i,row in enumerate(rows):
-                if row[1] == 'AI':
-                    st.chat_message('AI').write(row[2])
-                else:
-                    # Skip the last message if it's a stop signal and not the end message
-                    if '###STOP' in row[2] and i < len(rows)-1:
-                        continue
-                    st.chat_message('User').write(row[2])
-        with col1:
-            cursor.execute("SELECT * FROM Tools WHERE thread_id = ? ORDER BY time ASC", (thread_id,))
-            rows = cursor.fetchall()
-            for row in rows:
-                logger_chat.log_message(f"- Invoke function: {row[1]}", 'debug')
-                logger_chat.log_message(f"+ Args: {row[2]}", 'info')
-                if 'Error:' in row[3]:
-                    logger_chat.log_message(f'Response:<br>{row[3]}<br>----------<br>', 'error')
-                else:
-                    logger_chat.log_message(f'Response:<br>{row[3]}<br>----------<br>', 'warning')
-            mk = logger_chat.get_markdown()
-            st.markdown(mk, unsafe_allow_html=True)
-
-        with col3:
-            cursor.execute("SELECT * FROM Thoughts WHERE thread_id = ? ORDER BY time ASC", (thread_id,))
-            rows = cursor.fetchall()
-            for row in rows:
-                if row[1] == '':
+    # The thread rows are loaded a page at a time
+    st.session_state["thread_id"] = thread_id
+    st.session_state["thread"] = {'Dialog': [], 'Tools': [], 'Thoughts': []}
+    st.session_state["cursors"] = {'Dialog': 0, 'Tools': 0, 'Thoughts': 0}
+    summary, _ = memory.read_summary([thread_id])
+    st.session_state["thread_summary"] = summary[0] if summary else None
+    load_thread_page()
+    show_thread()
+
+
+def on_load_more():
+    load_thread_page()
+    show_thread()
+
+
+def show_thread():
+    thread = st.session_state["thread"]
+    summary = st.session_state["thread_summary"]
+    if summary is not None:
+        st.sidebar.caption(f"{summary['n_turns']} messages, {summary['n_tool_calls']} tool calls, "
+                           f"{summary['n_thoughts']} thoughts")
+
+    # The rows start with the seq column
+    with col2:
+        rows = thread['Dialog']
+        for i,row in enumerate(rows):
+            if row[2] == 'AI':
+                st.chat_message('AI').write(row[3])
+            else:
+                # Skip the last message if it's a stop signal and not the end message
+                if '###STOP' in row[3] and i < len(rows)-1:
                     continue
-                logger_user.log_message(row[1] + '<br>', 'info')
-            mk = logger_user.get_markdown()
-            st.markdown(mk, unsafe_allow_html=True)
-    except sqlite3.Error as e:
-        st.error(f"An error occurred while executing the query: {e}")
-    finally:
-        conn.close()
+                st.chat_message('User').write(row[3])
+    with col1:
+        for row in thread['Tools']:
+            logger_chat.log_message(f"- Invoke function: {row[2]}", 'debug')
+            logger_chat.log_message(f"+ Args: {row[3]}", 'info')
+            if 'Error:' in row[4]:
+                logger_chat.log_message(f'Response:<br>{row[4]}<br>----------<br>', 'error')
+            else:
+                logger_chat.log_message(f'Response:<br>{row[4]}<br>----------<br>', 'warning')
+        mk = logger_chat.get_markdown()
+        st.markdown(mk, unsafe_allow_html=True)
+
+    with col3:
+        for row in thread['Thoughts']:
+            if row[2] == '':
+                continue
+            logger_user.log_message(row[2] + '<br>', 'info')
+        mk = logger_user.get_markdown()
+        st.markdown(mk, unsafe_allow_html=True)
 
 st.set_page_config(page_title="Session vizualization", page_icon="./docs/plurai_icon.png", layout="wide")
 
@@ -170,10 +210,19 @@ def main():
     st.sidebar.text_input('Memory path', key='memory_path', on_change=update_thread_list,
                   value=st.session_state.last_db_path)
 
-    st.sidebar.selectbox("Select an event to visualized:", st.session_state["event_id"],
+    # The events list is shown a page at a time
+    n_pages = max(1, -(-len(st.session_state["event_id"]) // EVENTS_PAGE_SIZE))
+    page = 1
+    if n_pages > 1:
+        page = st.sidebar.number_input(f'Events page (of {n_pages})', min_value=1, max_value=n_pages,
+                                       key='events_page')
+    st.sidebar.selectbox("Select an event to visualized:",
+                         st.session_state["event_id"][(page - 1) * EVENTS_PAGE_SIZE:page * EVENTS_PAGE_SIZE],
                                   key="selected_event",
                                   on_change=on_select_thread
                                   )
+    if has_more_rows():
+        st.sidebar.button('Load more messages', on_click=on_load_more)
     # Store chat history in session state
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
@@ -0,0 +1,4 @@
+import os
+
+# The tests never send usage events
+os.environ.setdefault('PLURAI_DO_NOT_TRACK', 'true')
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from simulator.utils import concurrency
+from simulator.utils.concurrency import AdaptiveConcurrencyLimiter, ModelRateLimiter
+
+
+class FakeTime:
+    """
+    A fake clock: sleeping advances the time
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeTime:
+    fake_time = FakeTime()
+    monkeypatch.setattr(concurrency, 'time', fake_time)
+    return fake_time
+
+
+def test_additive_increase_up_to_the_max_limit():
+    limiter = AdaptiveConcurrencyLimiter(2, max_limit=4)
+    limiter.on_success(None, limiter.generation)
+    assert limiter.limit == 2.5  # increase_step / limit per success
+    for _ in range(20):
+        limiter.on_success(None, limiter.generation)
+    assert limiter.limit == 4
+
+
+def test_multiplicative_decrease_once_per_generation():
+    limiter = AdaptiveConcurrencyLimiter(8, min_limit=3)
+    generation = limiter.generation
+    limiter.on_throttle(generation)
+    limiter.on_throttle(generation)  # Started before the first decrease
+    assert limiter.limit == 4 and limiter.n_throttled == 2
+    limiter.on_throttle(limiter.generation)
+    assert limiter.limit == 3  # min_limit
+
+
+def test_latency_spike_decreases_only_reported_latencies():
+    limiter = AdaptiveConcurrencyLimiter(8, warmup_samples=2)
+    for _ in range(3):
+        limiter.on_success(1, limiter.generation)
+    limiter.on_success(10, limiter.generation)
+    assert limiter.limit == 4
+    limiter = AdaptiveConcurrencyLimiter(8, warmup_samples=2)
+    for _ in range(4):
+        limiter.on_success(None, limiter.generation)  # Long dialogs are not a load signal
+    assert limiter.limit == 8
+
+
+def test_acquire_waits_for_a_free_slot():
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await limiter.release()
+        await asyncio.wait_for(waiter, 1)
+        assert limiter.in_flight == 1
+
+    asyncio.run(run())
+
+
+def test_rpm_waits_for_the_window(clock):
+    limiter = ModelRateLimiter(rpm=2, check_every_n_seconds=1)
+    start = clock.now
+    assert limiter.acquire() and limiter.acquire()
+    assert not limiter.acquire(blocking=False)
+    assert limiter.acquire()
+    assert clock.now - start > 60
+
+
+def test_tpm_waits_for_the_window(clock):
+    limiter = ModelRateLimiter(tpm=150, check_every_n_seconds=1)
+    start = clock.now
+    assert limiter.acquire()
+    limiter.record_tokens(100)
+    # The next request is estimated by the average request tokens
+    assert not limiter.acquire(blocking=False)
+    clock.sleep(30)
+    assert limiter.acquire()
+    assert clock.now - start > 60 and limiter.tokens_in_window == 0
@@ -0,0 +1,82 @@
+import threading
+import numpy as np
+from simulator.dataset.dataset_handler import Dataset
+from simulator.dataset.definitions import Event
+from simulator.dataset.descriptor_generator import Description
+from simulator.utils.parallelism import PipelineStage
+
+
+class CostCallback:
+    """
+    A stub usage callback: each attempt costs 1
+    """
+
+    def __init__(self):
+        self.total_cost = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def get_dataset(function, cost_limit: float = 100, num_workers: int = 1) -> Dataset:
+    dataset = Dataset.__new__(Dataset)
+    dataset.config = {'min_difficult_level': 5, 'max_difficult_level': 7, 'mini_batch_size': 1000,
+                      'cost_limit': cost_limit}
+    dataset.records = []
+    dataset.store = None
+    dataset.get_pipeline_stages = lambda: [PipelineStage(name='event', function=function, num_workers=num_workers,
+                                                         callbacks=[CostCallback])]
+    return dataset
+
+
+def get_event(level) -> Event:
+    return Event(description=Description(event_description='event', expected_behaviour='behaviour', policies=[],
+                                         challenge_level=level), database={}, scenario='scenario')
+
+
+def test_streaming_balances_the_samples_in_flight(tmp_path):
+    np.random.seed(0)
+    n_calls = 0
+
+    async def function(level):
+        nonlocal n_calls
+        n_calls += 1
+        if n_calls <= 3:
+            raise NotImplementedError('dropped sample')  # Not retried
+        return get_event(float(level))  # A float path sum is counted by its int level
+
+    dataset = get_dataset(function, num_workers=2)
+    n_generated, cost = dataset.generate_streaming(15, str(tmp_path / 'dataset'), 0, 0)
+    assert n_generated == 12 and cost == 15
+    # The samples in flight are counted, and the dropped samples are sampled again by the next inputs
+    assert list(dataset.get_difficulty_counts()) == [4, 4, 4]
+
+
+def test_streaming_stops_at_the_cost_limit(tmp_path):
+    async def function(level):
+        return get_event(level)
+
+    dataset = get_dataset(function, cost_limit=5)
+    n_generated, cost = dataset.generate_streaming(20, str(tmp_path / 'dataset'), 0, 1)
+    assert 5 <= n_generated < 20
+    assert cost == n_generated == len(dataset.records)
+
+
+def test_streaming_stops_when_the_stop_event_is_set(tmp_path):
+    async def function(level):
+        return get_event(level)
+
+    stop_event = threading.Event()
+
+    def on_event(event):
+        if len(dataset.records) == 3:
+            stop_event.set()  # e.g. the simulation reached its cost limit
+
+    dataset = get_dataset(function)
+    n_generated, cost = dataset.generate_streaming(20, str(tmp_path / 'dataset'), 0, 0, on_event=on_event,
+                                                   stop_event=stop_event)
+    # Only the samples in flight are completed after the stop
+    assert 3 <= n_generated < 10
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from simulator.dataset.descriptor_generator import DescriptionPacker, DescriptionsList, ScenarioDescription
+from simulator.utils.parallelism import PipelineStage, pipeline_ainvoke
+
+
+class PackCallback:
+    """
+    A stub usage callback: the pack call costs 0.9
+    """
+
+    def __enter__(self):
+        self.total_cost = 0.9
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class StubLLM:
+    def __init__(self, error: Exception = None, delay: float = 0):
+        self.error = error
+        self.delay = delay
+        self.n_calls = 0
+
+    async def ainvoke(self, inputs: dict) -> DescriptionsList:
+        self.n_calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return DescriptionsList(descriptions=[ScenarioDescription(scenario_id=i, event_description=f'event {i}',
+                                                                  expected_behaviour='behaviour')
+                                              for i in range(3)])
+
+
+def run_pack(llm: StubLLM, timeout: float = 1) -> list[dict]:
+    packer = DescriptionPacker(llm, 'task', batch_size=3, max_wait=0.05, timeout=timeout, callback=PackCallback)
+
+    async def describe(i):
+        return await packer.describe({'policies': f'policy {i}'})
+
+    stage = PipelineStage(name='description', function=describe, num_workers=3, timeout=5)
+    return asyncio.run(pipeline_ainvoke([stage], range(3), n_inputs=3))
+
+
+def test_pack_usage_is_split_between_its_requests():
+    llm = StubLLM()
+    results = run_pack(llm)
+    assert llm.n_calls == 1
+    assert sorted(r['result'].event_description for r in results) == ['event 0', 'event 1', 'event 2']
+    assert [r['usage'] for r in results] == pytest.approx([0.3] * 3)
+
+
+@pytest.mark.parametrize('llm, timeout', [(StubLLM(error=ValueError('invalid response')), 1),
+                                          (StubLLM(delay=1), 0.05)])
+def test_failed_pack_usage_is_charged(llm, timeout):
+    results = run_pack(llm, timeout)
+    # The requests are described one by one, and each one is still charged its share of the pack call
+    assert [r['result'] for r in results] == [None] * 3
+    assert [r['usage'] for r in results] == pytest.approx([0.3] * 3)
@@ -0,0 +1,59 @@
+import os
+import pickle
+import networkx as nx
+import numpy as np
+import pytest
+from simulator.dataset.descriptor_generator import (DescriptionGenerator, save_descriptions_generator,
+                                                    load_descriptions_generator, get_policy_graph_path)
+from simulator.dataset.policy_graph import PolicyGraph
+
+
+def get_generator() -> DescriptionGenerator:
+    generator = DescriptionGenerator.__new__(DescriptionGenerator)
+    generator.config = {'llm_description': {'type': 'mock', 'name': 'mock'},
+                        'description_config': {'prompt': {'from_str': {'template': 'Describe the scenario'}}},
+                        'refinement_config': {'do_refinement': False}}
+    generator.llm_description = None
+    nodes = [{'flow': 'flow', 'policy': f'policy {i}', 'score': i % 3 + 1} for i in range(6)]
+    G = nx.Graph()
+    G.add_weighted_edges_from([(0, 1, 5), (1, 2, 3), (2, 3, 8), (3, 4, 1), (4, 5, 9), (0, 5, 2)])
+    generator.graph_info = {'G': G, 'nodes': nodes, 'edge_scores': {}}
+    generator.policy_graph = PolicyGraph.from_networkx(G, nodes)
+    return generator
+
+
+def get_adjacency(graph: PolicyGraph) -> list[list[tuple]]:
+    return [sorted(zip(graph.indices[graph.indptr[i]:graph.indptr[i + 1]].tolist(),
+                       graph.weights[graph.indptr[i]:graph.indptr[i + 1]].tolist())) for i in range(graph.n_nodes)]
+
+
+def test_pickle_keeps_only_the_edges_list(tmp_path):
+    path = str(tmp_path / 'descriptions_generator.pickle')
+    generator = get_generator()
+    save_descriptions_generator(generator, path)
+    with open(path, 'rb') as f:
+        state = pickle.load(f).__dict__
+    assert 'G' not in state['graph_info']
+    assert state['graph_info']['edges'].shape == (6, 2)
+    assert isinstance(load_descriptions_generator(path).policy_graph.indices, np.memmap)
+
+
+def test_missing_npz_is_rebuilt_from_the_edges(tmp_path):
+    path = str(tmp_path / 'descriptions_generator.pickle')
+    generator = get_generator()
+    save_descriptions_generator(generator, path)
+    os.remove(get_policy_graph_path(path))
+    loaded = load_descriptions_generator(path)
+    assert get_adjacency(loaded.policy_graph) == get_adjacency(generator.policy_graph)
+    np.testing.assert_array_equal(loaded.policy_graph.scores, generator.policy_graph.scores)
+    assert nx.utils.edges_equal(loaded.get_graph().edges(data='weight'), generator.graph_info['G'].edges(data='weight'))
+
+
+def test_missing_graph_raises_a_clear_error(tmp_path):
+    path = str(tmp_path / 'descriptions_generator.pickle')
+    generator = get_generator()
+    del generator.graph_info['G']
+    save_descriptions_generator(generator, path)
+    os.remove(get_policy_graph_path(path))
+    with pytest.raises(ValueError, match='policies graph'):
+        load_descriptions_generator(path)
@@ -0,0 +1,91 @@
+import os
+import pickle
+import pandas as pd
+from simulator.dataset.definitions import Event
+from simulator.dataset.descriptor_generator import Description
+from simulator.dataset.event_store import EventStore, FRAME_HEADER, FRAME_MAGIC, migrate_pickle_dataset
+
+
+def get_events(n: int) -> list[Event]:
+    return [Event(description=Description(event_description=f'event {i}', expected_behaviour='behaviour',
+                                          policies=['policy'] * (i + 1), challenge_level=i),
+                  database={'users': pd.DataFrame({'user_id': [f'user_{i}', 'user_shared'], 'age': [i, 40]})},
+                  scenario=f'scenario {i}')
+            for i in range(n)]
+
+
+def test_events_are_read_back(tmp_path):
+    path = str(tmp_path / 'dataset.events')
+    store = EventStore(path)
+    store.append(get_events(5))
+    store.commit(iteration_num=2, cost=1.5)
+    store.close()
+    store = EventStore(path)
+    assert len(store) == 5 and store.iteration_num == 2 and store.cost == 1.5
+    assert [meta['challenge_level'] for meta in store.metadata] == list(range(5))
+    event = store.records[3]
+    assert event.id == 4 and event.scenario == 'scenario 3'
+    assert list(event.database['users']['user_id']) == ['user_3', 'user_shared']
+    assert [e.description.event_description for e in store.records[1:3]] == ['event 1', 'event 2']
+    store.close()
+
+
+def test_torn_last_frame_is_truncated(tmp_path):
+    path = str(tmp_path / 'dataset.events')
+    store = EventStore(path)
+    store.append(get_events(3))
+    store.close()
+    size = os.path.getsize(path)
+    offset, length = EventStore(path).offsets[-1]
+    with open(path, 'r+b') as f:
+        f.truncate(offset + length // 2)  # An interrupted write of the last frame
+    store = EventStore(path)
+    assert len(store) == 2
+    assert os.path.getsize(path) < size
+    # The store keeps appending after the truncated frame
+    store.append(get_events(1))
+    store.close()
+    store = EventStore(path)
+    assert len(store) == 3 and store.records[2].id == 3
+    store.close()
+
+
+def test_corrupted_frame_is_dropped(tmp_path):
+    path = str(tmp_path / 'dataset.events')
+    store = EventStore(path)
+    store.append(get_events(2))
+    store.close()
+    offset, length = EventStore(path).offsets[-1]
+    with open(path, 'r+b') as f:
+        f.seek(offset + length - 1)
+        last_byte = f.read(1)
+        f.seek(offset + length - 1)
+        f.write(bytes([last_byte[0] ^ 0xFF]))  # The crc of the last frame does not match
+    store = EventStore(path)
+    assert len(store) == 1
+    store.close()
+
+
+def test_partial_header_is_truncated(tmp_path):
+    path = str(tmp_path / 'dataset.events')
+    store = EventStore(path)
+    store.append(get_events(2))
+    store.close()
+    size = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(FRAME_HEADER.pack(FRAME_MAGIC, 10, 100, 0)[:10])
+    store = EventStore(path)
+    assert len(store) == 2
+    assert os.path.getsize(path) == size
+    store.close()
+
+
+def test_migrate_pickle_dataset(tmp_path):
+    pickle_path = str(tmp_path / 'dataset.pickle')
+    with open(pickle_path, 'wb') as f:
+        pickle.dump((get_events(4), 3, 2.5), f)
+    path = migrate_pickle_dataset(pickle_path)
+    store = EventStore(path)
+    assert len(store) == 4 and store.iteration_num == 3 and store.cost == 2.5
+    assert store.records[0].description.event_description == 'event 0'
+    store.close()
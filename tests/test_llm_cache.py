@@ -0,0 +1,57 @@
+import pytest
+from langchain_core.outputs import Generation
+from simulator.utils import llm_cache
+from simulator.utils.llm_cache import LLMCache
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeTime:
+    fake_time = FakeTime()
+    monkeypatch.setattr(llm_cache, 'time', fake_time)
+    return fake_time
+
+
+def test_lookup_and_stats(tmp_path):
+    cache = LLMCache(str(tmp_path / 'llm_cache.db'))
+    assert cache.lookup('prompt', 'model') is None
+    cache.update('prompt', 'model', [Generation(text='response')])
+    assert [g.text for g in cache.lookup('prompt', 'model')] == ['response']
+    assert cache.lookup('prompt', 'other model') is None  # The model configuration is a part of the key
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 1)
+    assert stats['hit_rate'] == pytest.approx(1 / 3)
+    cache.close()
+
+
+def test_entries_expire_by_ttl(tmp_path, clock):
+    cache = LLMCache(str(tmp_path / 'llm_cache.db'), ttl=60)
+    cache.update('old', 'model', [Generation(text='old')])
+    clock.now += 30
+    cache.update('new', 'model', [Generation(text='new')])
+    clock.now += 40
+    assert cache.lookup('old', 'model') is None
+    assert cache.lookup('new', 'model') is not None
+    assert cache.evictions == 1
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = LLMCache(str(tmp_path / 'llm_cache.db'), max_entries=2)
+    for prompt in ('a', 'b'):
+        cache.update(prompt, 'model', [Generation(text=prompt)])
+        clock.now += 1
+    cache.lookup('a', 'model')  # 'b' is now the least recently used
+    clock.now += 1
+    cache.update('c', 'model', [Generation(text='c')])
+    assert cache.lookup('b', 'model') is None
+    assert cache.lookup('a', 'model') is not None and cache.lookup('c', 'model') is not None
+    assert cache.stats()['entries'] == 2 and cache.evictions == 1
+    cache.close()
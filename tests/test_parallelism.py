@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from simulator.utils.parallelism import PipelineStage, pipeline_ainvoke, batch_ainvoke
+from simulator.utils.retry import RetryPolicy
+
+
+class CostCallback:
+    """
+    A stub usage callback: each attempt costs 0.5
+    """
+
+    def __init__(self):
+        self.total_cost = 0.5
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+@pytest.fixture
+def fixed_delay(monkeypatch):
+    def set_delay(delay: float):
+        monkeypatch.setattr(RetryPolicy, 'get_delay', lambda self, attempt: delay)
+    return set_delay
+
+
+def test_pipeline_passes_items_through_the_stages():
+    async def double(x):
+        return 2 * x
+
+    async def increment(x):
+        return x + 1
+
+    stages = [PipelineStage(name='double', function=double, num_workers=2),
+              PipelineStage(name='increment', function=increment, num_workers=3)]
+    results = asyncio.run(pipeline_ainvoke(stages, range(20), n_inputs=20))
+    assert sorted((r['index'], r['result']) for r in results) == [(i, 2 * i + 1) for i in range(20)]
+    assert asyncio.run(pipeline_ainvoke(stages, [], n_inputs=0)) == []
+
+
+def test_retry_backoff_does_not_hold_a_worker(fixed_delay):
+    fixed_delay(0.3)
+    attempts = {}
+
+    async def function(x):
+        attempts[x] = attempts.get(x, 0) + 1
+        if x == 0 and attempts[x] == 1:
+            raise ValueError('first attempt fails')
+        await asyncio.sleep(0.01)
+        return x
+
+    results = asyncio.run(pipeline_ainvoke([PipelineStage(name='stage', function=function)], range(5), n_inputs=5))
+    # The other items are processed by the single worker while the failed item waits for its retry
+    assert [r['index'] for r in results] == [1, 2, 3, 4, 0]
+    assert all(r['error'] is None for r in results)
+
+
+def test_retry_budget_of_a_stream_of_unknown_size(fixed_delay):
+    fixed_delay(0)
+    attempts = {}
+
+    async def function(x):
+        attempts[x] = attempts.get(x, 0) + 1
+        if attempts[x] == 1:
+            raise ValueError('first attempt fails')
+        return x
+
+    async def inputs():
+        for i in range(10):
+            yield i
+
+    results = asyncio.run(pipeline_ainvoke([PipelineStage(name='stage', function=function)], inputs()))
+    # The budget grows with the inputs, up to 0.3 * 10 retries
+    assert sum(r['error'] is None for r in results) == 3
+
+
+def test_timed_out_attempts_are_charged(fixed_delay):
+    fixed_delay(0)
+
+    async def slow(x):
+        await asyncio.sleep(1)
+
+    stage = PipelineStage(name='stage', function=slow, timeout=0.05, callbacks=[CostCallback])
+    results = asyncio.run(pipeline_ainvoke([stage], [0], n_inputs=1))
+    assert results[0]['error'] == 'Timeout' and results[0]['usage'] == 1  # Two attempts (TimeoutError rule)
+    results = asyncio.run(batch_ainvoke(slow, [0], num_workers=1, callbacks=[CostCallback], timeout=0.05))
+    assert results[0]['error'] == 'Timeout' and results[0]['usage'] == 1 and results[0]['retries'] == 1
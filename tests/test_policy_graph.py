@@ -0,0 +1,93 @@
+import networkx as nx
+import numpy as np
+from simulator.dataset.policy_graph import PolicyGraph, sparsify_edges
+
+
+def get_star_graph(weights: list[float]) -> PolicyGraph:
+    G = nx.Graph()
+    G.add_weighted_edges_from((0, i + 1, weight) for i, weight in enumerate(weights))
+    return PolicyGraph.from_networkx(G, [{'score': 1} for _ in range(len(weights) + 1)])
+
+
+def test_alias_sampling_distribution():
+    weights = [1, 2, 3, 4, 0, 10]
+    graph = get_star_graph(weights)
+    rng = np.random.default_rng(0)
+    neighbors = graph.sample_neighbors(np.zeros(200000, dtype=np.int64), rng)
+    frequencies = np.bincount(neighbors, minlength=len(weights) + 1)[1:] / len(neighbors)
+    np.testing.assert_allclose(frequencies, np.array(weights) / sum(weights), atol=0.005)
+    assert frequencies[4] == 0  # A zero weight edge is never sampled
+
+
+def test_alias_tables_of_single_and_empty_rows():
+    graph = get_star_graph([5])
+    rng = np.random.default_rng(0)
+    assert set(graph.sample_neighbors(np.array([0, 0, 1, 1]), rng)) == {0, 1}
+    G = nx.Graph()
+    G.add_weighted_edges_from([(0, 1, 0)])
+    graph = PolicyGraph.from_networkx(G, [{'score': 1}, {'score': 1}])
+    assert list(graph.sample_neighbors(np.array([0, 1]), rng)) == [-1, -1]
+
+
+def test_sampled_paths_do_not_repeat_nodes():
+    rng = np.random.default_rng(1)
+    G = nx.gnm_random_graph(30, 90, seed=1)
+    for u, v in G.edges:
+        G[u][v]['weight'] = int(rng.integers(1, 10))
+    scores = rng.integers(1, 5, size=30)
+    graph = PolicyGraph.from_networkx(G, [{'score': score} for score in scores])
+    thresholds = [5, 20, 200]
+    for (path, path_sum), threshold in zip(graph.sample_paths(thresholds, rng), thresholds):
+        assert len(set(path)) == len(path)
+        assert path_sum == scores[path].sum()
+        assert type(path_sum) is int  # The challenge level of the description
+        assert path_sum >= threshold or len(path) == 30
+
+
+def test_save_and_memory_map(tmp_path):
+    graph = get_star_graph([1, 2, 3])
+    path = str(tmp_path / 'graph.npz')
+    graph.save(path)
+    loaded = PolicyGraph.load(path)
+    assert isinstance(loaded.indices, np.memmap)
+    for name in ('indptr', 'indices', 'weights', 'scores', 'alias_prob', 'alias_index'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(graph, name))
+
+
+def get_components(n_nodes: int, edges: list[tuple]) -> int:
+    G = nx.Graph()
+    G.add_nodes_from(range(n_nodes))
+    G.add_edges_from(edge[:2] for edge in edges)
+    return nx.number_connected_components(G)
+
+
+def test_sparsify_keeps_the_top_k_edges():
+    # A complete graph: the edge (i, j) weight is i + j
+    edges = [(i, j, {'weight': i + j}) for i in range(6) for j in range(i + 1, 6)]
+    kept = sparsify_edges(6, edges, top_k=1, min_weight=0)
+    # The heaviest edge of each node is (i, 5), and (4, 5) for node 5
+    assert sorted(edge[:2] for edge in kept) == [(0, 5), (1, 5), (2, 5), (3, 5), (4, 5)]
+    kept = sparsify_edges(6, edges, top_k=10, min_weight=8)
+    # Only (3, 5) and (4, 5) are heavy enough, the heaviest edges of the other nodes connect them
+    assert sorted(edge[:2] for edge in kept) == [(0, 5), (1, 5), (2, 5), (3, 5), (4, 5)]
+
+
+def test_sparsify_keeps_the_graph_connected():
+    rng = np.random.default_rng(0)
+    for seed in range(5):
+        G = nx.gnm_random_graph(60, 400, seed=seed)
+        edges = [(u, v, {'weight': int(rng.integers(0, 10))}) for u, v in G.edges]
+        kept = sparsify_edges(60, edges, top_k=2, min_weight=5)
+        assert get_components(60, kept) == get_components(60, edges)
+        assert len(kept) < len(edges)
+
+
+def test_sparsify_connects_components_with_the_heaviest_edges():
+    # Two triangles of heavy edges, connected by a light and a heavier bridge
+    edges = [(0, 1, {'weight': 9}), (1, 2, {'weight': 9}), (0, 2, {'weight': 9}),
+             (3, 4, {'weight': 9}), (4, 5, {'weight': 9}), (3, 5, {'weight': 9}),
+             (2, 3, {'weight': 1}), (0, 5, {'weight': 3})]
+    kept = sparsify_edges(6, edges, top_k=2, min_weight=5)
+    assert (0, 5, {'weight': 3}) in kept
+    assert (2, 3, {'weight': 1}) not in kept
+    assert get_components(6, kept) == 1
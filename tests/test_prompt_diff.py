@@ -0,0 +1,62 @@
+from simulator.dataset.prompt_diff import match_flows, get_changed_flows
+
+PROMPT = """You are a customer service agent of an airline.
+
+To book a flight, ask the user for the origin airport, the destination airport and the travel dates. The reservation \
+is confirmed only after the payment details are verified.
+
+To cancel a reservation, verify the reservation id. Refunds are issued to the original payment method within seven \
+business days.
+
+Checked baggage allowance depends on the cabin class. Economy passengers may check one bag of up to twenty three \
+kilograms, business passengers may check two bags."""
+
+POLICIES = {
+    'Book flight': [{'policy': 'Ask the user for the origin airport, destination airport and travel dates'},
+                    {'policy': 'Confirm the reservation only after the payment details are verified'}],
+    'Cancel reservation': [{'policy': 'Verify the reservation id before cancelling'},
+                           {'policy': 'Refunds are issued to the original payment method within seven business days'}],
+    'Baggage': [{'policy': 'Economy passengers may check one bag of up to twenty three kilograms'},
+                {'policy': 'Business cabin passengers may check two bags'}]}
+FLOWS = list(POLICIES)
+
+
+def get_changed(prompt, flows=FLOWS):
+    matches = match_flows(prompt, flows, PROMPT, POLICIES)
+    return get_changed_flows(prompt, flows, PROMPT, POLICIES, matches), matches
+
+
+def test_unchanged_prompt():
+    assert get_changed(PROMPT)[0] == []
+
+
+def test_paragraph_edit_changes_only_its_flow():
+    prompt = PROMPT.replace('within seven business days', 'within fourteen business days')
+    assert get_changed(prompt)[0] == ['Cancel reservation']
+
+
+def test_removed_paragraph_changes_only_its_flow():
+    paragraphs = PROMPT.split('\n\n')
+    prompt = '\n\n'.join(paragraphs[:3])
+    assert get_changed(prompt, FLOWS[:2])[0] == []
+    assert get_changed(prompt)[0] == ['Baggage']
+
+
+def test_added_paragraph_changes_the_most_similar_flow():
+    prompt = PROMPT + '\n\nPassengers may add a third checked bag for an extra fee.'
+    assert get_changed(prompt)[0] == ['Baggage']
+
+
+def test_renamed_flow_is_reused():
+    flows = ['Flight booking', 'Cancel reservation', 'Baggage']
+    changed, matches = get_changed(PROMPT, flows)
+    assert changed == []
+    assert matches['Flight booking'] == 'Book flight'
+
+
+def test_new_flow_is_extracted():
+    prompt = PROMPT + '\n\nPets may travel in the cabin in a carrier that fits under the seat.'
+    flows = FLOWS + ['Pets']
+    changed, matches = get_changed(prompt, flows)
+    assert changed == ['Pets']
+    assert 'Pets' not in matches
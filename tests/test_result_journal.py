@@ -0,0 +1,69 @@
+import os
+import pickle
+from simulator.dialog.result_journal import ResultJournal, JOURNAL_FILE, LEGACY_DUMP_FILE, MIGRATED_SUFFIX
+
+
+def get_state(i: int) -> dict:
+    return {'thread_id': f'thread_{i}', 'stop_signal': 'END', 'critique_feedback': f'feedback {i}',
+            'user_thoughts': ['first thought', f'thought {i}'], 'user_messages': ['hi', 'bye'],
+            'chatbot_messages': ['hello']}
+
+
+def test_results_are_read_back(tmp_path):
+    journal = ResultJournal(str(tmp_path), fsync_size=2)
+    journal.append({'event_id': 1, 'res': {'thread_id': 'thread_1'}, 'usage': 0.5, 'error': None})
+    journal.append({'event_id': 2, 'res': None, 'usage': 0.25, 'error': 'Timeout'})
+    journal.close()
+    journal = ResultJournal(str(tmp_path))
+    assert journal.completed_events == {1} and journal.n_results == 1 and journal.cost == 0.75
+    assert list(journal.iter_results()) == [{'res': {'thread_id': 'thread_1'}, 'event_id': 1}]
+    journal.close()
+
+
+def test_torn_last_line_is_truncated(tmp_path):
+    journal = ResultJournal(str(tmp_path))
+    for i in range(3):
+        journal.append({'event_id': i, 'res': {'thread_id': f'thread_{i}'}, 'usage': 1, 'error': None})
+    journal.close()
+    path = os.path.join(str(tmp_path), JOURNAL_FILE)
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.truncate(size - 5)  # An interrupted write of the last record
+    journal = ResultJournal(str(tmp_path))
+    assert journal.completed_events == {0, 1} and journal.cost == 2
+    # The journal keeps appending after the truncated record
+    journal.append({'event_id': 2, 'res': {'thread_id': 'thread_2'}, 'usage': 1, 'error': None})
+    journal.close()
+    journal = ResultJournal(str(tmp_path))
+    assert [r['event_id'] for r in journal.iter_results()] == [0, 1, 2]
+    journal.close()
+
+
+def test_migrate_legacy_dump(tmp_path):
+    legacy_path = os.path.join(str(tmp_path), LEGACY_DUMP_FILE)
+    with open(legacy_path, 'wb') as f:
+        pickle.dump(([{'event_id': i, 'res': get_state(i)} for i in range(3)], None, 4.5), f)
+    journal = ResultJournal(str(tmp_path))
+    # The dump is kept, renamed so it is not migrated again
+    assert not os.path.exists(legacy_path) and os.path.isfile(legacy_path + MIGRATED_SUFFIX)
+    assert journal.completed_events == {0, 1, 2} and journal.cost == 4.5
+    results = list(journal.iter_results())
+    assert results[1] == {'event_id': 1, 'res': {'thread_id': 'thread_1', 'stop_signal': 'END',
+                                                 'critique_feedback': 'feedback 1', 'user_thought': 'thought 1',
+                                                 'n_user_messages': 2, 'n_chatbot_messages': 1}}
+    journal.close()
+    # The migrated journal is not migrated again
+    journal = ResultJournal(str(tmp_path))
+    assert journal.n_results == 3 and journal.cost == 4.5
+    journal.close()
+
+
+def test_existing_journal_is_not_migrated(tmp_path):
+    journal = ResultJournal(str(tmp_path))
+    journal.close()  # An empty journal, e.g. of an experiment that was stopped before its first result
+    legacy_path = os.path.join(str(tmp_path), LEGACY_DUMP_FILE)
+    with open(legacy_path, 'wb') as f:
+        pickle.dump(([{'event_id': 0, 'res': get_state(0)}], None, 1.5), f)
+    journal = ResultJournal(str(tmp_path))
+    assert journal.n_results == 0 and os.path.isfile(legacy_path)
+    journal.close()
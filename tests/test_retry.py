@@ -0,0 +1,35 @@
+from simulator.utils.retry import RetryPolicy
+
+
+def test_retry_budget_is_a_fraction_of_the_batch():
+    policy = RetryPolicy(max_attempts=5, retry_budget=0.3, n_samples=10)
+    assert [policy.should_retry('ValueError', 1) for _ in range(4)] == [True, True, True, False]
+    assert policy.n_retries == 3
+    # A small batch still gets a single retry
+    policy = RetryPolicy(retry_budget=0.3, n_samples=1)
+    assert policy.should_retry('ValueError', 1) and not policy.should_retry('ValueError', 1)
+
+
+def test_absolute_retry_budget():
+    policy = RetryPolicy(max_attempts=5, retry_budget=2, n_samples=100)
+    assert [policy.should_retry('ValueError', 1) for _ in range(3)] == [True, True, False]
+
+
+def test_retry_budget_grows_with_the_samples():
+    policy = RetryPolicy(max_attempts=5, retry_budget=0.5, n_samples=0)
+    assert policy.should_retry('ValueError', 1) and not policy.should_retry('ValueError', 1)
+    policy.add_samples(4)
+    assert policy.should_retry('ValueError', 1) and not policy.should_retry('ValueError', 1)
+
+
+def test_max_attempts_per_error_class():
+    policy = RetryPolicy(max_attempts=3, retry_budget=100, rules={'TimeoutError': 2, 'BadRequestError': 1})
+    assert policy.should_retry('ValueError', 2) and not policy.should_retry('ValueError', 3)
+    assert policy.should_retry('TimeoutError', 1) and not policy.should_retry('TimeoutError', 2)
+    assert not policy.should_retry('BadRequestError', 1)
+
+
+def test_backoff_delay_is_bounded():
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    for attempt in range(1, 8):
+        assert 0 <= policy.get_delay(attempt) <= min(5, 2 ** (attempt - 1))
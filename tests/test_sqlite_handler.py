@@ -0,0 +1,98 @@
+import sqlite3
+import pytest
+import time
+from simulator.utils.sqlite_handler import SqliteSaver
+
+
+def test_group_commit_keeps_insertion_order(tmp_path):
+    saver = SqliteSaver(str(tmp_path / 'memory.db'), batch_size=7)
+    for i in range(50):
+        saver.insert_dialog(f'thread_{i % 3}', 'Human' if i % 2 else 'AI', f'message {i}')
+        saver.insert_thought(f'thread_{i % 3}', f'thought {i}')
+    saver.flush()
+    threads = saver.read_threads(['thread_0', 'thread_1', 'thread_2'], tables=('Dialog', 'Thoughts'))
+    for k in range(3):
+        messages = [row[3] for row in threads[f'thread_{k}']['Dialog']]
+        assert messages == [f'message {i}' for i in range(k, 50, 3)]
+        seqs = [row[0] for row in threads[f'thread_{k}']['Thoughts']]
+        assert seqs == sorted(seqs)
+    summary, _ = saver.read_summary(['thread_0'])
+    assert summary[0]['n_turns'] == 17 and summary[0]['n_thoughts'] == 17
+    saver.close()
+
+
+def test_bad_row_does_not_drop_the_batch(tmp_path):
+    saver = SqliteSaver(str(tmp_path / 'memory.db'))
+    saver.insert_dialog('thread', 'AI', 'first')
+    saver.insert_dialog('thread', 'AI', None)  # Violates the NOT NULL constraint
+    saver.insert_dialog('thread', 'AI', 'second')
+    saver.flush()
+    assert [row[2] for row in saver.read_dialog('thread')] == ['first', 'second']
+    summary, _ = saver.read_summary(['thread'])
+    assert summary[0]['n_turns'] == 2
+    saver.close()
+
+
+def test_rows_are_committed_on_close(tmp_path):
+    db_path = str(tmp_path / 'memory.db')
+    saver = SqliteSaver(db_path, flush_interval=10)
+    for i in range(10):
+        saver.insert_tool('thread', 'search', f'input {i}', f'output {i}')
+    saver.close()
+    reader = SqliteSaver(db_path, writer=False)
+    assert len(reader.read_tool('thread')) == 10
+    reader.close()
+
+
+def test_flush_returns_when_the_writer_is_dead(tmp_path):
+    saver = SqliteSaver(str(tmp_path / 'memory.db'))
+    saver.queue.put(None)  # Stops the writer thread
+    saver.writer.join()
+    saver.insert_dialog('thread', 'AI', 'lost')
+    start = time.monotonic()
+    saver.flush(timeout=None)
+    assert time.monotonic() - start < 1
+
+
+def test_read_only_saver(tmp_path, capsys):
+    db_path = str(tmp_path / 'memory.db')
+    saver = SqliteSaver(db_path)
+    saver.insert_dialog('thread', 'AI', 'hello')
+    saver.close()
+    capsys.readouterr()
+    reader = SqliteSaver(db_path, writer=False)
+    assert 'Tables created' not in capsys.readouterr().out
+    assert reader.read_dialog('thread') == [('thread', 'AI', 'hello')]
+    with pytest.raises(sqlite3.OperationalError):
+        reader.conn.execute("DELETE FROM Dialog")
+    reader.close()
+
+
+def test_read_only_saver_migrates_an_older_database(tmp_path):
+    db_path = str(tmp_path / 'memory.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE Dialog (thread_id TEXT NOT NULL, role TEXT NOT NULL, message TEXT NOT NULL, "
+                 "time INTEGER PRIMARY KEY)")
+    conn.executemany("INSERT INTO Dialog VALUES (?, ?, ?, ?)", [('thread', 'Human', 'hi', 2),
+                                                                 ('thread', 'AI', 'hello', 1)])
+    conn.commit()
+    conn.close()
+    reader = SqliteSaver(db_path, writer=False)
+    assert [row[2] for row in reader.read_dialog('thread')] == ['hello', 'hi']
+    assert reader.read_summary(['thread'])[0][0]['n_turns'] == 2
+    reader.close()
+
+
+def test_delete_thread(tmp_path):
+    saver = SqliteSaver(str(tmp_path / 'memory.db'))
+    saver.insert_dialog('failed', 'Human', 'hi')
+    saver.insert_tool('failed', 'search', 'input', 'output')
+    saver.insert_dialog('thread', 'Human', 'hi')
+    saver.delete_thread('failed')  # Also deletes the queued rows
+    saver.insert_thought('failed', 'a late row of the failed thread')
+    saver.flush()
+    threads = saver.read_threads(['failed', 'thread'])
+    assert threads['failed'] == {'Dialog': [], 'Thoughts': [], 'Tools': []}
+    assert len(threads['thread']['Dialog']) == 1
+    assert [s['thread_id'] for s in saver.read_summary()[0]] == ['thread']
+    saver.close()
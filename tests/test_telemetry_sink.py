@@ -0,0 +1,33 @@
+import json
+from simulator.healthcare_analytics import TelemetrySink
+
+
+def get_sink(tmp_path) -> tuple[TelemetrySink, list]:
+    sink = TelemetrySink()
+    sink.spill_path = str(tmp_path / 'pending_events.jsonl')
+    sent = []
+    sink.send = sent.extend  # No network
+    return sink, sent
+
+
+def read_spilled(sink: TelemetrySink) -> list[dict]:
+    with open(sink.spill_path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_queued_events_are_sent_on_close(tmp_path):
+    sink, sent = get_sink(tmp_path)
+    for i in range(3):
+        assert sink.put({'event': i})
+    sink.close(timeout=1)
+    assert sorted(payload['event'] for payload in sent) == [0, 1, 2]
+
+
+def test_events_after_close_are_spilled(tmp_path):
+    sink, sent = get_sink(tmp_path)
+    sink.put({'event': 0})
+    sink.close(timeout=1)
+    assert sink.put({'event': 1})
+    assert sink.queue.empty()
+    assert read_spilled(sink) == [{'event': 1}]
+    assert [payload['event'] for payload in sent] == [0]
@@ -166,7 +166,6 @@ def create_config_from_inputs(prompt_text, llm_config, evaluation_config):
             'llm_chat': llm_config,
             'num_workers': evaluation_config['num_workers'],
             'timeout': 200,
-            'mini_batch_size': 10,
             'cost_limit': evaluation_config['cost_limit'],
             'recursion_limit': 35
         },